@@ -0,0 +1,93 @@
+"""Per-request chain setup overhead: build_chain versus ChainPool.
+
+Runs against the local fake OpenAI server, so only client and chain
+construction plus HTTP handling are measured.
+
+    python -m benchmarks.bench_chain_setup
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import time
+from typing import Callable, List
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from sme_agent.chains import ChainPool, build_chain
+from sme_agent.config import Settings
+from sme_agent.services.history import build_memory
+
+
+class _StaticRetriever(BaseRetriever):
+    documents: List[Document]
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return list(self.documents)
+
+
+HISTORY = [
+    {"role": "user", "content": "Tengo una panaderia en Bogota."},
+    {"role": "assistant", "content": "Perfecto, cuentame tus ventas y costos."},
+]
+
+
+def _timed(func: Callable[[], object], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(label: str, samples: List[float]) -> None:
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<34}{statistics.mean(samples):>10.3f}{statistics.median(samples):>10.3f}{p95:>10.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--setup-repeat", type=int, default=300)
+    parser.add_argument("--invoke-repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    with FakeOpenAIServer() as server:
+        os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+        settings = Settings(openai_api_key="fake-key", openai_base_url=server.base_url)
+        retriever = _StaticRetriever(
+            documents=[Document(page_content="El regimen simple agrupa impuestos para PyMEs.")]
+        )
+        pool = ChainPool(settings, retriever)
+
+        def memory():
+            return build_memory({}, settings.memory_window, chat_items=HISTORY)
+
+        def per_request_chain():
+            return build_chain(settings, retriever, memory())
+
+        def pooled_chain():
+            return pool.get(memory())
+
+        def invoke(factory):
+            chain = factory()
+            return chain.invoke({"question": "Que impuestos debo pagar?"})
+
+        # Warm up imports, caches and the first TCP connection.
+        invoke(per_request_chain)
+        invoke(pooled_chain)
+
+        print(f"{'ms por request':<34}{'media':>10}{'p50':>10}{'p95':>10}")
+        _report("setup build_chain", _timed(per_request_chain, args.setup_repeat))
+        _report("setup ChainPool.get", _timed(pooled_chain, args.setup_repeat))
+        _report("setup+invoke build_chain", _timed(lambda: invoke(per_request_chain), args.invoke_repeat))
+        _report("setup+invoke ChainPool.get", _timed(lambda: invoke(pooled_chain), args.invoke_repeat))
+        print(f"requests al servidor fake: {server.requests}")
+
+
+if __name__ == "__main__":
+    main()
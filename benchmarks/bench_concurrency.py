@@ -0,0 +1,173 @@
+"""Concurrent throughput of the chat endpoint per gunicorn worker class.
+
+Starts the local fake OpenAI server with a fixed completion latency and
+runs gunicorn once per mode. Each run mixes LLM-bound clients with clients
+sending cheap messages (quick replies and calculators) and reports
+throughput and latency for both groups.
+
+    python -m benchmarks.bench_concurrency --modes sync,gthread,gevent
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import requests
+
+from benchmarks.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+
+
+ROOT = Path(__file__).resolve().parent.parent
+LLM_MESSAGES = ["Que regimen tributario me conviene?", "Como formalizo mi negocio?"]
+CHEAP_MESSAGES = [
+    "hola",
+    "gracias",
+    "punto de equilibrio costos fijos 1000000 precio 12000 costo variable 5000",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_healthy(url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn termino antes de estar listo")
+        try:
+            if requests.get(f"{url}/health", timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("gunicorn no respondio a /health")
+
+
+def _client(url: str, messages: List[str], deadline: float, samples: List[Tuple[float, bool]], lock) -> None:
+    session = requests.Session()
+    index = 0
+    while time.monotonic() < deadline:
+        message = messages[index % len(messages)]
+        index += 1
+        start = time.perf_counter()
+        try:
+            response = session.post(
+                f"{url}/api/chat/stream", data={"user_input": message}, timeout=120
+            )
+            ok = response.ok and "event: done" in response.text
+        except requests.RequestException:
+            ok = False
+        with lock:
+            samples.append(((time.perf_counter() - start) * 1000, ok))
+
+
+def _run_load(url: str, llm_clients: int, cheap_clients: int, duration: float) -> Dict[str, List]:
+    samples: Dict[str, List[Tuple[float, bool]]] = {"llm": [], "cheap": []}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=_client, args=(url, LLM_MESSAGES, deadline, samples["llm"], lock))
+        for _ in range(llm_clients)
+    ] + [
+        threading.Thread(target=_client, args=(url, CHEAP_MESSAGES, deadline, samples["cheap"], lock))
+        for _ in range(cheap_clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent))]
+
+
+def _report(mode: str, samples: Dict[str, List], duration: float) -> None:
+    for group, rows in samples.items():
+        latencies = [latency for latency, ok in rows if ok]
+        errors = sum(1 for _, ok in rows if not ok)
+        print(
+            f"{mode:<10}{group:<7}{len(latencies) / duration:>10.1f}"
+            f"{statistics.median(latencies) if latencies else float('nan'):>10.0f}"
+            f"{_percentile(latencies, 0.95):>10.0f}{errors:>8}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default="sync,gthread,gevent")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--llm-clients", type=int, default=64)
+    parser.add_argument("--cheap-clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--latency-ms", type=float, default=1500.0)
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(latency_ms=args.latency_ms)
+    with FakeOpenAIServer(config=config) as server, tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "OPENAI_API_KEY": "fake-key",
+            "OPENAI_BASE_URL": server.base_url,
+            "CHROMA_DIR": os.path.join(tmp, "chroma"),
+            "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'app.db')}",
+            "EMBEDDING_CACHE_PATH": os.path.join(tmp, "embeddings.sqlite3"),
+            "ENABLE_WEB_SOURCES": "false",
+            "REBUILD_VECTORSTORE": "false",
+            "ENABLE_ANSWER_CACHE": "false",
+            "WEB_CONCURRENCY": str(args.workers),
+            "GUNICORN_THREADS": str(args.threads),
+            "LOG_LEVEL": "WARNING",
+        }
+        # Build the index once so workers only open it.
+        config.latency_ms = 0
+        subprocess.run([sys.executable, "-m", "sme_agent.indexer"], env=env, cwd=ROOT, check=True)
+        config.latency_ms = args.latency_ms
+
+        print(
+            f"{args.llm_clients} clientes LLM + {args.cheap_clients} clientes rapidos, "
+            f"{args.workers} worker(s), latencia LLM {args.latency_ms:.0f} ms, {args.duration:.0f} s"
+        )
+        print(f"{'modo':<10}{'grupo':<7}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errores':>8}")
+        for mode in args.modes.split(","):
+            port = _free_port()
+            url = f"http://127.0.0.1:{port}"
+            process = subprocess.Popen(
+                [
+                    sys.executable, "-m", "gunicorn",
+                    "-c", "gunicorn.conf.py",
+                    "-b", f"127.0.0.1:{port}",
+                    "sme_agent.main:app",
+                ],
+                env={**env, "GUNICORN_WORKER_CLASS": mode},
+                cwd=ROOT,
+                stdout=subprocess.DEVNULL,
+            )
+            try:
+                _wait_healthy(url, process)
+                samples = _run_load(url, args.llm_clients, args.cheap_clients, args.duration)
+                _report(mode, samples, args.duration)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
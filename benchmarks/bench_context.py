@@ -0,0 +1,108 @@
+"""Prompt tokens per answer call with and without context packing.
+
+Splits the knowledge base like the indexer, retrieves the top ``k`` chunks
+for a set of typical questions and counts the tokens of the full answer
+prompt (system prompt, question and stuffed context) when the chunks go in
+as retrieved and after ``pack_passages``. Retrieval is lexical (TF cosine)
+so the benchmark runs without the embeddings API; packing only depends on
+which chunks come back and their order.
+
+    python -m benchmarks.bench_context --k 4 --max-tokens 1000
+    python -m benchmarks.bench_context --web   # adds the web sources (network or WEB_CACHE_DIR)
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import re
+from collections import Counter
+from typing import List, Tuple
+
+from langchain_core.documents import Document
+
+from sme_agent.chains import build_prompt, build_web_fetcher
+from sme_agent.config import Settings
+from sme_agent.services.context import pack_passages
+from sme_agent.services.indexing import split_documents
+from sme_agent.services.knowledge import load_documents
+from sme_agent.services.tokens import count_tokens
+from sme_agent.services.utterance import normalize_text
+
+
+QUESTIONS = [
+    "Que impuestos debo pagar como pyme en Colombia?",
+    "Como me inscribo en el RUT y la camara de comercio?",
+    "Que regimen tributario me conviene, el simple o el ordinario?",
+    "Como mejoro el flujo de caja de mi negocio?",
+    "Que creditos existen para pequenas empresas?",
+    "Cuando debo declarar el IVA?",
+    "Como calculo el punto de equilibrio y el margen bruto?",
+    "Que obligaciones legales tiene una empresa nueva?",
+]
+
+_WORDS = re.compile(r"\w+")
+
+
+def _vector(text: str) -> Counter:
+    return Counter(_WORDS.findall(normalize_text(text.lower())))
+
+
+def _distance(left: Counter, right: Counter) -> float:
+    dot = sum(count * right[word] for word, count in left.items())
+    norm = math.sqrt(sum(v * v for v in left.values())) * math.sqrt(sum(v * v for v in right.values()))
+    return 1.0 - (dot / norm if norm else 0.0)
+
+
+def retrieve(chunks: List[Document], question: str, k: int) -> List[Tuple[Document, float]]:
+    query = _vector(question)
+    scored = [(chunk, _distance(query, _vector(chunk.page_content))) for chunk in chunks]
+    return sorted(scored, key=lambda item: item[1])[:k]
+
+
+def prompt_tokens(question: str, documents: List[Document], model: str) -> int:
+    context = "\n\n".join(doc.page_content for doc in documents)
+    messages = build_prompt().format_messages(chat_history="", question=question, context=context)
+    return sum(count_tokens(message.content, model) for message in messages)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=None, help="Por defecto RETRIEVER_K.")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Por defecto CONTEXT_MAX_TOKENS.")
+    parser.add_argument("--web", action="store_true", help="Incluye las fuentes web.")
+    args = parser.parse_args()
+
+    settings = Settings()
+    k = args.k or settings.retriever_k
+    max_tokens = args.max_tokens if args.max_tokens is not None else settings.context_max_tokens
+    documents = load_documents(
+        knowledge_dir=settings.knowledge_dir,
+        web_sources=settings.web_sources,
+        enable_web=args.web,
+        fetcher=build_web_fetcher(settings),
+    )
+    chunks = split_documents(documents)
+    print(f"{len(chunks)} fragmentos, k={k}, presupuesto {max_tokens} tokens")
+    print(f"{'pregunta':<48}{'frag':>6}{'antes':>8}{'pasajes':>9}{'despues':>9}{'ahorro':>8}")
+
+    totals = [0, 0]
+    for question in QUESTIONS:
+        retrieved = retrieve(chunks, question, k)
+        packed = pack_passages(retrieved, max_tokens, settings.model_name)
+        before = prompt_tokens(question, [doc for doc, _ in retrieved], settings.model_name)
+        after = prompt_tokens(question, packed, settings.model_name)
+        totals[0] += before
+        totals[1] += after
+        print(
+            f"{question[:46]:<48}{len(retrieved):>6}{before:>8}{len(packed):>9}{after:>9}"
+            f"{1 - after / before:>8.0%}"
+        )
+    count = len(QUESTIONS)
+    print(
+        f"{'media por llamada':<48}{'':>6}{totals[0] / count:>8.0f}{'':>9}"
+        f"{totals[1] / count:>9.0f}{1 - totals[1] / totals[0]:>8.0%}"
+    )
+
+
+if __name__ == "__main__":
+    main()
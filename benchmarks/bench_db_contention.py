@@ -0,0 +1,111 @@
+"""Multi-process write contention on a SQLite file, per storage profile.
+
+Each process plays a gunicorn worker: it loads the recent history, then
+writes one chat turn (user message, answer and LLM call with its rollups)
+in a unit of work, in a loop. Reports turns per second, turn latency and
+"database is locked" errors for SQLite's defaults and for the WAL profile.
+
+    python -m benchmarks.bench_db_contention --processes 8 --duration 10
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy.exc import OperationalError
+
+from sme_agent.db import (
+    Database,
+    StorageProfile,
+    ensure_user,
+    load_recent_messages,
+    save_chat_message,
+    save_llm_call,
+)
+
+
+PROFILES: Dict[str, StorageProfile] = {
+    # What the app used before: rollback journal, no PRAGMAs (pysqlite still
+    # waits up to 5 s for a lock).
+    "default": StorageProfile(
+        sqlite_journal_mode="", sqlite_synchronous="", sqlite_busy_timeout_ms=None
+    ),
+    "wal": StorageProfile(),
+}
+
+
+def _worker(url: str, profile: StorageProfile, worker: int, duration: float, results) -> None:
+    db = Database(url, profile=profile)
+    user_id = f"user-{worker}"
+    ensure_user(db, user_id)
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            load_recent_messages(db, user_id, 8)
+            with db.unit_of_work():
+                save_chat_message(db, user_id, "user", "Que regimen tributario me conviene?")
+                save_chat_message(db, user_id, "assistant", "Te conviene el regimen simple. " * 20)
+                save_llm_call(db, user_id, "gpt-4o-mini", 1500, 800, 200, 1000, "ok", None)
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+    results.put((latencies, errors))
+
+
+def _run(
+    profile: StorageProfile, processes: int, duration: float, directory: Optional[str] = None
+) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        url = f"sqlite:///{Path(tmp) / 'contention.db'}"
+        setup = Database(url, profile=profile)
+        setup.init_db()
+        setup.engine.dispose()
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=_worker, args=(url, profile, index, duration, results))
+            for index in range(processes)
+        ]
+        for process in workers:
+            process.start()
+        collected = [results.get() for _ in workers]
+        for process in workers:
+            process.join()
+    latencies = sorted(latency for rows, _ in collected for latency in rows)
+    return {
+        "turns": len(latencies) / duration,
+        "p50": statistics.median(latencies) if latencies else float("nan"),
+        "p95": latencies[int(len(latencies) * 0.95)] if latencies else float("nan"),
+        "max": latencies[-1] if latencies else float("nan"),
+        "errors": sum(errors for _, errors in collected),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", default="default,wal")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--dir", default=None, help="Directorio del archivo temporal (disco real).")
+    args = parser.parse_args()
+
+    print(f"{args.processes} procesos, {args.duration:.0f} s")
+    print(f"{'perfil':<10}{'turnos/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'errores':>9}")
+    for name in args.profiles.split(","):
+        row = _run(PROFILES[name], args.processes, args.duration, args.dir)
+        print(
+            f"{name:<10}{row['turns']:>10.1f}{row['p50']:>10.1f}{row['p95']:>10.1f}"
+            f"{row['max']:>10.1f}{row['errors']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
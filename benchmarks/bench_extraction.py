@@ -0,0 +1,90 @@
+"""Per-message cost of calculator amount extraction.
+
+Compares the precompiled ``AmountExtractor`` against the previous approach of
+one ``re.search`` per slot pattern, on short chat messages and on long pasted
+financial statements.
+
+    python -m benchmarks.bench_extraction
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import timeit
+from typing import Dict, Optional
+
+from sme_agent.services.calculators import (
+    _AMOUNT_SLOTS,
+    NUMBER_PATTERN,
+    extract_amounts,
+    parse_number,
+)
+from sme_agent.services.classification import normalize_text
+
+
+def legacy_extract_amounts(text: str) -> Dict[str, float]:
+    normalized = normalize_text(text.lower())
+    values: Dict[str, Optional[float]] = {}
+    for name, patterns in _AMOUNT_SLOTS:
+        values[name] = None
+        for pattern in patterns:
+            match = re.search(pattern + r"[^\d]*(?P<number>" + NUMBER_PATTERN + r")", normalized)
+            if match:
+                value = parse_number(match.group("number"))
+                if value is not None:
+                    values[name] = value
+                    break
+    return {key: value for key, value in values.items() if value is not None}
+
+
+SHORT_MESSAGE = "calcular punto de equilibrio: costos fijos 1.000.000, precio 12000, costo variable 5000"
+
+STATEMENT_LINES = [
+    "Estado de resultados {year} - linea {line}",
+    "Ventas netas del periodo: {a},000,000",
+    "Costo de ventas: {b},500,000",
+    "Utilidad bruta: {c},500,000",
+    "Otros ingresos no operacionales: 12.345.678",
+    "Depreciaciones y amortizaciones 1.234.567",
+    "Nota {line}: los valores se expresan en pesos colombianos y fueron auditados.",
+]
+STATEMENT_TAIL = (
+    "Activo corriente 4.000.000 pasivo corriente 2.500.000 deuda total 9.000.000 "
+    "ebitda 3.000.000 intereses 450.000 utilidad operativa 2.800.000 "
+    "utilidad neta 1.900.000 costos fijos 1.200.000 gastos 800.000"
+)
+
+
+def build_statement(lines: int) -> str:
+    rows = []
+    for line in range(lines):
+        template = STATEMENT_LINES[line % len(STATEMENT_LINES)]
+        rows.append(template.format(year=2020 + line % 5, line=line, a=line + 5, b=line + 3, c=line + 2))
+    return "\n".join(rows) + "\n" + STATEMENT_TAIL
+
+
+def measure(func, text: str, number: int) -> float:
+    timer = timeit.Timer(lambda: func(text))
+    best = min(timer.repeat(repeat=5, number=number))
+    return best / number * 1_000_000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    cases = [("mensaje corto", SHORT_MESSAGE)]
+    cases += [(f"estado {lines} lineas", build_statement(lines)) for lines in (50, 500, 2000)]
+
+    print(f"{'caso':<22}{'chars':>9}{'legacy us':>12}{'compilado us':>16}{'speedup':>9}")
+    for label, text in cases:
+        assert extract_amounts(text) == legacy_extract_amounts(text), label
+        number = max(1, args.number // max(1, len(text) // 2000))
+        legacy = measure(legacy_extract_amounts, text, number)
+        current = measure(extract_amounts, text, number)
+        print(f"{label:<22}{len(text):>9}{legacy:>12.1f}{current:>16.1f}{legacy / current:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Per-message hot paths, with a stored baseline and a regression gate.
+
+Times the deterministic code every chat message goes through (routing,
+classification, intent detection, amount extraction, number parsing,
+preference commands and markdown rendering) on representative and
+adversarial inputs: long pasted statements, thousands of numbers,
+pathological markdown.
+
+Timings are stored relative to a fixed pure-Python calibration loop run in
+the same process, so a baseline recorded on one machine stays comparable on
+another. ``--check`` exits with status 1 when a case is slower than the
+baseline by more than ``--tolerance``.
+
+    python -m benchmarks.bench_hot_paths --save benchmarks/hot_paths_baseline.json
+    python -m benchmarks.bench_hot_paths --check benchmarks/hot_paths_baseline.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import timeit
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.bench_extraction import SHORT_MESSAGE, build_statement
+from sme_agent.factory import render_answer
+from sme_agent.services.advisor import maybe_handle_calculator
+from sme_agent.services.calculators import extract_amounts
+from sme_agent.services.classification import classify_text
+from sme_agent.services.intents import detect_intent, should_use_calculator
+from sme_agent.services.preferences import format_preferences, is_show_preferences, parse_save_command
+from sme_agent.services.utterance import Utterance, parse_number
+
+
+FORMAT_VERSION = 1
+DEFAULT_BASELINE = Path(__file__).with_name("hot_paths_baseline.json")
+
+GREETING = "hola, buenos dias!"
+QUESTION = "Que impuestos debo pagar si tengo una panaderia en Bogota y vendo 20 millones al mes?"
+STATEMENT = build_statement(500)
+MANY_NUMBERS = "ventas " + " ".join(f"{index}.{index % 1000:03d},{index % 100:02d}" for index in range(2000))
+LONG_QUESTION = (QUESTION + " ") * 200
+SAVE_COMMAND = "guardar: sector=alimentos procesados"
+SAVE_WITHOUT_SEPARATOR = "guardar: " + "clave " * 2000
+ANSWER = (
+    "Te conviene el **regimen simple** si tus ingresos brutos son menores al tope.\n\n"
+    "1. Inscribete en el RUT y en la camara de comercio.\n"
+    "2. Declara el *anticipo bimestral* y el consolidado anual.\n"
+    "3. Revisa tu flujo de caja cada mes.\n\n"
+    "> Verifica las tarifas vigentes con la [DIAN](https://www.dian.gov.co).\n\n"
+    "Quieres que calculemos tu punto de equilibrio?\n"
+)
+LONG_ANSWER = ANSWER * 50
+MARKDOWN_TRAP = "*_" * 2000 + "[" * 1000 + "<script>alert(1)</script>" * 50
+
+
+def route(text: str) -> str:
+    # The deterministic part of factory.answer_without_llm, without the
+    # database writes.
+    utterance = Utterance.from_text(text)
+    if parse_save_command(utterance):
+        return "save_preference"
+    if is_show_preferences(utterance):
+        return "show_preferences"
+    if classify_text(utterance) != "consulta":
+        return "quick_reply"
+    if utterance.normalized == "informacion":
+        return "info"
+    if maybe_handle_calculator(utterance):
+        return "calculator"
+    return "llm"
+
+
+def _intent(text: str) -> bool:
+    utterance = Utterance.from_text(text)
+    return should_use_calculator(utterance, detect_intent(utterance))
+
+
+def _parse_numbers(raws: List[str]) -> None:
+    for raw in raws:
+        parse_number(raw)
+
+
+NUMBER_FORMATS = ["1.234.567,89", "12,000.50", "1,5", "250.000", "3000000", "7,5 %", "abc"]
+
+CASES: List[Tuple[str, Callable[[], object]]] = [
+    ("route/saludo", lambda: route(GREETING)),
+    ("route/pregunta", lambda: route(QUESTION)),
+    ("route/calculadora", lambda: route(SHORT_MESSAGE)),
+    ("route/estado_500_lineas", lambda: route(STATEMENT)),
+    ("classify_text/saludo", lambda: classify_text(GREETING)),
+    ("classify_text/pregunta_larga", lambda: classify_text(LONG_QUESTION)),
+    ("classify_text/estado_500_lineas", lambda: classify_text(STATEMENT)),
+    ("intent/pregunta", lambda: _intent(QUESTION)),
+    ("intent/calculadora", lambda: _intent(SHORT_MESSAGE)),
+    ("intent/estado_500_lineas", lambda: _intent(STATEMENT)),
+    ("extract_amounts/calculadora", lambda: extract_amounts(SHORT_MESSAGE)),
+    ("extract_amounts/estado_500_lineas", lambda: extract_amounts(STATEMENT)),
+    ("extract_amounts/2000_numeros", lambda: extract_amounts(MANY_NUMBERS)),
+    ("parse_number/formatos", lambda: _parse_numbers(NUMBER_FORMATS)),
+    ("parse_number/400_digitos", lambda: parse_number("9" * 400)),
+    ("parse_save_command/guardar", lambda: parse_save_command(SAVE_COMMAND)),
+    ("parse_save_command/sin_separador", lambda: parse_save_command(SAVE_WITHOUT_SEPARATOR)),
+    ("parse_save_command/pregunta", lambda: parse_save_command(QUESTION)),
+    ("format_preferences/5", lambda: format_preferences([(f"clave{i}", "valor") for i in range(5)])),
+    ("format_preferences/500", lambda: format_preferences([(f"clave{i}", "valor") for i in range(500)])),
+    ("render_answer/respuesta", lambda: render_answer(ANSWER)),
+    ("render_answer/respuesta_x50", lambda: render_answer(LONG_ANSWER)),
+    ("render_answer/markdown_trampa", lambda: render_answer(MARKDOWN_TRAP)),
+]
+
+
+def _calibration() -> None:
+    total = 0
+    for index in range(2000):
+        total += index * index % 7
+    "".join(str(index) for index in range(300))
+
+
+def best_us(func: Callable[[], object], repeat: int) -> float:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1_000_000
+
+
+def run(repeat: int, only: str = "") -> dict:
+    calibration = best_us(_calibration, repeat)
+    cases: Dict[str, dict] = {}
+    for name, func in CASES:
+        if only and only not in name:
+            continue
+        micros = best_us(func, repeat)
+        cases[name] = {"us": round(micros, 3), "relative": round(micros / calibration, 5)}
+    return {
+        "version": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "calibration_us": round(calibration, 3),
+        "cases": cases,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[Tuple[str, float, str]]:
+    # (case, change in relative time, status) for every current case.
+    rows = []
+    for name, result in current["cases"].items():
+        previous = baseline["cases"].get(name)
+        if previous is None:
+            rows.append((name, 0.0, "nuevo"))
+            continue
+        change = result["relative"] / previous["relative"] - 1
+        if change > tolerance:
+            status = "REGRESION"
+        elif change < -tolerance:
+            status = "mejora"
+        else:
+            status = "ok"
+        rows.append((name, change, status))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", default="", help="Solo los casos que contienen este texto.")
+    parser.add_argument("--save", type=Path, help="Guarda los resultados como linea base.")
+    parser.add_argument("--check", type=Path, nargs="?", const=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    args = parser.parse_args()
+
+    current = run(args.repeat, args.only)
+    print(f"calibracion {current['calibration_us']:.1f} us ({current['python']}, {current['machine']})")
+
+    if args.check is None:
+        print(f"{'caso':<40}{'us':>12}{'relativo':>10}")
+        for name, result in current["cases"].items():
+            print(f"{name:<40}{result['us']:>12.1f}{result['relative']:>10.3f}")
+    else:
+        baseline = json.loads(args.check.read_text(encoding="utf-8"))
+        if baseline.get("version") != FORMAT_VERSION:
+            sys.exit(f"{args.check} tiene otro formato ({baseline.get('version')})")
+        rows = compare(current, baseline, args.tolerance)
+        print(f"{'caso':<40}{'us':>12}{'cambio':>9}  estado (tolerancia {args.tolerance:.0%})")
+        for name, change, status in rows:
+            print(f"{name:<40}{current['cases'][name]['us']:>12.1f}{change:>+9.0%}  {status}")
+        regressions = [name for name, _, status in rows if status == "REGRESION"]
+        if regressions:
+            sys.exit(f"{len(regressions)} caso(s) mas lentos que la linea base: {', '.join(regressions)}")
+
+    if args.save:
+        args.save.write_text(json.dumps(current, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"Linea base guardada en {args.save}")
+
+
+if __name__ == "__main__":
+    main()
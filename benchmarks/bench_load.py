@@ -0,0 +1,239 @@
+"""End-to-end load test of the chat app against the fake OpenAI server.
+
+Builds ``create_app()`` in process, with its knowledge index, database and
+embedding cache in a temporary directory, and points it at
+``benchmarks.fake_openai`` with the given latency, token usage and error
+rate. ``--concurrency`` clients, each with its own session (one user per
+client), replay a weighted mix of greetings, calculators, preferences and
+RAG questions through ``/api/chat/stream``.
+
+Reports per router branch: throughput, p50/p95/p99 latency, failed requests
+(including answers that fell back to the LLM error message) and database
+commits per request. Requests go through the WSGI test client
+(no HTTP server in front), so each request and its streamed body run on the
+client's thread and commits are attributed exactly. For gunicorn worker
+classes use bench_concurrency.
+
+    python -m benchmarks.bench_load --concurrency 16 --requests 800 --latency-ms 800
+    python -m benchmarks.bench_load --error-rate 0.05 --setting retrieval_mode=hybrid
+"""
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event
+
+from benchmarks.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from sme_agent import factory
+from sme_agent.config import Settings
+from sme_agent.services.metrics import BRANCHES
+
+
+MESSAGES: Dict[str, List[str]] = {
+    "quick_reply": ["hola", "gracias", "buenos dias", "adios"],
+    "info": ["informacion"],
+    "calculator": [
+        "calcular punto de equilibrio: costos fijos 1000000, precio 12000, costo variable 5000",
+        "margen bruto con ventas 5000000 y costo de ventas 3000000",
+        "razon corriente con activo corriente 4000000 y pasivo corriente 2500000",
+    ],
+    "save_preference": ["guardar: sector=alimentos", "guardar: ciudad=Bogota", "guardar: empleados=12"],
+    "show_preferences": ["mis datos"],
+    "llm": [
+        "Que impuestos debo pagar como pyme en Colombia?",
+        "Como me inscribo en el RUT y la camara de comercio?",
+        "Que regimen tributario me conviene, el simple o el ordinario?",
+        "Como mejoro el flujo de caja de mi negocio?",
+        "Que creditos existen para pequenas empresas?",
+        "Cuando debo declarar el IVA?",
+    ],
+}
+DEFAULT_MIX = "llm=50,quick_reply=15,calculator=15,save_preference=10,show_preferences=5,info=5"
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in MESSAGES:
+            raise SystemExit(f"Rama desconocida en --mix: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+def parse_settings(pairs: List[str], base: Settings) -> Dict[str, object]:
+    overrides: Dict[str, object] = {}
+    names = {field.name for field in dataclasses.fields(Settings)}
+    for pair in pairs:
+        name, _, raw = pair.partition("=")
+        if name not in names:
+            raise SystemExit(f"Ajuste desconocido en --setting: {name}")
+        current = getattr(base, name)
+        if isinstance(current, bool):
+            overrides[name] = raw.lower() == "true"
+        else:
+            overrides[name] = type(current)(raw)
+    return overrides
+
+
+class BranchRecorder:
+    # Remembers the branch the router picked on the current thread and
+    # counts the commits that thread makes.
+
+    def __init__(self, app) -> None:
+        self.local = threading.local()
+        event.listen(app.config["DB"].engine, "commit", self._on_commit)
+        observe_branch = factory.observe_branch
+
+        def record(branch: str, started_at: float) -> None:
+            self.local.branch = branch
+            observe_branch(branch, started_at)
+
+        factory.observe_branch = record
+
+    def _on_commit(self, connection) -> None:
+        self.local.commits = getattr(self.local, "commits", 0) + 1
+
+    def reset(self) -> None:
+        self.local.branch = None
+        self.local.commits = 0
+
+    def take(self) -> Tuple[str, int]:
+        return self.local.branch or "sin_rama", self.local.commits
+
+
+def _client(
+    app,
+    recorder: BranchRecorder,
+    plan: List[str],
+    samples: Dict[str, List[Tuple[float, bool, int]]],
+    lock: threading.Lock,
+) -> None:
+    client = app.test_client()
+    for message in plan:
+        recorder.reset()
+        start = time.perf_counter()
+        response = client.post("/api/chat/stream", data={"user_input": message})
+        body = response.get_data(as_text=True)
+        latency_ms = (time.perf_counter() - start) * 1000
+        branch, commits = recorder.take()
+        ok = (
+            response.status_code == 200
+            and "event: done" in body
+            and factory.LLM_ERROR_MESSAGE not in body
+        )
+        with lock:
+            samples[branch].append((latency_ms, ok, commits))
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent))]
+
+
+def _row(label: str, rows: List[Tuple[float, bool, int]], elapsed: float) -> str:
+    latencies = [latency for latency, _, _ in rows]
+    commits = [count for _, _, count in rows]
+    failed = sum(1 for _, ok, _ in rows if not ok)
+    return (
+        f"{label:<18}{len(rows):>7}{len(rows) / elapsed:>9.1f}"
+        f"{statistics.median(latencies):>9.0f}{_percentile(latencies, 0.95):>9.0f}"
+        f"{_percentile(latencies, 0.99):>9.0f}{failed:>7}"
+        f"{statistics.mean(commits):>10.2f}{max(commits):>6}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=800)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="rama=peso separados por comas")
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument("--token-delay-ms", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--prompt-tokens", type=int, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument(
+        "--setting", action="append", default=[], help="Ajuste de Settings, p. ej. enable_tracing=true"
+    )
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    plan = [rng.choice(MESSAGES[name]) for name in rng.choices(names, weights, k=args.requests)]
+    plans = [plan[index :: args.concurrency] for index in range(args.concurrency)]
+
+    config = FakeOpenAIConfig(
+        latency_ms=0,
+        token_delay_ms=args.token_delay_ms,
+        completion_tokens=args.completion_tokens,
+        prompt_tokens=args.prompt_tokens,
+        seed=args.seed,
+    )
+    with FakeOpenAIServer(config=config) as server, tempfile.TemporaryDirectory() as tmp:
+        base = Settings()
+        settings = dataclasses.replace(
+            base,
+            openai_api_key="fake-key",
+            openai_base_url=server.base_url,
+            chroma_dir=os.path.join(tmp, "chroma"),
+            database_url=f"sqlite:///{os.path.join(tmp, 'app.db')}",
+            embedding_cache_path=os.path.join(tmp, "embeddings.sqlite3"),
+            enable_web_sources=False,
+            rebuild_vectorstore=False,
+            **parse_settings(args.setting, base),
+        )
+        # Failed LLM calls are counted in the table instead of logged.
+        os.environ.setdefault("LOG_LEVEL", "CRITICAL")
+        app = factory.create_app(settings)
+        recorder = BranchRecorder(app)
+        # The index is built at startup without latency or errors.
+        config.latency_ms = args.latency_ms
+        config.error_rate = args.error_rate
+        server.requests.clear()
+
+        print(
+            f"{args.requests} mensajes, {args.concurrency} clientes, latencia LLM "
+            f"{args.latency_ms:.0f} ms, errores {args.error_rate:.0%}, mezcla {args.mix}"
+        )
+        samples: Dict[str, List[Tuple[float, bool, int]]] = defaultdict(list)
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(target=_client, args=(app, recorder, client_plan, samples, lock))
+            for client_plan in plans
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"{'rama':<18}{'n':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'fallos':>7}{'commits/r':>10}{'max':>6}"
+        )
+        for branch in [*BRANCHES, *sorted(set(samples) - set(BRANCHES))]:
+            if samples.get(branch):
+                print(_row(branch, samples[branch], elapsed))
+        print(_row("total", [row for rows in samples.values() for row in rows], elapsed))
+        calls = ", ".join(f"{path}={count}" for path, count in sorted(server.requests.items()))
+        print(f"{elapsed:.1f} s; fake OpenAI: {calls}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Cost of a /metrics scrape versus the size of llm_calls.
+
+Fills a temporary SQLite database with synthetic LLM calls spread over the
+last day, builds the rollups and times the old full-table aggregates
+against get_llm_stats, which reads only the rollup tables.
+
+    python -m benchmarks.bench_metrics --sizes 1000,100000,1000000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable, List
+
+from sqlalchemy import func, insert
+
+from sme_agent.db import Database, LLMCall, User, get_llm_stats, rebuild_llm_rollups, utcnow
+
+
+def _legacy_stats(db: Database) -> dict:
+    # The aggregates /metrics ran before the rollup tables existed.
+    with db.session() as session:
+        total = session.query(LLMCall).count()
+        errors = session.query(LLMCall).filter(LLMCall.status == "error").count()
+        model_calls = session.query(LLMCall).filter(LLMCall.status != "cache_hit")
+        avg_latency = model_calls.with_entities(func.avg(LLMCall.latency_ms)).scalar()
+        avg_tokens = model_calls.with_entities(func.avg(LLMCall.total_tokens)).scalar()
+    return {"total": total, "errors": errors, "latency": avg_latency, "tokens": avg_tokens}
+
+
+def _fill(db: Database, rows: int, batch: int = 20000) -> None:
+    random.seed(7)
+    now = utcnow()
+    with db.engine.begin() as connection:
+        connection.execute(insert(User), [{"id": "bench"}])
+        for offset in range(0, rows, batch):
+            connection.execute(
+                insert(LLMCall),
+                [
+                    {
+                        "user_id": "bench",
+                        "model": random.choice(("gpt-4o-mini", "gpt-4o")),
+                        "latency_ms": int(random.lognormvariate(7, 0.6)),
+                        "prompt_tokens": 600,
+                        "completion_tokens": 200,
+                        "total_tokens": 800 + random.randint(-300, 300),
+                        "status": "error" if random.random() < 0.02 else "ok",
+                        "created_at": now - timedelta(seconds=random.randint(0, 86400)),
+                    }
+                    for _ in range(min(batch, rows - offset))
+                ],
+            )
+
+
+def _timed(func: Callable[[], object], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,100000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'filas':>10}{'agregados ms':>16}{'rollups 1h ms':>16}{'rollups 24h ms':>16}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Database(f"sqlite:///{Path(tmp) / 'metrics.db'}")
+            db.init_db()
+            _fill(db, size)
+            rebuild_llm_rollups(db)
+            legacy = _timed(lambda: _legacy_stats(db), args.repeat)
+            hour = _timed(lambda: get_llm_stats(db, window="1h"), args.repeat)
+            day = _timed(lambda: get_llm_stats(db, window="24h"), args.repeat)
+            db.engine.dispose()
+        print(
+            f"{size:>10}{statistics.median(legacy):>16.2f}"
+            f"{statistics.median(hour):>16.2f}{statistics.median(day):>16.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""Local OpenAI-compatible stand-in for offline benchmarks.
+
+Serves ``/v1/chat/completions`` (plain and streamed) and ``/v1/embeddings``
+with a configurable artificial latency, token usage and error rate, so the
+app and LangChain can be exercised end to end without network access or API
+quota.
+
+    python -m benchmarks.fake_openai --port 8765 --latency-ms 300 --error-rate 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+
+@dataclass
+class FakeOpenAIConfig:
+    latency_ms: float = 0.0
+    completion_tokens: int = 60
+    embedding_dimensions: int = 64
+    answer: str = "Respuesta de prueba para la PyME."
+    # Delay between streamed chunks; latency_ms is the time to first token.
+    token_delay_ms: float = 0.0
+    # Reported prompt tokens; None counts the words of the messages.
+    prompt_tokens: Optional[int] = None
+    # Share of chat completions answered with HTTP 500 (the OpenAI client
+    # retries them, like real server errors).
+    error_rate: float = 0.0
+    seed: Optional[int] = None
+
+
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [(digest[index % len(digest)] - 128) / 128 for index in range(dimensions)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections alive, like the real API.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "FakeOpenAIServer"
+
+    def log_message(self, format, *args) -> None:
+        return
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        config = self.server.config
+        self.server.record(self.path)
+        if config.latency_ms:
+            time.sleep(config.latency_ms / 1000)
+
+        if self.path.endswith("/chat/completions") and self.server.should_fail():
+            self.server.record("errors")
+            self._send(500, {"error": {"message": "Fake server error", "type": "server_error"}})
+            return
+        if self.path.endswith("/chat/completions") and payload.get("stream"):
+            self._stream_chat_completion(payload, config)
+            return
+        if self.path.endswith("/chat/completions"):
+            body = self._chat_completion(payload, config)
+        elif self.path.endswith("/embeddings"):
+            body = self._embeddings(payload, config)
+        else:
+            self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        self._send(200, body)
+
+    def _prompt_tokens(self, payload: dict) -> int:
+        if self.server.config.prompt_tokens is not None:
+            return self.server.config.prompt_tokens
+        return sum(
+            len(str(message.get("content", "")).split()) for message in payload.get("messages", [])
+        )
+
+    def _chat_completion(self, payload: dict, config: FakeOpenAIConfig) -> dict:
+        prompt_tokens = self._prompt_tokens(payload)
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake-model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": config.answer},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": config.completion_tokens,
+                "total_tokens": prompt_tokens + config.completion_tokens,
+            },
+        }
+
+    def _stream_chat_completion(self, payload: dict, config: FakeOpenAIConfig) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(choices: list, **extra) -> None:
+            event = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": payload.get("model", "fake-model"),
+                "choices": choices,
+                **extra,
+            }
+            self._write_chunk(f"data: {json.dumps(event)}\n\n")
+
+        words = config.answer.split(" ")
+        for index, word in enumerate(words):
+            if index and config.token_delay_ms:
+                time.sleep(config.token_delay_ms / 1000)
+            delta = {"content": word if index == 0 else f" {word}"}
+            if index == 0:
+                delta["role"] = "assistant"
+            chunk([{"index": 0, "delta": delta, "finish_reason": None}])
+        chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            prompt_tokens = self._prompt_tokens(payload)
+            chunk(
+                [],
+                usage={
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": config.completion_tokens,
+                    "total_tokens": prompt_tokens + config.completion_tokens,
+                },
+            )
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text: str) -> None:
+        raw = text.encode("utf-8")
+        self.wfile.write(f"{len(raw):x}\r\n".encode("ascii") + raw + b"\r\n")
+        self.wfile.flush()
+
+    def _embeddings(self, payload: dict, config: FakeOpenAIConfig) -> dict:
+        inputs = payload.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = [
+            {
+                "object": "embedding",
+                "index": index,
+                "embedding": fake_embedding(str(item), config.embedding_dimensions),
+            }
+            for index, item in enumerate(inputs)
+        ]
+        return {
+            "object": "list",
+            "data": data,
+            "model": payload.get("model", "fake-embedding"),
+            "usage": {"prompt_tokens": len(data), "total_tokens": len(data)},
+        }
+
+    def _send(self, status: int, body: dict) -> None:
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[FakeOpenAIConfig] = None):
+        super().__init__((host, port), _Handler)
+        self.config = config or FakeOpenAIConfig()
+        self.requests: dict = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(self.config.seed)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def record(self, path: str) -> None:
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def should_fail(self) -> bool:
+        if not self.config.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.config.error_rate
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--prompt-tokens", type=int, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(
+        latency_ms=args.latency_ms,
+        completion_tokens=args.completion_tokens,
+        prompt_tokens=args.prompt_tokens,
+        error_rate=args.error_rate,
+    )
+    server = FakeOpenAIServer(args.host, args.port, config)
+    print(f"Fake OpenAI en {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
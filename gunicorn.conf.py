@@ -0,0 +1,72 @@
+"""Gunicorn settings for the chat app.
+
+Chat requests spend seconds waiting on the LLM API. With the default sync
+workers each of them pins a whole worker process, so quick replies and
+calculators queue behind slow completions. The gevent worker serves every
+request on a greenlet: the OpenAI HTTP calls yield while waiting, and cheap
+paths keep running on the same worker.
+
+    gunicorn -c gunicorn.conf.py sme_agent.main:app
+
+GUNICORN_WORKER_CLASS selects the mode (gevent, gthread or sync).
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count(), 4))))
+
+# gevent: concurrent greenlets per worker. gthread: OS threads per worker.
+# Gunicorn turns sync workers into gthread when threads > 1, so threads are
+# only set for gthread.
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+threads = int(os.getenv("GUNICORN_THREADS", "32")) if worker_class == "gthread" else 1
+
+# Streamed answers can stay open for the whole completion.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+# Prometheus metrics: each worker writes its values under this directory and
+# /metrics/prometheus merges them. It must be set before the workers import
+# prometheus_client, so it is set here in the master.
+prometheus_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "sme_agent_prometheus")
+)
+
+
+def on_starting(server):
+    # Values left by a previous run would be merged into the new one.
+    shutil.rmtree(prometheus_dir, ignore_errors=True)
+    os.makedirs(prometheus_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    if server.cfg.worker_class_str != "gevent":
+        return
+    # httpcore imports trio when it is installed, and trio needs select.epoll
+    # at import time, which gevent's default (aggressive) patch removes.
+    # Patch without removing it and import httpcore before the worker
+    # applies its own patch.
+    import platform
+
+    from gevent import monkey
+
+    # The OpenAI client reads platform.platform() on its first request, which
+    # forks `uname -p`; resolve it before patching instead of from a greenlet.
+    platform.platform()
+    monkey.patch_all(aggressive=False)
+    import httpcore  # noqa: F401
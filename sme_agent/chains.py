@@ -1,89 +1,311 @@
 from __future__ import annotations
 
+import hashlib
 import os
-from typing import List
+from typing import Any, Dict, List, Literal, Optional, Tuple
 
 from langchain.chains import ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from langchain_core.callbacks import CallbackManagerForChainRun
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.retrievers import BaseRetriever
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pydantic import SkipValidation
 
 from sme_agent.config import Settings
 from sme_agent.prompts import SYSTEM_PROMPT
-from sme_agent.services.knowledge import load_documents
+from sme_agent.services.answer_cache import AnswerCache, chunk_id
+from sme_agent.services.context import pack_passages
+from sme_agent.services.embeddings import CachedEmbeddings, EmbeddingStore
+from sme_agent.services.indexing import IndexReport, manifest_path, update_index
+from sme_agent.services.knowledge import WebFetcher, load_documents
+from sme_agent.services.lexical import BM25Index, reciprocal_rank_fusion
+from sme_agent.services.tracing import span
 
 
 class CustomThresholdRetriever(BaseRetriever):
     vectorstore: Chroma
     threshold: float = 0.3
     k: int = 4
+    # Token budget for the packed context (0: no limit) and the model whose
+    # tokenizer counts it.
+    max_context_tokens: int = 0
+    model_name: str = "gpt-4o-mini"
+    # "vector": Chroma only. "hybrid": BM25 and vector rankings fused, or
+    # BM25 alone (no embeddings call) when its confidence reaches
+    # lexical_confidence. "lexical": BM25 only. BM25 hits below
+    # lexical_fusion_confidence are not fused, so an off-topic question that
+    # shares a word with the corpus still gets no context.
+    mode: Literal["vector", "hybrid", "lexical"] = "vector"
+    lexical_index: SkipValidation[Optional[BM25Index]] = None
+    lexical_confidence: float = 0.8
+    lexical_fusion_confidence: float = 0.5
+
+    def embed_query(self, query: str) -> List[float]:
+        with span("query_embedding"):
+            return self.vectorstore.embeddings.embed_query(query)
+
+    def search_by_vector(
+        self, embedding: List[float], lexical: Optional[List[Document]] = None
+    ) -> List[Document]:
+        with span("vector_search"):
+            docs_and_scores = self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+                embedding, k=self.k
+            )
+        relevant = [(doc, score) for doc, score in docs_and_scores if score < self.threshold]
+        if lexical:
+            relevant = reciprocal_rank_fusion([doc for doc, _ in relevant], lexical)[: self.k]
+        return pack_passages(relevant, self.max_context_tokens, self.model_name)
+
+    def search(self, query: str) -> Tuple[List[Document], Optional[List[float]]]:
+        # Returns the documents and the query embedding, or None when the
+        # lexical index answered alone.
+        lexical: List[Document] = []
+        if self.mode != "vector" and self.lexical_index is not None:
+            with span("lexical_search"):
+                hits, confidence = self.lexical_index.search(query, self.k)
+            lexical = [doc for doc, _ in hits]
+            if self.mode == "lexical" or (lexical and confidence >= self.lexical_confidence):
+                ranked = [(doc, float(rank)) for rank, doc in enumerate(lexical)]
+                return pack_passages(ranked, self.max_context_tokens, self.model_name), None
+            if confidence < self.lexical_fusion_confidence:
+                lexical = []
+        embedding = self.embed_query(query)
+        return self.search_by_vector(embedding, lexical), embedding
 
     def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
-        docs_and_scores = self.vectorstore.similarity_search_with_score(query, k=self.k)
-        return [doc for doc, score in docs_and_scores if score < self.threshold]
+        return self.search(query)[0]
 
 
 def build_prompt() -> ChatPromptTemplate:
+    # ConversationalRetrievalChain hands the combine step the history already
+    # rendered as text, so it cannot go through a MessagesPlaceholder.
     return ChatPromptTemplate.from_messages(
         [
             ("system", SYSTEM_PROMPT),
-            MessagesPlaceholder("chat_history"),
-            ("human", "Pregunta: {question}\nContexto:\n{context}\nRespuesta:"),
+            (
+                "human",
+                "Historial:\n{chat_history}\n\n"
+                "Pregunta: {question}\nContexto:\n{context}\nRespuesta:",
+            ),
         ]
     )
 
 
-def build_vectorstore(settings: Settings) -> Chroma:
-    embedding = OpenAIEmbeddings(model=settings.embedding_model)
+def build_llm(settings: Settings, streaming: bool = False) -> ChatOpenAI:
+    return ChatOpenAI(
+        model=settings.model_name,
+        temperature=settings.temperature,
+        base_url=settings.openai_base_url or None,
+        streaming=streaming,
+        stream_usage=streaming,
+    )
 
-    if (
-        os.path.isdir(settings.chroma_dir)
-        and os.listdir(settings.chroma_dir)
-        and not settings.rebuild_vectorstore
-    ):
-        return Chroma(persist_directory=settings.chroma_dir, embedding_function=embedding)
 
-    os.makedirs(settings.chroma_dir, exist_ok=True)
+def build_embeddings(settings: Settings) -> OpenAIEmbeddings:
+    # Compatible endpoints expect raw strings rather than the token arrays
+    # sent after the tiktoken length check; chunks are well below the limit.
+    return OpenAIEmbeddings(
+        model=settings.embedding_model,
+        base_url=settings.openai_base_url or None,
+        check_embedding_ctx_length=not settings.openai_base_url,
+    )
+
+
+def embedding_namespace(settings: Settings) -> str:
+    # Vectors from a compatible or fake endpoint (OPENAI_BASE_URL) must never
+    # be served from the shared cache once the app points at the real API.
+    if settings.openai_base_url:
+        return f"{settings.embedding_model}@{settings.openai_base_url}"
+    return settings.embedding_model
+
 
+def build_cached_embeddings(settings: Settings) -> CachedEmbeddings:
+    store = EmbeddingStore(settings.embedding_cache_path) if settings.embedding_cache_path else None
+    return CachedEmbeddings(
+        build_embeddings(settings),
+        namespace=embedding_namespace(settings),
+        store=store,
+        memory_size=settings.embedding_cache_size,
+    )
+
+
+def build_web_fetcher(settings: Settings) -> WebFetcher:
+    return WebFetcher(
+        cache_dir=settings.web_cache_dir or None,
+        max_workers=settings.web_fetch_workers,
+        per_host=settings.web_fetch_per_host,
+        timeout=settings.web_fetch_timeout,
+        max_age_seconds=settings.web_cache_max_age_seconds,
+    )
+
+
+def update_knowledge_index(
+    settings: Settings,
+    vectorstore: Chroma,
+    dry_run: bool = False,
+    full: bool = False,
+) -> IndexReport:
+    failed: List[str] = []
     documents = load_documents(
         knowledge_dir=settings.knowledge_dir,
         web_sources=settings.web_sources,
         enable_web=settings.enable_web_sources,
+        fetcher=build_web_fetcher(settings),
+        failed=failed,
     )
     if not documents:
         raise RuntimeError("No se cargaron documentos de conocimiento.")
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=900, chunk_overlap=150)
-    splits = [doc for doc in splitter.split_documents(documents) if doc.page_content.strip()]
-    if not splits:
-        raise RuntimeError("No hay contenido util despues del split.")
+    return update_index(
+        vectorstore,
+        documents,
+        manifest_path(settings.chroma_dir),
+        settings.embedding_model,
+        dry_run=dry_run,
+        full=full,
+        keep_sources=failed,
+    )
+
 
-    vectorstore = Chroma.from_documents(
-        documents=splits,
-        embedding=embedding,
+def open_vectorstore(settings: Settings) -> Chroma:
+    os.makedirs(settings.chroma_dir, exist_ok=True)
+    return Chroma(
         persist_directory=settings.chroma_dir,
+        embedding_function=build_cached_embeddings(settings),
     )
+
+
+def build_vectorstore(settings: Settings) -> Chroma:
+    has_index = os.path.isdir(settings.chroma_dir) and os.listdir(settings.chroma_dir)
+    vectorstore = open_vectorstore(settings)
+    if not has_index or settings.rebuild_vectorstore:
+        update_knowledge_index(settings, vectorstore)
     return vectorstore
 
 
 def build_retriever(settings: Settings) -> CustomThresholdRetriever:
     vectorstore = build_vectorstore(settings)
+    lexical_index = None
+    if settings.retrieval_mode != "vector":
+        # Built from the collection at startup; restart the app after
+        # running the indexer in another process.
+        lexical_index = BM25Index.from_vectorstore(vectorstore)
     return CustomThresholdRetriever(
         vectorstore=vectorstore,
         threshold=settings.retriever_score_threshold,
         k=settings.retriever_k,
+        max_context_tokens=settings.context_max_tokens,
+        model_name=settings.model_name,
+        mode=settings.retrieval_mode,
+        lexical_index=lexical_index,
+        lexical_confidence=settings.lexical_confidence,
+        lexical_fusion_confidence=settings.lexical_fusion_confidence,
     )
 
 
 def build_chain(settings: Settings, retriever: CustomThresholdRetriever, memory) -> ConversationalRetrievalChain:
-    llm = ChatOpenAI(model=settings.model_name, temperature=settings.temperature)
     return ConversationalRetrievalChain.from_llm(
-        llm=llm,
+        llm=build_llm(settings),
         retriever=retriever,
         memory=memory,
         combine_docs_chain_kwargs={"prompt": build_prompt()},
         return_source_documents=False,
     )
+
+
+class CachedConversationalRetrievalChain(ConversationalRetrievalChain):
+    # Same flow as ConversationalRetrievalChain, with an answer cache between
+    # retrieval and the answer LLM call. The query embedding used for the
+    # Chroma search is reused for the similarity lookup.
+    answer_cache: SkipValidation[Optional[AnswerCache]] = None
+
+    def _call(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        if self.answer_cache is None or not isinstance(self.retriever, CustomThresholdRetriever):
+            return super()._call(inputs, run_manager)
+
+        _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        chat_history_str = (self.get_chat_history or _get_chat_history)(inputs["chat_history"])
+        question = inputs["question"]
+        if chat_history_str:
+            question = self.question_generator.run(
+                question=question,
+                chat_history=chat_history_str,
+                callbacks=_run_manager.get_child(),
+            )
+
+        docs, embedding = self.retriever.search(question)
+        docs = self._reduce_tokens_below_limit(docs)
+        chunk_ids = [chunk_id(doc) for doc in docs]
+        preference_context = inputs.get("preference_context", "")
+
+        hit = self.answer_cache.lookup(question, chunk_ids, preference_context, embedding)
+        if hit:
+            return {self.output_key: hit.answer, "cache_hit": hit.kind}
+
+        new_inputs = inputs.copy()
+        if self.rephrase_question:
+            new_inputs["question"] = question
+        new_inputs["chat_history"] = chat_history_str
+        answer = self.combine_docs_chain.run(
+            input_documents=docs,
+            callbacks=_run_manager.get_child(),
+            **new_inputs,
+        )
+        self.answer_cache.store(question, chunk_ids, answer, preference_context, embedding)
+        return {self.output_key: answer}
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def model_settings_key(settings: Settings) -> str:
+    return f"{settings.model_name}|{settings.temperature}|{hash_text(SYSTEM_PROMPT)}"
+
+
+class ChainPool:
+    # The LLM clients, prompt and chain skeletons are built once per worker.
+    # Each request gets a shallow copy that only swaps in its own memory, so
+    # the sub-chains and the HTTP client (and its keep-alive connections) are
+    # shared. The copies hold no other per-request state.
+
+    def __init__(
+        self,
+        settings: Settings,
+        retriever: CustomThresholdRetriever,
+        answer_cache: SkipValidation[Optional[AnswerCache]] = None,
+        llm: Optional[BaseChatModel] = None,
+        streaming_llm: Optional[BaseChatModel] = None,
+    ) -> None:
+        self.llm = llm or build_llm(settings)
+        self.streaming_llm = streaming_llm or build_llm(settings, streaming=True)
+        self.prompt = build_prompt()
+        self.skeleton = CachedConversationalRetrievalChain.from_llm(
+            llm=self.llm,
+            retriever=retriever,
+            combine_docs_chain_kwargs={"prompt": self.prompt},
+            return_source_documents=False,
+            answer_cache=answer_cache,
+        )
+        # Only the answer step streams; condensing the follow-up question
+        # stays a regular call so its tokens never reach the client.
+        self.streaming_skeleton = CachedConversationalRetrievalChain.from_llm(
+            llm=self.streaming_llm,
+            condense_question_llm=self.llm,
+            retriever=retriever,
+            combine_docs_chain_kwargs={"prompt": self.prompt},
+            return_source_documents=False,
+            answer_cache=answer_cache,
+        )
+
+    def get(self, memory, streaming: bool = False) -> ConversationalRetrievalChain:
+        skeleton = self.streaming_skeleton if streaming else self.skeleton
+        return skeleton.model_copy(update={"memory": memory})
@@ -15,6 +15,9 @@ class Settings:
     model_name: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
     temperature: float = float(os.getenv("OPENAI_TEMPERATURE", "0.6"))
     embedding_model: str = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+    openai_base_url: str = os.getenv("OPENAI_BASE_URL", "")
+    embedding_cache_path: str = os.getenv("EMBEDDING_CACHE_PATH", "data/embeddings.sqlite3")
+    embedding_cache_size: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
 
     secret_key: str = os.getenv("FLASK_SECRET_KEY", "dev-only-change-me")
 
@@ -23,14 +26,44 @@ class Settings:
     rebuild_vectorstore: bool = os.getenv("REBUILD_VECTORSTORE", "false").lower() == "true"
 
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///data/app.db")
+    sqlite_journal_mode: str = os.getenv("SQLITE_JOURNAL_MODE", "wal")
+    sqlite_synchronous: str = os.getenv("SQLITE_SYNCHRONOUS", "normal")
+    sqlite_busy_timeout_ms: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    db_pool_timeout: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    db_pool_recycle: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    known_users_cache_size: int = int(os.getenv("KNOWN_USERS_CACHE_SIZE", "10000"))
+    retention_days: int = int(os.getenv("RETENTION_DAYS", "180"))
+    archive_dir: str = os.getenv("ARCHIVE_DIR", "data/archive")
     enable_metrics: bool = os.getenv("ENABLE_METRICS", "false").lower() == "true"
+    enable_tracing: bool = os.getenv("ENABLE_TRACING", "false").lower() == "true"
+    telemetry_write_behind: bool = os.getenv("TELEMETRY_WRITE_BEHIND", "false").lower() == "true"
+    telemetry_flush_seconds: float = float(os.getenv("TELEMETRY_FLUSH_SECONDS", "1.0"))
 
     enable_web_sources: bool = os.getenv("ENABLE_WEB_SOURCES", "false").lower() == "true"
+    web_cache_dir: str = os.getenv("WEB_CACHE_DIR", "data/web_cache")
+    web_cache_max_age_seconds: int = int(os.getenv("WEB_CACHE_MAX_AGE_SECONDS", "3600"))
+    web_fetch_workers: int = int(os.getenv("WEB_FETCH_WORKERS", "8"))
+    web_fetch_per_host: int = int(os.getenv("WEB_FETCH_PER_HOST", "2"))
+    web_fetch_timeout: float = float(os.getenv("WEB_FETCH_TIMEOUT", "15"))
     retriever_k: int = int(os.getenv("RETRIEVER_K", "4"))
     retriever_score_threshold: float = float(
         os.getenv("RETRIEVER_SCORE_THRESHOLD", "0.3")
     )
+    retrieval_mode: str = os.getenv("RETRIEVAL_MODE", "vector")
+    lexical_confidence: float = float(os.getenv("LEXICAL_CONFIDENCE", "0.8"))
+    lexical_fusion_confidence: float = float(os.getenv("LEXICAL_FUSION_CONFIDENCE", "0.5"))
+    context_max_tokens: int = int(os.getenv("CONTEXT_MAX_TOKENS", "1000"))
     memory_window: int = int(os.getenv("MEMORY_WINDOW", "4"))
+    enable_token_memory: bool = os.getenv("ENABLE_TOKEN_MEMORY", "false").lower() == "true"
+    memory_max_tokens: int = int(os.getenv("MEMORY_MAX_TOKENS", "1500"))
+    memory_summary_tokens: int = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+
+    enable_answer_cache: bool = os.getenv("ENABLE_ANSWER_CACHE", "false").lower() == "true"
+    answer_cache_ttl_seconds: int = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+    answer_cache_max_entries: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+    answer_cache_similarity: float = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
 
     web_sources: tuple[str, ...] = (
         "https://www.dian.gov.co/tramitesservicios/Paginas/adicionresponsabilidad42obligadollevarcontabilidad.aspx",
@@ -1,22 +1,37 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import atexit
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from contextlib import contextmanager
-from typing import List, Optional
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 from pathlib import Path
 
 from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
     UniqueConstraint,
     create_engine,
+    event,
     func,
+    inspect,
+    text,
+    update,
 )
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+
+
+logger = logging.getLogger("sme_agent")
 
 
 Base = declarative_base()
@@ -51,6 +66,21 @@ class ChatMessage(Base):
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
+    # Serves "latest messages of a user" and history pages straight from the
+    # index; ids are unique, so the order never ties.
+    __table_args__ = (Index("ix_chat_messages_user_id_id", "user_id", "id"),)
+
+
+class ConversationSummary(Base):
+    # Rolling summary of a user's older turns (see services/memory.py):
+    # covers every message up to through_message_id.
+    __tablename__ = "conversation_summaries"
+
+    user_id = Column(String(36), ForeignKey("users.id"), primary_key=True)
+    summary = Column(Text, nullable=False)
+    through_message_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
 
 class LLMCall(Base):
     __tablename__ = "llm_calls"
@@ -64,30 +94,313 @@ class LLMCall(Base):
     total_tokens = Column(Integer, nullable=True)
     status = Column(String(20), nullable=False)
     error_message = Column(Text, nullable=True)
+    ttft_ms = Column(Integer, nullable=True)
+    request_id = Column(String(32), nullable=True, index=True)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
 
+class RequestSpan(Base):
+    # Stage timings of one request (see services/tracing.py). request_id
+    # joins them with the request's llm_calls row.
+    __tablename__ = "request_spans"
+
+    id = Column(Integer, primary_key=True)
+    request_id = Column(String(32), nullable=False, index=True)
+    branch = Column(String(30), nullable=True)
+    stage = Column(String(40), nullable=False)
+    start_ms = Column(Integer, nullable=False)
+    duration_ms = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+
+# LLM call rollups: one row per model and minute bucket with counters and
+# fixed-bin histograms (one column per bin). Rows are upserted in the same
+# transaction that inserts the llm_calls rows, so /metrics reads a number of
+# rows that depends on the window and the number of models, not on how many
+# calls were made.
+ROLLUP_BUCKET_SECONDS = 60
+LATENCY_BINS_MS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+TOKEN_BINS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+HISTOGRAM_BINS = {
+    "latency_ms": LATENCY_BINS_MS,
+    "total_tokens": TOKEN_BINS,
+    "ttft_ms": LATENCY_BINS_MS,
+}
+METRIC_WINDOWS = {"5m": 300, "1h": 3600, "24h": 86400, "7d": 7 * 86400}
+
+
+def _bin_columns(metric: str) -> List[str]:
+    return [f"{metric}_le_{bound}" for bound in HISTOGRAM_BINS[metric]] + [f"{metric}_le_inf"]
+
+
+_ROLLUP_COUNTERS = [
+    "calls",
+    "errors",
+    "cache_hits",
+    "latency_ms_sum",
+    "prompt_tokens_sum",
+    "completion_tokens_sum",
+    "total_tokens_sum",
+    "total_tokens_count",
+    "ttft_ms_sum",
+    "ttft_ms_count",
+] + [name for metric in HISTOGRAM_BINS for name in _bin_columns(metric)]
+
+
+class LLMCallRollup(Base):
+    __tablename__ = "llm_call_rollups"
+
+    id = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime, nullable=False)
+    model = Column(String(120), nullable=False)
+
+    __table_args__ = (UniqueConstraint("bucket_start", "model", name="uq_llm_rollup"),)
+
+
+for _name in _ROLLUP_COUNTERS:
+    setattr(LLMCallRollup, _name, Column(_name, Integer, nullable=False, default=0))
+del _name
+
+
+class AnswerCacheEntry(Base):
+    __tablename__ = "answer_cache"
+
+    id = Column(Integer, primary_key=True)
+    cache_key = Column(String(64), nullable=False, unique=True)
+    context_key = Column(String(64), nullable=False, index=True)
+    question = Column(Text, nullable=False)
+    embedding = Column(Text, nullable=True)
+    answer = Column(Text, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    last_used_at = Column(DateTime, server_default=func.now(), nullable=False, index=True)
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class TelemetryWriter:
+    # Write-behind buffer for telemetry rows (LLM calls): requests only
+    # append, and a background thread inserts the rows in batches.
+
+    def __init__(self, db: "Database", flush_interval: float = 1.0, max_batch: int = 500) -> None:
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._rows: List[Base] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, row: Base) -> None:
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= self.max_batch
+        if full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+        try:
+            with self.db.SessionLocal() as session:
+                session.add_all(rows)
+                apply_llm_rollups(self.db, session, [row for row in rows if isinstance(row, LLMCall)])
+                session.commit()
+        except Exception:
+            logger.exception("No se pudo guardar la telemetria (%s filas)", len(rows))
+            return 0
+        return len(rows)
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+
+_JOURNAL_MODES = {"delete", "truncate", "persist", "memory", "wal", "off"}
+_SYNCHRONOUS_LEVELS = {"off", "normal", "full", "extra"}
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    # SQLite files: WAL lets readers run while a writer commits, and
+    # synchronous=normal drops the fsync on every commit (in WAL mode a power
+    # loss can lose the last commits but not corrupt the file). busy_timeout
+    # makes a writer wait for the lock instead of failing with "database is
+    # locked". Empty values leave SQLite's defaults.
+    sqlite_journal_mode: str = "wal"
+    sqlite_synchronous: str = "normal"
+    sqlite_busy_timeout_ms: Optional[int] = 5000
+    # Connection pool, for SQLite files and server databases.
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30.0
+    pool_recycle: int = 1800
+
+    def __post_init__(self) -> None:
+        if self.sqlite_journal_mode and self.sqlite_journal_mode.lower() not in _JOURNAL_MODES:
+            raise ValueError(f"journal_mode de SQLite invalido: {self.sqlite_journal_mode}")
+        if self.sqlite_synchronous and self.sqlite_synchronous.lower() not in _SYNCHRONOUS_LEVELS:
+            raise ValueError(f"synchronous de SQLite invalido: {self.sqlite_synchronous}")
+
+
 @dataclass
 class Database:
     url: str
+    known_users_size: int = 10000
+    profile: StorageProfile = field(default_factory=StorageProfile)
 
     def __post_init__(self) -> None:
         connect_args = {}
+        engine_args = {}
+        sqlite_file = False
         if self.url.startswith("sqlite"):
             connect_args = {"check_same_thread": False}
-            if self.url.startswith("sqlite:///"):
+            if self.url.startswith("sqlite:///") and ":memory:" not in self.url:
+                sqlite_file = True
                 db_path = Path(self.url.replace("sqlite:///", ""))
                 if db_path.parent:
                     db_path.parent.mkdir(parents=True, exist_ok=True)
-        self.engine = create_engine(self.url, connect_args=connect_args)
-        self.SessionLocal = sessionmaker(bind=self.engine, autoflush=False, autocommit=False)
+        else:
+            # Server databases: drop connections the server closed while idle.
+            engine_args["pool_pre_ping"] = True
+        if sqlite_file or not self.url.startswith("sqlite"):
+            engine_args.update(
+                pool_size=self.profile.pool_size,
+                max_overflow=self.profile.max_overflow,
+                pool_timeout=self.profile.pool_timeout,
+                pool_recycle=self.profile.pool_recycle,
+            )
+        self.engine = create_engine(self.url, connect_args=connect_args, **engine_args)
+        if sqlite_file:
+            event.listen(self.engine, "connect", self._configure_sqlite)
+        # Helpers return ORM rows after their session closes; keep the loaded
+        # values instead of expiring them on commit.
+        self.SessionLocal = sessionmaker(
+            bind=self.engine, autoflush=False, autocommit=False, expire_on_commit=False
+        )
+        event.listen(self.SessionLocal, "before_commit", self._run_at_commit)
+        event.listen(self.SessionLocal, "after_flush", self._mark_flushed)
+        event.listen(self.SessionLocal, "after_soft_rollback", self._drop_at_commit)
+        self.telemetry: Optional[TelemetryWriter] = None
+        self._active: ContextVar[Optional[Session]] = ContextVar(f"db_session_{id(self)}", default=None)
+        self._request_commits: ContextVar[Optional[List[int]]] = ContextVar(
+            f"db_commits_{id(self)}", default=None
+        )
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._commits = 0
+        self._max_request_commits = 0
+        event.listen(self.engine, "commit", self._on_commit)
+        # User ids confirmed to exist in the database. Users are never
+        # deleted, so an id cached by one worker stays valid for all of them;
+        # a miss only costs one idempotent insert.
+        self._known_users: "OrderedDict[str, None]" = OrderedDict()
+        self._known_users_lock = threading.Lock()
+
+    def _configure_sqlite(self, dbapi_connection, connection_record) -> None:
+        pragmas = []
+        if self.profile.sqlite_busy_timeout_ms is not None:
+            pragmas.append(f"PRAGMA busy_timeout={int(self.profile.sqlite_busy_timeout_ms)}")
+        if self.profile.sqlite_journal_mode:
+            pragmas.append(f"PRAGMA journal_mode={self.profile.sqlite_journal_mode}")
+        if self.profile.sqlite_synchronous:
+            pragmas.append(f"PRAGMA synchronous={self.profile.sqlite_synchronous}")
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
 
     def init_db(self) -> None:
         Base.metadata.create_all(self.engine)
+        self._add_missing_columns()
+        self._add_missing_indexes()
+
+    def _add_missing_columns(self) -> None:
+        # create_all never alters existing tables; nullable columns added
+        # after a database was created are appended here.
+        inspector = inspect(self.engine)
+        with self.engine.begin() as connection:
+            for table in Base.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                existing = {column["name"] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing or not column.nullable:
+                        continue
+                    column_type = column.type.compile(dialect=self.engine.dialect)
+                    connection.execute(
+                        text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+                    )
+
+    def _add_missing_indexes(self) -> None:
+        # Same for indexes declared after a table was created.
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(self.engine, checkfirst=True)
 
     @contextmanager
     def session(self):
+        active = self._active.get()
+        if active is not None:
+            # Inside a unit of work: share its session, it commits once at
+            # the end.
+            yield active
+            return
+        session = self.SessionLocal()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    @contextmanager
+    def read_session(self):
+        # Reads through the unit of work's session would check out its
+        # connection and keep it until the final commit, across the LLM call,
+        # so they get a short session of their own that is closed, not
+        # committed. Once the unit of work has flushed writes (a saved
+        # preference), reads join it to see them.
+        active = self._active.get()
+        if active is not None and active.info.get("flushed"):
+            yield active
+            return
         session = self.SessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    @contextmanager
+    def unit_of_work(self):
+        # Every helper called inside the block joins one session and one
+        # transaction. With autoflush off, writes stay pending until the final
+        # commit, and statements that write right away (upserts) are queued
+        # with at_commit, so on SQLite no write lock is held while the block
+        # waits on the LLM.
+        if self._active.get() is not None:
+            yield self._active.get()
+            return
+        session = self.SessionLocal()
+        token = self._active.set(session)
         try:
             yield session
             session.commit()
@@ -95,14 +408,125 @@ class Database:
             session.rollback()
             raise
         finally:
+            self._active.reset(token)
             session.close()
 
+    def at_commit(self, session: Session, write: Callable[[Session], None]) -> None:
+        # Runs write(session) when the session commits, next to the flush of
+        # its pending rows: in a unit of work, at the end of the request.
+        session.info.setdefault("at_commit", []).append(write)
+
+    def _run_at_commit(self, session: Session) -> None:
+        for write in session.info.pop("at_commit", []):
+            write(session)
+
+    def _drop_at_commit(self, session: Session, previous_transaction) -> None:
+        session.info.pop("at_commit", None)
+
+    def _mark_flushed(self, session: Session, flush_context) -> None:
+        session.info["flushed"] = True
+
+    def is_known_user(self, user_id: str) -> bool:
+        with self._known_users_lock:
+            if user_id not in self._known_users:
+                return False
+            self._known_users.move_to_end(user_id)
+            return True
+
+    def remember_user(self, user_id: str) -> None:
+        with self._known_users_lock:
+            self._known_users[user_id] = None
+            self._known_users.move_to_end(user_id)
+            while len(self._known_users) > self.known_users_size:
+                self._known_users.popitem(last=False)
+
+    def enable_write_behind(self, flush_interval: float = 1.0) -> None:
+        if self.telemetry is None:
+            self.telemetry = TelemetryWriter(self, flush_interval=flush_interval)
+
+    def add_telemetry(self, *rows: Base) -> None:
+        if self.telemetry is not None:
+            for row in rows:
+                self.telemetry.add(row)
+            return
+        calls = [row for row in rows if isinstance(row, LLMCall)]
+        with self.session() as session:
+            session.add_all(rows)
+            if calls:
+                self.at_commit(session, lambda session: apply_llm_rollups(self, session, calls))
+
+    def _on_commit(self, connection) -> None:
+        counter = self._request_commits.get()
+        if counter is not None:
+            counter[0] += 1
+
+    def start_request(self) -> None:
+        self._request_commits.set([0])
+
+    def detach_request(self) -> Optional[List[int]]:
+        # A streamed body runs after teardown has finished the request; it takes
+        # the count with it and hands it back with resume_request.
+        counter = self._request_commits.get()
+        self._request_commits.set(None)
+        return counter
+
+    def resume_request(self, counter: Optional[List[int]]) -> None:
+        self._request_commits.set(counter)
+
+    def finish_request(self) -> int:
+        counter = self._request_commits.get()
+        if counter is None:
+            return 0
+        self._request_commits.set(None)
+        with self._stats_lock:
+            self._requests += 1
+            self._commits += counter[0]
+            self._max_request_commits = max(self._max_request_commits, counter[0])
+        return counter[0]
+
+    def commit_stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "requests": self._requests,
+                "commits": self._commits,
+                "commits_per_request": self._commits / self._requests if self._requests else 0.0,
+                "max_commits_per_request": self._max_request_commits,
+            }
+
+
+def _dialect_insert(db: Database):
+    # INSERT ... ON CONFLICT is dialect specific; None for dialects without it.
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert
+
+
+def _insert_user_statement(db: Database, user_id: str):
+    insert = _dialect_insert(db)
+    if insert is None:
+        return None
+    return insert(User).values(id=user_id).on_conflict_do_nothing(index_elements=[User.id])
+
 
 def ensure_user(db: Database, user_id: str) -> None:
-    with db.session() as session:
-        existing = session.get(User, user_id)
-        if not existing:
+    if db.is_known_user(user_id):
+        return
+    # A short transaction of its own, even inside a unit of work: there the
+    # insert would hold SQLite's write lock until the request (and its LLM
+    # call) ends. Rows written later reference a user that already exists.
+    with db.SessionLocal() as session:
+        statement = _insert_user_statement(db, user_id)
+        if statement is not None:
+            session.execute(statement)
+        elif session.get(User, user_id) is None:
             session.add(User(id=user_id))
+        session.commit()
+    db.remember_user(user_id)
 
 
 def save_chat_message(db: Database, user_id: str, role: str, content: str) -> None:
@@ -121,26 +545,32 @@ def save_preference(db: Database, user_id: str, key: str, value: str) -> None:
             pref.value = value
         else:
             session.add(UserPreference(user_id=user_id, key=key, value=value))
+        # Later reads in the same unit of work must see the new value.
+        session.flush()
 
 
-def list_preferences(db: Database, user_id: str) -> List[UserPreference]:
-    with db.session() as session:
-        return (
-            session.query(UserPreference)
+def list_preferences(
+    db: Database, user_id: str, limit: Optional[int] = None
+) -> List[Tuple[str, str]]:
+    with db.read_session() as session:
+        query = (
+            session.query(UserPreference.key, UserPreference.value)
             .filter(UserPreference.user_id == user_id)
             .order_by(UserPreference.key.asc())
-            .all()
         )
+        if limit is not None:
+            query = query.limit(limit)
+        return [(row.key, row.value) for row in query]
 
 
 def load_recent_messages(db: Database, user_id: str, limit: int) -> List[dict]:
     if limit <= 0:
         return []
-    with db.session() as session:
+    with db.read_session() as session:
         rows = (
-            session.query(ChatMessage)
+            session.query(ChatMessage.role, ChatMessage.content)
             .filter(ChatMessage.user_id == user_id)
-            .order_by(ChatMessage.created_at.desc())
+            .order_by(ChatMessage.id.desc())
             .limit(limit)
             .all())
     return [
@@ -148,6 +578,98 @@ def load_recent_messages(db: Database, user_id: str, limit: int) -> List[dict]:
         for row in reversed(rows)]
 
 
+def load_messages_after(
+    db: Database, user_id: str, after_id: int, limit: int
+) -> List[dict]:
+    # The newest `limit` messages with id > after_id, in chronological order.
+    with db.read_session() as session:
+        rows = (
+            session.query(ChatMessage.id, ChatMessage.role, ChatMessage.content)
+            .filter(ChatMessage.user_id == user_id, ChatMessage.id > after_id)
+            .order_by(ChatMessage.id.desc())
+            .limit(limit)
+            .all())
+    return [
+        {"id": row.id, "role": row.role, "content": row.content}
+        for row in reversed(rows)]
+
+
+def load_conversation_summary(db: Database, user_id: str) -> Tuple[str, int]:
+    with db.read_session() as session:
+        row = session.get(ConversationSummary, user_id)
+    if row is None:
+        return "", 0
+    return row.summary, row.through_message_id
+
+
+def save_conversation_summary(
+    db: Database, user_id: str, summary: str, through_message_id: int
+) -> None:
+    # Own short transaction, like ensure_user: it is written before the LLM
+    # call. The summary only moves forward, so when two requests of the same
+    # user fold concurrently the one covering more messages wins.
+    values = {
+        "user_id": user_id,
+        "summary": summary,
+        "through_message_id": through_message_id,
+        "updated_at": utcnow(),
+    }
+    with db.SessionLocal() as session:
+        insert = _dialect_insert(db)
+        if insert is not None:
+            statement = insert(ConversationSummary).values(**values)
+            session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[ConversationSummary.user_id],
+                    set_={
+                        "summary": statement.excluded.summary,
+                        "through_message_id": statement.excluded.through_message_id,
+                        "updated_at": statement.excluded.updated_at,
+                    },
+                    where=(
+                        ConversationSummary.through_message_id
+                        < statement.excluded.through_message_id
+                    ),
+                )
+            )
+        else:
+            row = session.get(ConversationSummary, user_id)
+            if row is None:
+                session.add(ConversationSummary(**values))
+            elif row.through_message_id < through_message_id:
+                row.summary = summary
+                row.through_message_id = through_message_id
+                row.updated_at = values["updated_at"]
+        session.commit()
+
+
+def list_message_page(
+    db: Database, user_id: str, limit: int, before_id: Optional[int] = None
+) -> Tuple[List[dict], Optional[int]]:
+    # Keyset pagination over (user_id, id): each page is an index range scan
+    # of `limit` rows, however long the conversation is. Returns the page in
+    # chronological order and the cursor for the next (older) page.
+    with db.session() as session:
+        query = session.query(
+            ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at
+        ).filter(ChatMessage.user_id == user_id)
+        if before_id is not None:
+            query = query.filter(ChatMessage.id < before_id)
+        rows = query.order_by(ChatMessage.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    messages = [
+        {
+            "id": row.id,
+            "role": row.role,
+            "content": row.content,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+        }
+        for row in reversed(rows)]
+    next_before = rows[-1].id if has_more else None
+    return messages, next_before
+
+
 def save_llm_call(
     db: Database,
     user_id: str,
@@ -157,30 +679,407 @@ def save_llm_call(
     completion_tokens: Optional[int],
     total_tokens: Optional[int],
     status: str,
-    error_message: Optional[str],) -> None:
-    with db.session() as session:
-        session.add(
-            LLMCall(
-                user_id=user_id,
-                model=model,
-                latency_ms=latency_ms,
-                prompt_tokens=prompt_tokens,
-                completion_tokens=completion_tokens,
-                total_tokens=total_tokens,
-                status=status,
-                error_message=error_message,))
-
-
-def get_llm_stats(db: Database) -> dict:
+    error_message: Optional[str],
+    ttft_ms: Optional[int] = None,
+    request_id: Optional[str] = None,) -> None:
+    db.add_telemetry(
+        LLMCall(
+            user_id=user_id,
+            created_at=utcnow(),
+            model=model,
+            latency_ms=latency_ms,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=total_tokens,
+            status=status,
+            error_message=error_message,
+            ttft_ms=ttft_ms,
+            request_id=request_id,))
+
+
+def save_request_spans(
+    db: Database, request_id: str, branch: Optional[str], spans: Iterable
+) -> None:
+    now = utcnow()
+    db.add_telemetry(
+        *[
+            RequestSpan(
+                request_id=request_id,
+                branch=branch,
+                stage=span.stage,
+                start_ms=span.start_ms,
+                duration_ms=span.duration_ms,
+                created_at=now,
+            )
+            for span in spans
+        ]
+    )
+
+
+def _nearest_rank(values: List[int], quantile: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return float(values[min(len(values) - 1, int(len(values) * quantile))])
+
+
+def get_stage_breakdown(
+    db: Database,
+    window: str = "1h",
+    branch: str = "llm",
+    quantile: float = 0.95,
+    now: Optional[datetime] = None,
+) -> dict:
+    # Per-stage timings for one branch, plus the mean of each stage within
+    # the requests at or above the given quantile of total time: the stage
+    # with the largest share there is the one that dominates the tail.
+    if window != "all" and window not in METRIC_WINDOWS:
+        raise ValueError(f"Ventana desconocida: {window}")
     with db.session() as session:
-        total = session.query(LLMCall).count()
-        errors = session.query(LLMCall).filter(LLMCall.status == "error").count()
-        avg_latency = session.query(func.avg(LLMCall.latency_ms)).scalar() or 0
-        avg_tokens = session.query(func.avg(LLMCall.total_tokens)).scalar() or 0
+        query = session.query(
+            RequestSpan.request_id, RequestSpan.stage, RequestSpan.duration_ms
+        ).filter(RequestSpan.branch == branch)
+        if window != "all":
+            since = (now or utcnow()) - timedelta(seconds=METRIC_WINDOWS[window])
+            query = query.filter(RequestSpan.created_at >= since)
+        rows = query.all()
 
+    per_request: Dict[str, Dict[str, int]] = {}
+    for request_id, stage, duration_ms in rows:
+        stages = per_request.setdefault(request_id, {})
+        stages[stage] = stages.get(stage, 0) + duration_ms
+    totals = [stages["total"] for stages in per_request.values() if "total" in stages]
+    threshold = _nearest_rank(totals, quantile)
+    slow = [
+        stages
+        for stages in per_request.values()
+        if threshold is not None and stages.get("total", -1) >= threshold
+    ]
+
+    names = sorted({stage for stages in per_request.values() for stage in stages})
+    breakdown = {}
+    for stage in names:
+        durations = [stages[stage] for stages in per_request.values() if stage in stages]
+        slow_mean = sum(stages.get(stage, 0) for stages in slow) / len(slow) if slow else 0.0
+        breakdown[stage] = {
+            "count": len(durations),
+            "avg_ms": sum(durations) / len(durations),
+            "p50_ms": _nearest_rank(durations, 0.5),
+            "p95_ms": _nearest_rank(durations, 0.95),
+            "avg_ms_in_tail": slow_mean,
+        }
     return {
+        "window": window,
+        "branch": branch,
+        "requests": len(totals),
+        "tail_threshold_ms": threshold,
+        "tail_requests": len(slow),
+        "stages": breakdown,
+    }
+
+
+def _bucket_start(moment: datetime) -> datetime:
+    seconds = int(moment.replace(tzinfo=timezone.utc).timestamp())
+    bucket = seconds - seconds % ROLLUP_BUCKET_SECONDS
+    return datetime.fromtimestamp(bucket, timezone.utc).replace(tzinfo=None)
+
+
+def _rollup_increments(rows: Iterable, counters: Optional[dict] = None) -> dict:
+    # rows are LLMCall objects or column tuples with the same names.
+    counters = {} if counters is None else counters
+    for row in rows:
+        key = (_bucket_start(row.created_at or utcnow()), row.model or "")
+        values = counters.get(key)
+        if values is None:
+            values = counters[key] = dict.fromkeys(_ROLLUP_COUNTERS, 0)
+        values["calls"] += 1
+        if row.status == "cache_hit":
+            values["cache_hits"] += 1
+            continue
+        if row.status == "error":
+            values["errors"] += 1
+        values["latency_ms_sum"] += row.latency_ms
+        values["prompt_tokens_sum"] += row.prompt_tokens or 0
+        values["completion_tokens_sum"] += row.completion_tokens or 0
+        observed = {"latency_ms": row.latency_ms}
+        if row.total_tokens is not None:
+            values["total_tokens_sum"] += row.total_tokens
+            values["total_tokens_count"] += 1
+            observed["total_tokens"] = row.total_tokens
+        if row.ttft_ms is not None:
+            values["ttft_ms_sum"] += row.ttft_ms
+            values["ttft_ms_count"] += 1
+            observed["ttft_ms"] = row.ttft_ms
+        for metric, value in observed.items():
+            bin_index = bisect.bisect_left(HISTOGRAM_BINS[metric], value)
+            values[_bin_columns(metric)[bin_index]] += 1
+    return counters
+
+
+def _write_rollups(db: Database, session: Session, counters: dict) -> None:
+    if not counters:
+        return
+    params = [
+        {"bucket_start": bucket_start, "model": model, **values}
+        for (bucket_start, model), values in counters.items()
+    ]
+    insert = _dialect_insert(db)
+    if insert is not None:
+        statement = insert(LLMCallRollup)
+        statement = statement.on_conflict_do_update(
+            index_elements=["bucket_start", "model"],
+            set_={
+                name: getattr(LLMCallRollup, name) + statement.excluded[name]
+                for name in _ROLLUP_COUNTERS
+            },
+        )
+        session.execute(statement, params)
+        return
+    for values in params:
+        row = (
+            session.query(LLMCallRollup)
+            .filter_by(bucket_start=values["bucket_start"], model=values["model"])
+            .one_or_none()
+        )
+        if row is None:
+            session.add(LLMCallRollup(**values))
+        else:
+            for name in _ROLLUP_COUNTERS:
+                setattr(row, name, getattr(row, name) + values[name])
+    session.flush()
+
+
+def apply_llm_rollups(db: Database, session: Session, rows: List[LLMCall]) -> None:
+    _write_rollups(db, session, _rollup_increments(rows))
+
+
+def rebuild_llm_rollups(db: Database, batch_size: int = 10000, force: bool = False) -> int:
+    # Recomputes the rollups from llm_calls, for databases created before the
+    # rollup table existed. Memory is bounded by buckets times models. Rows
+    # already archived out of llm_calls would drop out of the rebuilt
+    # rollups, so existing rollups are only replaced with force.
+    columns = (
+        LLMCall.created_at,
+        LLMCall.model,
+        LLMCall.status,
+        LLMCall.latency_ms,
+        LLMCall.prompt_tokens,
+        LLMCall.completion_tokens,
+        LLMCall.total_tokens,
+        LLMCall.ttft_ms,
+    )
+    counters: dict = {}
+    processed = 0
+    with db.session() as session:
+        if not force and session.query(LLMCallRollup.bucket_start).first() is not None:
+            raise RuntimeError(
+                "llm_call_rollups ya tiene datos; reconstruirlos desde llm_calls pierde las "
+                "llamadas archivadas. Usa --force para reemplazarlos igual."
+            )
+        session.query(LLMCallRollup).delete(synchronize_session=False)
+        for row in session.query(*columns).yield_per(batch_size):
+            _rollup_increments([row], counters)
+            processed += 1
+        _write_rollups(db, session, counters)
+    return processed
+
+
+def histogram_quantile(
+    quantile: float, bins: Tuple[int, ...], counts: Dict[int, int]
+) -> Optional[float]:
+    # Linear interpolation inside the bin holding the quantile, like
+    # Prometheus' histogram_quantile. The overflow bin reports its lower bound.
+    total = sum(counts.values())
+    if not total:
+        return None
+    rank = quantile * total
+    cumulative = 0
+    for index in range(len(bins) + 1):
+        count = counts.get(index, 0)
+        if count and cumulative + count >= rank:
+            if index == len(bins):
+                return float(bins[-1])
+            lower = bins[index - 1] if index else 0
+            return lower + (bins[index] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return float(bins[-1])
+
+
+def _summarize(values: Dict[str, int]) -> dict:
+    total = values["calls"]
+    model_calls = total - values["cache_hits"]
+    summary = {
         "total_calls": total,
-        "error_calls": errors,
-        "error_rate": float(errors) / total if total else 0.0,
-        "avg_latency_ms": float(avg_latency),
-        "avg_total_tokens": float(avg_tokens)}
+        "error_calls": values["errors"],
+        "error_rate": float(values["errors"]) / total if total else 0.0,
+        "cache_hits": values["cache_hits"],
+        "cache_hit_rate": float(values["cache_hits"]) / total if total else 0.0,
+        "avg_latency_ms": float(values["latency_ms_sum"]) / model_calls if model_calls else 0.0,
+        "avg_total_tokens": (
+            float(values["total_tokens_sum"]) / values["total_tokens_count"]
+            if values["total_tokens_count"]
+            else 0.0
+        ),
+        "avg_ttft_ms": (
+            float(values["ttft_ms_sum"]) / values["ttft_ms_count"]
+            if values["ttft_ms_count"]
+            else None
+        ),
+        "prompt_tokens": values["prompt_tokens_sum"],
+        "completion_tokens": values["completion_tokens_sum"],
+    }
+    for metric, bins in HISTOGRAM_BINS.items():
+        counts = dict(enumerate(values[name] for name in _bin_columns(metric)))
+        summary[metric] = {
+            label: histogram_quantile(quantile, bins, counts)
+            for label, quantile in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+        }
+    return summary
+
+
+def get_llm_stats(db: Database, window: str = "1h", now: Optional[datetime] = None) -> dict:
+    # Reads only the rollup table. window is one of METRIC_WINDOWS or "all".
+    if window != "all" and window not in METRIC_WINDOWS:
+        raise ValueError(f"Ventana desconocida: {window}")
+
+    with db.session() as session:
+        query = session.query(
+            LLMCallRollup.model,
+            *[func.sum(getattr(LLMCallRollup, name)) for name in _ROLLUP_COUNTERS],
+        ).group_by(LLMCallRollup.model)
+        if window != "all":
+            since = _bucket_start((now or utcnow()) - timedelta(seconds=METRIC_WINDOWS[window]))
+            query = query.filter(LLMCallRollup.bucket_start >= since)
+        rows = query.all()
+
+    totals = dict.fromkeys(_ROLLUP_COUNTERS, 0)
+    per_model: Dict[str, Dict[str, int]] = {}
+    for row in rows:
+        values = {name: int(value or 0) for name, value in zip(_ROLLUP_COUNTERS, row[1:])}
+        per_model[row[0]] = values
+        for name, value in values.items():
+            totals[name] += value
+
+    stats = _summarize(totals)
+    stats["window"] = window
+    stats["models"] = {
+        model or "desconocido": _summarize(values) for model, values in sorted(per_model.items())
+    }
+    return stats
+
+
+def get_cached_answer(db: Database, cache_key: str, min_created_at: datetime) -> Optional[str]:
+    with db.read_session() as session:
+        entry = (
+            session.query(AnswerCacheEntry.id, AnswerCacheEntry.answer)
+            .filter(
+                AnswerCacheEntry.cache_key == cache_key,
+                AnswerCacheEntry.created_at >= min_created_at,
+            )
+            .one_or_none()
+        )
+    if not entry:
+        return None
+    touch_cached_answer(db, entry.id)
+    return entry.answer
+
+
+def list_cached_answer_candidates(
+    db: Database, context_key: str, min_created_at: datetime, limit: int
+) -> List[Tuple[int, str, str]]:
+    with db.read_session() as session:
+        rows = (
+            session.query(AnswerCacheEntry.id, AnswerCacheEntry.embedding, AnswerCacheEntry.answer)
+            .filter(
+                AnswerCacheEntry.context_key == context_key,
+                AnswerCacheEntry.created_at >= min_created_at,
+                AnswerCacheEntry.embedding.isnot(None),
+            )
+            .order_by(AnswerCacheEntry.last_used_at.desc())
+            .limit(limit)
+            .all()
+        )
+    return [(row.id, row.embedding, row.answer) for row in rows]
+
+
+def touch_cached_answer(db: Database, entry_id: int) -> None:
+    statement = (
+        update(AnswerCacheEntry)
+        .where(AnswerCacheEntry.id == entry_id)
+        .values(hits=AnswerCacheEntry.hits + 1, last_used_at=utcnow())
+    )
+    with db.session() as session:
+        db.at_commit(session, lambda session: session.execute(statement))
+
+
+def save_cached_answer(
+    db: Database,
+    cache_key: str,
+    context_key: str,
+    question: str,
+    embedding: Optional[str],
+    answer: str,) -> None:
+    # Two users asking the same uncached question both miss and both store
+    # it; the upsert makes the second write replace the first instead of
+    # failing on the unique cache_key.
+    now = utcnow()
+    values = {
+        "cache_key": cache_key,
+        "context_key": context_key,
+        "question": question,
+        "embedding": embedding,
+        "answer": answer,
+        "created_at": now,
+        "last_used_at": now,
+    }
+
+    def write(session: Session) -> None:
+        insert = _dialect_insert(db)
+        if insert is not None:
+            statement = insert(AnswerCacheEntry).values(**values)
+            session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[AnswerCacheEntry.cache_key],
+                    set_={
+                        name: statement.excluded[name]
+                        for name in ("answer", "embedding", "created_at", "last_used_at")
+                    },
+                )
+            )
+            return
+        entry = (
+            session.query(AnswerCacheEntry)
+            .filter(AnswerCacheEntry.cache_key == cache_key)
+            .one_or_none()
+        )
+        if entry:
+            for name in ("answer", "embedding", "created_at", "last_used_at"):
+                setattr(entry, name, values[name])
+        else:
+            session.add(AnswerCacheEntry(**values))
+
+    with db.session() as session:
+        db.at_commit(session, write)
+
+
+def evict_cached_answers(db: Database, min_created_at: datetime, max_entries: int) -> int:
+    with db.session() as session:
+        removed = (
+            session.query(AnswerCacheEntry)
+            .filter(AnswerCacheEntry.created_at < min_created_at)
+            .delete(synchronize_session=False)
+        )
+        overflow = session.query(AnswerCacheEntry).count() - max_entries
+        if overflow > 0:
+            stale_ids = [
+                row.id
+                for row in session.query(AnswerCacheEntry.id)
+                .order_by(AnswerCacheEntry.last_used_at.asc())
+                .limit(overflow)
+            ]
+            removed += (
+                session.query(AnswerCacheEntry)
+                .filter(AnswerCacheEntry.id.in_(stale_ids))
+                .delete(synchronize_session=False)
+            )
+    return removed
@@ -4,34 +4,53 @@ import logging
 import os
 import time
 import uuid
+from typing import Optional, Tuple
 
-from flask import Flask, jsonify, render_template, request, session
+from flask import Flask, Response, g, jsonify, render_template, request, session, stream_with_context
 from markdown import markdown
 import bleach
 
-from sme_agent.chains import build_chain, build_retriever
+from sme_agent.chains import ChainPool, build_retriever, model_settings_key
 from sme_agent.config import Settings, require_openai_key
 from sme_agent.db import (
     Database,
+    StorageProfile,
     ensure_user,
     get_llm_stats,
-    list_preferences,
+    get_stage_breakdown,
+    list_message_page,
     load_recent_messages,
     save_chat_message,
     save_llm_call,
-    save_preference,
+    save_request_spans,
 )
 from sme_agent.prompts import INFO_MESSAGE, QUICK_REPLIES, SUBTITLE, TITLE
-from sme_agent.services.classification import RESPUESTAS_RAPIDAS, classify_text, normalize_text
+from sme_agent.services.classification import RESPUESTAS_RAPIDAS, classify_text
 from sme_agent.services.advisor import maybe_handle_calculator
+from sme_agent.services.answer_cache import AnswerCache
+from sme_agent.services.calculators import extract_amounts
 from sme_agent.services.history import build_memory, get_ui_messages, reset_session_state
+from sme_agent.services.memory import TokenBudgetMemory
+from sme_agent.services.metrics import observe_branch, observe_llm_call, render_latest
 from sme_agent.services.monitoring import LLMMonitor
 from sme_agent.services.preferences import (
+    PreferenceStore,
     build_preference_context,
     format_preferences,
     is_show_preferences,
     parse_save_command,
 )
+from sme_agent.services.scenarios import run_scenarios
+from sme_agent.services.streaming import StreamCancelled, TokenStream, sse_event
+from sme_agent.services.tracing import (
+    SpanCallback,
+    current_trace,
+    instrument_sessions,
+    set_branch,
+    span,
+    start_trace,
+)
+from sme_agent.services.utterance import Utterance
 
 
 ALLOWED_TAGS = [
@@ -49,9 +68,24 @@ ALLOWED_TAGS = [
 ]
 ALLOWED_ATTRIBUTES = {"code": ["class"], "pre": ["class"], "a": ["href", "title"]}
 
+LLM_ERROR_MESSAGE = (
+    "Ocurrio un problema generando la respuesta. "
+    "Intenta de nuevo o ajusta la pregunta."
+)
+
+
+def normalize_answer(raw: str) -> str:
+    return raw.replace("\\(", "(").replace("\\)", ")")
+
+
+def render_answer(raw: str) -> str:
+    with span("render"):
+        html = markdown(raw, extensions=["extra"])
+        return bleach.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, strip=True)
+
 
-def create_app() -> Flask:
-    settings = Settings()
+def create_app(settings: Optional[Settings] = None) -> Flask:
+    settings = settings or Settings()
     require_openai_key(settings)
     os.environ["OPENAI_API_KEY"] = settings.openai_api_key
 
@@ -62,8 +96,66 @@ def create_app() -> Flask:
     app.config["SECRET_KEY"] = settings.secret_key
     app.config["SETTINGS"] = settings
     app.config["RETRIEVER"] = build_retriever(settings)
-    app.config["DB"] = Database(settings.database_url)
+    app.config["DB"] = Database(
+        settings.database_url,
+        known_users_size=settings.known_users_cache_size,
+        profile=StorageProfile(
+            sqlite_journal_mode=settings.sqlite_journal_mode,
+            sqlite_synchronous=settings.sqlite_synchronous,
+            sqlite_busy_timeout_ms=settings.sqlite_busy_timeout_ms,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+        ),
+    )
     app.config["DB"].init_db()
+    if settings.telemetry_write_behind:
+        app.config["DB"].enable_write_behind(settings.telemetry_flush_seconds)
+    answer_cache = None
+    if settings.enable_answer_cache:
+        answer_cache = AnswerCache(
+            db=app.config["DB"],
+            settings_key=model_settings_key(settings),
+            ttl_seconds=settings.answer_cache_ttl_seconds,
+            max_entries=settings.answer_cache_max_entries,
+            similarity_threshold=settings.answer_cache_similarity,
+        )
+    app.config["CHAINS"] = ChainPool(settings, app.config["RETRIEVER"], answer_cache)
+    app.config["PREFERENCES"] = PreferenceStore(
+        app.config["DB"], max_users=settings.known_users_cache_size
+    )
+    app.config["MEMORY"] = None
+    if settings.enable_token_memory:
+        app.config["MEMORY"] = TokenBudgetMemory(
+            db=app.config["DB"],
+            llm=app.config["CHAINS"].llm,
+            max_tokens=settings.memory_max_tokens,
+            summary_tokens=settings.memory_summary_tokens,
+            model=settings.model_name,
+        )
+
+    if settings.enable_tracing:
+        instrument_sessions(app.config["DB"].SessionLocal)
+
+    @app.before_request
+    def start_request_tracking():
+        app.config["DB"].start_request()
+        if settings.enable_tracing and request.endpoint in ("index", "chat_stream"):
+            g.trace = start_trace()
+
+    def save_trace(trace) -> None:
+        if trace is None:
+            return
+        try:
+            save_request_spans(app.config["DB"], trace.request_id, trace.branch, trace.finish())
+        except Exception:
+            logger.exception("No se pudieron guardar los tiempos por etapa")
+
+    @app.teardown_request
+    def finish_request_tracking(exc):
+        save_trace(g.pop("trace", None))
+        app.config["DB"].finish_request()
 
     @app.get("/health")
     def health():
@@ -73,127 +165,303 @@ def create_app() -> Flask:
 
         @app.get("/metrics")
         def metrics():
-            stats = get_llm_stats(app.config["DB"])
+            try:
+                stats = get_llm_stats(app.config["DB"], window=request.args.get("window", "1h"))
+            except ValueError as exc:
+                return jsonify({"error": str(exc)}), 400
+            stats["db"] = app.config["DB"].commit_stats()
             return jsonify(stats)
 
-    @app.route("/", methods=["GET", "POST"])
-    def index():
+        @app.get("/metrics/prometheus")
+        def prometheus_metrics():
+            body, content_type = render_latest()
+            return Response(body, content_type=content_type)
+
+        @app.get("/metrics/stages")
+        def stage_metrics():
+            try:
+                breakdown = get_stage_breakdown(
+                    app.config["DB"],
+                    window=request.args.get("window", "1h"),
+                    branch=request.args.get("branch", "llm"),
+                )
+            except ValueError as exc:
+                return jsonify({"error": str(exc)}), 400
+            return jsonify(breakdown)
+
+    @app.post("/api/scenarios")
+    def scenarios():
+        payload = request.get_json(silent=True) or {}
+        try:
+            base = extract_amounts(str(payload.get("text", "")))
+            base.update(
+                {key: float(value) for key, value in (payload.get("base") or {}).items()}
+            )
+            spreads = {
+                key: float(value) for key, value in (payload.get("spreads") or {}).items()
+            }
+            grid = run_scenarios(
+                str(payload.get("model", "")),
+                base,
+                spreads=spreads,
+                steps=int(payload.get("steps", 11)),
+            )
+            result = grid.to_dict(include_grid=bool(payload.get("include_grid", False)))
+        except (AttributeError, TypeError, ValueError) as exc:
+            return jsonify({"error": str(exc)}), 400
+        return jsonify(result)
+
+    @app.get("/api/history")
+    def history():
+        try:
+            limit = min(max(int(request.args.get("limit", 50)), 1), 200)
+            before = request.args.get("before")
+            before_id = int(before) if before else None
+        except ValueError:
+            return jsonify({"error": "Los parametros limit y before deben ser enteros."}), 400
+        user_id = session.get("user_id")
+        if not user_id:
+            return jsonify({"messages": [], "next_before": None})
+        messages, next_before = list_message_page(
+            app.config["DB"], user_id, limit, before_id=before_id
+        )
+        return jsonify({"messages": messages, "next_before": next_before})
+
+    def current_user_id() -> str:
         user_id = session.get("user_id")
         if not user_id:
             user_id = str(uuid.uuid4())
             session["user_id"] = user_id
         ensure_user(app.config["DB"], user_id)
+        return user_id
+
+    def preferences_version() -> int:
+        return session.get("preferences_version", 0)
+
+    def answer_without_llm(
+        user_id: str, text: str, utterance: Utterance
+    ) -> Optional[Tuple[str, str]]:
+        # Returns (branch, answer) for messages answered without the LLM.
+        save_command = parse_save_command(utterance)
+        if save_command:
+            save_chat_message(app.config["DB"], user_id, "user", text)
+            key, value = save_command
+            app.config["PREFERENCES"].save(user_id, key, value)
+            session["preferences_version"] = preferences_version() + 1
+            return (
+                "save_preference",
+                f"Listo. Guarde {key} = {value}. Si quieres verlos, escribe: mis datos.",
+            )
+        if is_show_preferences(utterance):
+            save_chat_message(app.config["DB"], user_id, "user", text)
+            prefs = app.config["PREFERENCES"].items(user_id, preferences_version())
+            return "show_preferences", format_preferences(prefs)
+        tipo = classify_text(utterance)
+        if tipo != "consulta":
+            save_chat_message(app.config["DB"], user_id, "user", text)
+            return "quick_reply", RESPUESTAS_RAPIDAS[tipo]
+        if utterance.normalized == "informacion":
+            save_chat_message(app.config["DB"], user_id, "user", text)
+            return "info", INFO_MESSAGE
+        calculator_response = maybe_handle_calculator(utterance)
+        if calculator_response:
+            save_chat_message(app.config["DB"], user_id, "user", text)
+            return "calculator", calculator_response
+        return None
 
-        if request.method == "GET":
-            reset_session_state(session)
-
-        ui_messages = get_ui_messages(session)
-
-        if request.method == "POST":
-            text = request.form.get("user_input", "").strip()
-            if text:
-                ui_messages.append({"sender": "user", "text": text})
-
-                normalized = normalize_text(text.lower())
-                save_command = parse_save_command(text)
-                if save_command:
-                    save_chat_message(app.config["DB"], user_id, "user", text)
-                    key, value = save_command
-                    save_preference(app.config["DB"], user_id, key, value)
-                    raw = (
-                        f"Listo. Guarde {key} = {value}. "
-                        "Si quieres verlos, escribe: mis datos."
+    def record_branch(branch: str, started_at: float) -> None:
+        observe_branch(branch, started_at)
+        set_branch(branch)
+
+    def start_llm_turn(user_id: str, text: str):
+        with span("history_load"):
+            if app.config["MEMORY"] is not None:
+                memory = app.config["MEMORY"].build(user_id)
+            else:
+                history_items = load_recent_messages(
+                    app.config["DB"], user_id, settings.memory_window * 2
+                )
+                memory = build_memory(session, settings.memory_window, chat_items=history_items)
+        save_chat_message(app.config["DB"], user_id, "user", text)
+        return memory
+
+    def invoke_chain(
+        user_id: str, text: str, memory, token_stream: Optional[TokenStream] = None
+    ) -> str:
+        chain = app.config["CHAINS"].get(memory, streaming=token_stream is not None)
+        monitor = LLMMonitor()
+        callbacks = [monitor] + ([token_stream] if token_stream else [])
+        trace = current_trace()
+        if trace is not None:
+            callbacks.append(SpanCallback(trace))
+        start_time = time.monotonic()
+        status = "ok"
+        error_message = None
+        try:
+            prefs = app.config["PREFERENCES"].items(user_id, preferences_version())
+            preference_context = build_preference_context(prefs)
+            question_text = text
+            if preference_context:
+                question_text = f"{text}\n\n{preference_context}"
+            chain_inputs = {
+                "question": question_text,
+                "preference_context": preference_context,
+            }
+            if hasattr(chain, "invoke"):
+                result = chain.invoke(chain_inputs, config={"callbacks": callbacks})
+            else:
+                result = chain(chain_inputs, callbacks=callbacks)
+            raw = result["answer"]
+            if result.get("cache_hit"):
+                status = "cache_hit"
+        except StreamCancelled as exc:
+            status = "cancelled"
+            error_message = str(exc)
+            raw = LLM_ERROR_MESSAGE
+        except Exception as exc:
+            status = "error"
+            error_message = str(exc)
+            raw = LLM_ERROR_MESSAGE
+            logger.exception("Error en llamada a la cadena")
+
+        latency_ms = int((time.monotonic() - start_time) * 1000)
+        usage = monitor.usage
+        save_llm_call(
+            app.config["DB"],
+            user_id,
+            usage.model or settings.model_name,
+            latency_ms,
+            usage.prompt_tokens,
+            usage.completion_tokens,
+            usage.total_tokens,
+            status,
+            error_message,
+            ttft_ms=token_stream.ttft_ms if token_stream else None,
+            request_id=trace.request_id if trace else None,
+        )
+        observe_llm_call(status, token_stream.ttft_ms if token_stream else None)
+        return raw
+
+    def finish_answer(user_id: str, raw: str) -> str:
+        raw = normalize_answer(raw)
+        save_chat_message(app.config["DB"], user_id, "assistant", raw)
+        return raw
+
+    @app.post("/api/chat/stream")
+    def chat_stream():
+        payload = request.get_json(silent=True) or request.form
+        text = str(payload.get("user_input", "")).strip()
+        if not text:
+            return jsonify({"error": "Escribe un mensaje."}), 400
+
+        # The user's message is committed before streaming starts; the LLM
+        # call and the answer share a second transaction.
+        started_at = time.monotonic()
+        with app.config["DB"].unit_of_work():
+            user_id = current_user_id()
+            utterance = Utterance.from_text(text)
+            with span("routing"):
+                routed = answer_without_llm(user_id, text, utterance)
+            if routed is not None:
+                branch, raw = routed
+                raw = finish_answer(user_id, raw)
+                done = {"html": render_answer(raw)}
+                if branch == "save_preference":
+                    # The page is not reloaded, so the sidebar is redrawn from here.
+                    done["preferences"] = app.config["PREFERENCES"].sidebar(
+                        user_id, preferences_version()
                     )
-                elif is_show_preferences(text):
-                    save_chat_message(app.config["DB"], user_id, "user", text)
-                    prefs = list_preferences(app.config["DB"], user_id)
-                    raw = format_preferences(prefs)
-                else:
-                    tipo = classify_text(text)
-                    if tipo != "consulta":
-                        save_chat_message(app.config["DB"], user_id, "user", text)
-                        raw = RESPUESTAS_RAPIDAS[tipo]
-                    elif normalized == "informacion":
-                        save_chat_message(app.config["DB"], user_id, "user", text)
-                        raw = INFO_MESSAGE
-                    else:
-                        calculator_response = maybe_handle_calculator(text)
-                        if calculator_response:
-                            save_chat_message(app.config["DB"], user_id, "user", text)
-                            raw = calculator_response
-                        else:
-                            history_items = load_recent_messages(
-                                app.config["DB"], user_id, settings.memory_window * 2
-                            )
-                            save_chat_message(app.config["DB"], user_id, "user", text)
-                            memory = build_memory(
-                                session, settings.memory_window, chat_items=history_items
-                            )
-                            chain = build_chain(settings, app.config["RETRIEVER"], memory)
-                            monitor = LLMMonitor()
-                            start_time = time.monotonic()
-                            status = "ok"
-                            error_message = None
-                            try:
-                                prefs = list_preferences(app.config["DB"], user_id)
-                                preference_context = build_preference_context(prefs)
-                                question_text = text
-                                if preference_context:
-                                    question_text = f"{text}\n\n{preference_context}"
-                                if hasattr(chain, "invoke"):
-                                    result = chain.invoke(
-                                        {"question": question_text},
-                                        config={"callbacks": [monitor]},
-                                    )
-                                else:
-                                    result = chain(
-                                        {"question": question_text}, callbacks=[monitor]
-                                    )
-                                raw = result["answer"]
-                            except Exception as exc:
-                                status = "error"
-                                error_message = str(exc)
-                                raw = (
-                                    "Ocurrio un problema generando la respuesta. "
-                                    "Intenta de nuevo o ajusta la pregunta."
-                                )
-                                logger.exception("Error en llamada a la cadena")
-
-                            latency_ms = int((time.monotonic() - start_time) * 1000)
-                            usage = monitor.usage
-                            save_llm_call(
-                                app.config["DB"],
-                                user_id,
-                                usage.model or settings.model_name,
-                                latency_ms,
-                                usage.prompt_tokens,
-                                usage.completion_tokens,
-                                usage.total_tokens,
-                                status,
-                                error_message,
-                            )
-
-                raw = raw.replace("\\(", "(").replace("\\)", ")")
-                html = markdown(raw, extensions=["extra"])
-                safe_html = bleach.clean(
-                    html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, strip=True
+                body = sse_event("done", done)
+                record_branch(branch, started_at)
+                return Response(body, mimetype="text/event-stream")
+            memory = start_llm_turn(user_id, text)
+
+        # Teardown runs before the body is streamed; the trace is saved and
+        # the request's commits are counted when the stream ends instead.
+        trace = g.pop("trace", None)
+        commits = app.config["DB"].detach_request()
+
+        def generate():
+            app.config["DB"].resume_request(commits)
+            try:
+                yield from stream_answer()
+            finally:
+                save_trace(trace)
+                app.config["DB"].finish_request()
+
+        def stream_answer():
+            with app.config["DB"].unit_of_work():
+                token_stream = TokenStream()
+                events = token_stream.run(
+                    lambda: invoke_chain(user_id, text, memory, token_stream)
                 )
+                try:
+                    for kind, value in events:
+                        if kind == "token":
+                            yield sse_event("token", {"text": value})
+                        else:
+                            raw = value if kind == "result" else LLM_ERROR_MESSAGE
+                            raw = finish_answer(user_id, raw)
+                            done = sse_event("done", {"html": render_answer(raw)})
+                except GeneratorExit:
+                    # The client disconnected. Closing events stops the LLM
+                    # and waits for the worker; returning normally commits
+                    # its LLM call row. An unfinished answer is not saved.
+                    events.close()
+                    record_branch("llm", started_at)
+                    return
+            # Committed before the last event, so a slow client never keeps
+            # the transaction open.
+            record_branch("llm", started_at)
+            yield done
 
-                ui_messages.append({"sender": "bot", "text": safe_html})
-                save_chat_message(app.config["DB"], user_id, "assistant", raw)
-
-                session["ui_messages"] = ui_messages
-
-        user_count = sum(1 for message in ui_messages if message["sender"] == "user")
-        preferences = list_preferences(app.config["DB"], user_id)[:5]
-        return render_template(
-            "index.html",
-            title=TITLE,
-            subtitle=SUBTITLE,
-            messages=ui_messages,
-            quick_replies=QUICK_REPLIES,
-            user_count=user_count,
-            preferences=preferences,
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
         )
 
+    @app.route("/", methods=["GET", "POST"])
+    def index():
+        with app.config["DB"].unit_of_work():
+            user_id = current_user_id()
+
+            if request.method == "GET":
+                reset_session_state(session)
+
+            ui_messages = get_ui_messages(session)
+
+            if request.method == "POST":
+                text = request.form.get("user_input", "").strip()
+                if text:
+                    ui_messages.append({"sender": "user", "text": text})
+
+                    started_at = time.monotonic()
+                    utterance = Utterance.from_text(text)
+                    with span("routing"):
+                        routed = answer_without_llm(user_id, text, utterance)
+                    if routed is None:
+                        branch = "llm"
+                        memory = start_llm_turn(user_id, text)
+                        raw = invoke_chain(user_id, text, memory)
+                    else:
+                        branch, raw = routed
+
+                    raw = finish_answer(user_id, raw)
+                    ui_messages.append({"sender": "bot", "text": render_answer(raw)})
+                    record_branch(branch, started_at)
+                    session["ui_messages"] = ui_messages
+
+            user_count = sum(1 for message in ui_messages if message["sender"] == "user")
+            preferences = app.config["PREFERENCES"].sidebar(user_id, preferences_version())
+            return render_template(
+                "index.html",
+                title=TITLE,
+                subtitle=SUBTITLE,
+                messages=ui_messages,
+                quick_replies=QUICK_REPLIES,
+                user_count=user_count,
+                preferences=preferences,
+            )
+
     return app
@@ -0,0 +1,43 @@
+"""Incremental knowledge-base indexer.
+
+Embeds only new or changed chunks from the knowledge files (and web sources
+when enabled) and deletes chunks whose source changed or disappeared.
+
+    python -m sme_agent.indexer [--dry-run] [--full]
+"""
+from __future__ import annotations
+
+import argparse
+
+from sme_agent.chains import open_vectorstore, update_knowledge_index
+from sme_agent.config import Settings, require_openai_key
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="Muestra los cambios sin aplicarlos.")
+    parser.add_argument("--full", action="store_true", help="Reconstruye todo el indice.")
+    args = parser.parse_args()
+
+    settings = Settings()
+    require_openai_key(settings)
+    vectorstore = open_vectorstore(settings)
+    report = update_knowledge_index(settings, vectorstore, dry_run=args.dry_run, full=args.full)
+
+    prefix = "[dry-run] " if args.dry_run else ""
+    if report.reset:
+        print(f"{prefix}Indice reiniciado (sin manifiesto compatible).")
+    for source in report.changed_sources:
+        print(f"{prefix}Actualizado: {source}")
+    for source in report.removed_sources:
+        print(f"{prefix}Eliminado: {source}")
+    for source in report.kept_sources:
+        print(f"{prefix}Sin descargar, se conserva el indice anterior: {source}")
+    print(
+        f"{prefix}Fragmentos nuevos: {report.added}, eliminados: {report.deleted}, "
+        f"sin cambios: {report.unchanged}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Database maintenance and inspection tasks.
+
+    python -m sme_agent.maintenance rollups [--force]    # rebuild the llm_calls rollups
+    python -m sme_agent.maintenance stages --window 24h  # per-stage timings (ENABLE_TRACING)
+    python -m sme_agent.maintenance archive [--dry-run]  # archive and prune old rows
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from sme_agent.config import Settings
+from sme_agent.db import (
+    METRIC_WINDOWS,
+    Database,
+    get_stage_breakdown,
+    rebuild_llm_rollups,
+    utcnow,
+)
+from sme_agent.services.retention import RETENTION_TABLES, archive_table, reclaim_space
+
+
+def rebuild_rollups(db: Database, args: argparse.Namespace) -> None:
+    start = time.monotonic()
+    try:
+        processed = rebuild_llm_rollups(db, force=args.force)
+    except RuntimeError as exc:
+        raise SystemExit(str(exc))
+    print(f"Rollups reconstruidos desde {processed} llamadas en {time.monotonic() - start:.1f} s")
+
+
+def show_stages(db: Database, args: argparse.Namespace) -> None:
+    breakdown = get_stage_breakdown(db, window=args.window, branch=args.branch)
+    print(
+        f"{breakdown['requests']} requests ({args.branch}, {args.window}); "
+        f"p95 total: {breakdown['tail_threshold_ms']} ms"
+    )
+    print(f"{'etapa':<16}{'n':>8}{'media ms':>12}{'p50 ms':>10}{'p95 ms':>10}{'media p95+':>12}")
+    stages = sorted(
+        breakdown["stages"].items(), key=lambda item: item[1]["avg_ms_in_tail"], reverse=True
+    )
+    for stage, row in stages:
+        print(
+            f"{stage:<16}{row['count']:>8}{row['avg_ms']:>12.1f}{row['p50_ms']:>10.0f}"
+            f"{row['p95_ms']:>10.0f}{row['avg_ms_in_tail']:>12.1f}"
+        )
+
+
+def archive(db: Database, args: argparse.Namespace) -> None:
+    settings = Settings()
+    days = args.older_than_days if args.older_than_days is not None else settings.retention_days
+    cutoff = utcnow() - timedelta(days=days)
+    archive_dir = Path(args.archive_dir or settings.archive_dir)
+    prefix = "[dry-run] " if args.dry_run else ""
+    print(f"{prefix}Archivando filas anteriores a {cutoff:%Y-%m-%d %H:%M} UTC en {archive_dir}")
+
+    archived = []
+    for name in args.tables.split(","):
+        report = archive_table(
+            db,
+            RETENTION_TABLES[name],
+            cutoff,
+            archive_dir,
+            batch_size=args.batch_size,
+            dry_run=args.dry_run,
+        )
+        if report.rows:
+            archived.append(name)
+        print(
+            f"{prefix}{name}: {report.rows} filas en {len(report.partitions)} dias, "
+            f"{report.batches} lotes, {report.archive_bytes / 1024:.0f} KiB comprimidos, "
+            f"{report.seconds:.1f} s ({report.rows_per_second:.0f} filas/s)"
+        )
+
+    if archived and not args.dry_run and not args.no_vacuum:
+        path = Path(db.engine.url.database or "") if db.engine.dialect.name == "sqlite" else None
+        size_before = path.stat().st_size if path and path.exists() else None
+        start = time.monotonic()
+        reclaim_space(db, archived)
+        message = f"Espacio recuperado en {time.monotonic() - start:.1f} s"
+        if size_before is not None:
+            message += f": {size_before / 2**20:.1f} MiB -> {path.stat().st_size / 2**20:.1f} MiB"
+        print(message)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    rollups = commands.add_parser("rollups", help="Reconstruye los rollups de llm_calls.")
+    rollups.add_argument(
+        "--force", action="store_true", help="Reemplaza rollups existentes (pierde lo archivado)."
+    )
+    rollups.set_defaults(handler=rebuild_rollups)
+    stages = commands.add_parser("stages", help="Tiempos por etapa de los requests trazados.")
+    stages.add_argument("--window", default="24h", choices=[*METRIC_WINDOWS, "all"])
+    stages.add_argument("--branch", default="llm")
+    stages.set_defaults(handler=show_stages)
+    archiver = commands.add_parser(
+        "archive", help="Archiva en JSONL.gz por dia y borra las filas antiguas."
+    )
+    archiver.add_argument("--older-than-days", type=int, default=None, help="Por defecto RETENTION_DAYS.")
+    archiver.add_argument("--tables", default=",".join(RETENTION_TABLES))
+    archiver.add_argument("--archive-dir", default=None, help="Por defecto ARCHIVE_DIR.")
+    archiver.add_argument("--batch-size", type=int, default=5000)
+    archiver.add_argument("--dry-run", action="store_true", help="Cuenta sin escribir ni borrar.")
+    archiver.add_argument("--no-vacuum", action="store_true", help="No compacta la base al final.")
+    archiver.set_defaults(handler=archive)
+    args = parser.parse_args()
+
+    db = Database(Settings().database_url)
+    db.init_db()
+    args.handler(db, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -78,3 +78,16 @@ No inventes tasas, fechas o cifras. Si no tienes certeza, indica que se debe ver
 4) Tono cercano y profesional, 4 a 10 lineas.
 5) Cierra invitando a profundizar con una pregunta pertinente.
 """
+
+SUMMARY_PROMPT = """\
+Resume la conversacion entre un empresario y su asesor financiero para usarla como contexto en las siguientes respuestas.
+Conserva cifras, datos de la empresa, decisiones tomadas y preguntas pendientes; omite saludos y repeticiones.
+Escribe en espanol, en un solo parrafo de menos de {max_words} palabras.
+
+Resumen actual:
+{summary}
+
+Mensajes nuevos:
+{messages}
+
+Resumen actualizado:"""
@@ -3,14 +3,16 @@ from __future__ import annotations
 from typing import Optional
 
 from sme_agent.services.calculators import maybe_run_calculator
-from sme_agent.services.intents import detect_intent, should_use_calculator
+from sme_agent.services.intents import match_intent
+from sme_agent.services.utterance import TextInput, as_utterance
 
 
-def maybe_handle_calculator(text: str) -> Optional[str]:
-    intent = detect_intent(text)
-    if not should_use_calculator(text, intent):
+def maybe_handle_calculator(text: TextInput) -> Optional[str]:
+    text = as_utterance(text)
+    match = match_intent(text)
+    if not match.use_calculator:
         return None
-    result = maybe_run_calculator(text, intent)
+    result = maybe_run_calculator(text, match.intent)
     if result:
         return result.response
     return None
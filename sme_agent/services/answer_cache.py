@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from sme_agent.db import (
+    Database,
+    evict_cached_answers,
+    get_cached_answer,
+    list_cached_answer_candidates,
+    save_cached_answer,
+    touch_cached_answer,
+    utcnow,
+)
+from sme_agent.services.utterance import normalize_text
+
+
+_SPACES = re.compile(r"\s+")
+
+
+@dataclass
+class CacheHit:
+    answer: str
+    kind: str
+
+
+def normalize_question(question: str) -> str:
+    return _SPACES.sub(" ", normalize_text(question.lower())).strip(" ?!.")
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class AnswerCache:
+    # Answers are keyed on the normalized standalone question plus a context
+    # key (retrieved chunk ids, preference context and model settings), so a
+    # hit is only served when the LLM would have seen the same inputs.
+    # Near-duplicate questions match by embedding cosine within the same
+    # context key.
+    db: Database
+    settings_key: str
+    ttl_seconds: int = 86400
+    max_entries: int = 5000
+    similarity_threshold: float = 0.95
+    max_candidates: int = 200
+    evict_every: int = 50
+    _stores: int = field(default=0, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def context_key(self, chunk_ids: Iterable[str], preference_context: str) -> str:
+        return _digest(self.settings_key, preference_context or "", *sorted(chunk_ids))
+
+    def _min_created_at(self):
+        return utcnow() - timedelta(seconds=self.ttl_seconds)
+
+    def lookup(
+        self,
+        question: str,
+        chunk_ids: Sequence[str],
+        preference_context: str = "",
+        embedding: Optional[List[float]] = None,
+    ) -> Optional[CacheHit]:
+        context_key = self.context_key(chunk_ids, preference_context)
+        min_created_at = self._min_created_at()
+        cache_key = _digest(context_key, normalize_question(question))
+        answer = get_cached_answer(self.db, cache_key, min_created_at)
+        if answer is not None:
+            return CacheHit(answer=answer, kind="exact")
+
+        if embedding is None or self.similarity_threshold <= 0:
+            return None
+        candidates = list_cached_answer_candidates(
+            self.db, context_key, min_created_at, self.max_candidates
+        )
+        if not candidates:
+            return None
+        matrix = np.array([json.loads(raw) for _, raw, _ in candidates], dtype=float)
+        query = np.asarray(embedding, dtype=float)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        scores = np.divide(matrix @ query, norms, out=np.zeros(len(candidates)), where=norms > 0)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        entry_id, _, answer = candidates[best]
+        touch_cached_answer(self.db, entry_id)
+        return CacheHit(answer=answer, kind="similar")
+
+    def store(
+        self,
+        question: str,
+        chunk_ids: Sequence[str],
+        answer: str,
+        preference_context: str = "",
+        embedding: Optional[List[float]] = None,
+    ) -> None:
+        context_key = self.context_key(chunk_ids, preference_context)
+        normalized = normalize_question(question)
+        save_cached_answer(
+            self.db,
+            cache_key=_digest(context_key, normalized),
+            context_key=context_key,
+            question=normalized,
+            embedding=json.dumps(list(embedding)) if embedding is not None else None,
+            answer=answer,
+        )
+        with self._lock:
+            self._stores += 1
+            evict = self._stores % self.evict_every == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        return evict_cached_answers(self.db, self._min_created_at(), self.max_entries)
+
+
+def chunk_id(document) -> str:
+    return getattr(document, "id", None) or _digest(document.page_content)
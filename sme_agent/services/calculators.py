@@ -2,14 +2,17 @@ from __future__ import annotations
 
 import re
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Dict, Optional
 
-from sme_agent.services.classification import normalize_text
 from sme_agent.services.intents import Intent
-
-
-NUMBER_PATTERN = r"\d{1,3}(?:[.,]\d{3})*(?:[.,]\d+)?|\d+(?:[.,]\d+)?"
-NUMBER_RE = re.compile(NUMBER_PATTERN)
+from sme_agent.services.scenarios import SCENARIO_MODELS, sensitivity_rows
+from sme_agent.services.utterance import (
+    NUMBER_PATTERN,
+    TextInput,
+    as_utterance,
+    parse_number,
+)
 
 
 @dataclass
@@ -17,40 +20,82 @@ class CalculatorResult:
     response: str
 
 
-def parse_number(raw: str) -> Optional[float]:
-    if not raw:
-        return None
-    raw = raw.replace(" ", "")
-    if "," in raw and "." in raw:
-        if raw.rfind(",") > raw.rfind("."):
-            decimal_sep = ","
-            thousand_sep = "."
-        else:
-            decimal_sep = "."
-            thousand_sep = ","
-        raw = raw.replace(thousand_sep, "")
-        raw = raw.replace(decimal_sep, ".")
-    else:
-        if "," in raw:
-            parts = raw.split(",")
-            if len(parts[-1]) == 3 and len(parts[0]) <= 3:
-                raw = "".join(parts)
-            else:
-                raw = raw.replace(",", ".")
-        elif "." in raw:
-            parts = raw.split(".")
-            if len(parts[-1]) == 3 and len(parts[0]) <= 3:
-                raw = "".join(parts)
-        
-    try:
-        return float(raw)
-    except ValueError:
-        return None
+_AMOUNT_SLOTS = (
+    ("ventas", (r"ventas?", r"ingresos?")),
+    ("costos_fijos", (r"costos? fijos?", r"gastos? fijos?")),
+    ("costo_variable_unit", (r"costo variable", r"costo unitario")),
+    ("precio_unit", (r"precio", r"ticket promedio")),
+    ("egresos", (r"egresos?", r"gastos?")),
+    ("costo_ventas", (r"costo de ventas", r"costo ventas")),
+    ("utilidad_neta", (r"utilidad neta", r"ganancia neta")),
+    ("activo_corriente", (r"activo corriente", r"activos corrientes")),
+    ("pasivo_corriente", (r"pasivo corriente", r"pasivos corrientes")),
+    ("deuda_total", (r"deuda total", r"pasivo total")),
+    ("ebitda", (r"ebitda",)),
+    ("intereses", (r"intereses", r"gastos? financieros")),
+    ("utilidad_operativa", (r"utilidad operativa",)),
+)
+
+_PERCENT_SLOTS = (("margen de contribucion", (r"margen de contribucion",)),)
+
+_PERCENT_NUMBER_PATTERN = r"\d+(?:[.,]\d+)?"
+
+_SCENARIO_REQUEST = re.compile(r"escenarios?|sensibilidad")
+
+
+@dataclass
+class Extraction:
+    amounts: Dict[str, float]
+    percents: Dict[str, float]
+
+
+def _amount_re(keyword: str) -> re.Pattern:
+    return re.compile(keyword + r"[^\d]*(?P<number>" + NUMBER_PATTERN + r")")
+
+
+@lru_cache(maxsize=32)
+def _percent_re(keyword: str) -> re.Pattern:
+    return re.compile(keyword + r"[^\d]*(?P<number>" + _PERCENT_NUMBER_PATTERN + r")\s*%")
+
+
+class AmountExtractor:
+    # Each keyword keeps its own precompiled regex: CPython's re runs a fast
+    # literal-prefix scan for these, which beats a single alternation over
+    # every keyword on long pasted statements. Slots stop at the first
+    # pattern that yields a number, in priority order.
+
+    def __init__(self, amount_slots=_AMOUNT_SLOTS, percent_slots=_PERCENT_SLOTS) -> None:
+        self._amounts = [
+            (name, tuple(_amount_re(pattern) for pattern in patterns))
+            for name, patterns in amount_slots
+        ]
+        self._percents = [
+            (name, tuple(_percent_re(pattern) for pattern in patterns))
+            for name, patterns in percent_slots
+        ]
+
+    def amounts(self, normalized: str) -> Dict[str, float]:
+        return _fill_slots(self._amounts, normalized, scale=1)
+
+    def percents(self, normalized: str) -> Dict[str, float]:
+        return _fill_slots(self._percents, normalized, scale=100)
 
+    def extract(self, normalized: str) -> Extraction:
+        return Extraction(amounts=self.amounts(normalized), percents=self.percents(normalized))
 
-def _find_value(text: str, patterns) -> Optional[float]:
-    for pattern in patterns:
-        match = re.search(pattern, text)
+
+def _fill_slots(slots, text: str, scale: int) -> Dict[str, float]:
+    values: Dict[str, float] = {}
+    for name, regexes in slots:
+        value = _first_value(regexes, text)
+        if value is not None:
+            values[name] = value / scale
+    return values
+
+
+def _first_value(regexes, text: str) -> Optional[float]:
+    for regex in regexes:
+        match = regex.search(text)
         if match:
             value = parse_number(match.group("number"))
             if value is not None:
@@ -58,105 +103,21 @@ def _find_value(text: str, patterns) -> Optional[float]:
     return None
 
 
-def extract_amounts(text: str) -> Dict[str, float]:
-    normalized = normalize_text(text.lower())
-    values = {
-        "ventas": _find_value(
-            normalized,
-            [
-                r"ventas?[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-                r"ingresos?[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-            ],
-        ),
-        "costos_fijos": _find_value(
-            normalized,
-            [
-                r"costos? fijos?[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-                r"gastos? fijos?[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-            ],
-        ),
-        "costo_variable_unit": _find_value(
-            normalized,
-            [
-                r"costo variable[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-                r"costo unitario[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-            ],
-        ),
-        "precio_unit": _find_value(
-            normalized,
-            [
-                r"precio[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-                r"ticket promedio[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-            ],
-        ),
-        "egresos": _find_value(
-            normalized,
-            [
-                r"egresos?[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-                r"gastos?[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-            ],
-        ),
-        "costo_ventas": _find_value(
-            normalized,
-            [
-                r"costo de ventas[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-                r"costo ventas[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-            ],
-        ),
-        "utilidad_neta": _find_value(
-            normalized,
-            [
-                r"utilidad neta[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-                r"ganancia neta[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-            ],
-        ),
-        "activo_corriente": _find_value(
-            normalized,
-            [
-                r"activo corriente[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-                r"activos corrientes[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-            ],
-        ),
-        "pasivo_corriente": _find_value(
-            normalized,
-            [
-                r"pasivo corriente[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-                r"pasivos corrientes[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-            ],
-        ),
-        "deuda_total": _find_value(
-            normalized,
-            [
-                r"deuda total[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-                r"pasivo total[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-            ],
-        ),
-        "ebitda": _find_value(
-            normalized,
-            [r"ebitda[^\d]*(?P<number>" + NUMBER_PATTERN + r")"],
-        ),
-        "intereses": _find_value(
-            normalized,
-            [
-                r"intereses[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-                r"gastos? financieros[^\d]*(?P<number>" + NUMBER_PATTERN + r")",
-            ],
-        ),
-        "utilidad_operativa": _find_value(
-            normalized,
-            [r"utilidad operativa[^\d]*(?P<number>" + NUMBER_PATTERN + r")"],
-        ),
-    }
-    return {key: value for key, value in values.items() if value is not None}
-
-
-def extract_percent(text: str, keyword: str) -> Optional[float]:
-    normalized = normalize_text(text.lower())
-    match = re.search(rf"{keyword}[^\d]*(?P<number>\d+(?:[.,]\d+)?)\s*%", normalized)
-    if match:
-        value = parse_number(match.group("number"))
-        if value is not None:
-            return value / 100
+_EXTRACTOR = AmountExtractor()
+
+
+def extract_all(text: TextInput) -> Extraction:
+    return _EXTRACTOR.extract(as_utterance(text).normalized)
+
+
+def extract_amounts(text: TextInput) -> Dict[str, float]:
+    return _EXTRACTOR.amounts(as_utterance(text).normalized)
+
+
+def extract_percent(text: TextInput, keyword: str) -> Optional[float]:
+    value = _first_value((_percent_re(keyword),), as_utterance(text).normalized)
+    if value is not None:
+        return value / 100
     return None
 
 
@@ -172,12 +133,22 @@ def format_percent(value: float) -> str:
     return f"{value * 100:.1f}%"
 
 
-def build_break_even(text: str) -> Optional[CalculatorResult]:
-    values = extract_amounts(text)
+def _sensitivity_section(text: TextInput, model_name: str, base: Dict[str, Optional[float]], formatter) -> str:
+    if not _SCENARIO_REQUEST.search(as_utterance(text).normalized):
+        return ""
+    if any(base.get(name) is None for name in SCENARIO_MODELS[model_name].inputs[:2]):
+        return ""
+    inputs = {name: value for name, value in base.items() if value is not None}
+    return "\n".join(sensitivity_rows(model_name, inputs, formatter)) + "\n\n"
+
+
+def build_break_even(text: TextInput) -> Optional[CalculatorResult]:
+    extraction = extract_all(text)
+    values = extraction.amounts
     fixed_costs = values.get("costos_fijos")
     price = values.get("precio_unit")
     variable_cost = values.get("costo_variable_unit")
-    margin_percent = extract_percent(text, "margen de contribucion")
+    margin_percent = extraction.percents.get("margen de contribucion")
 
     missing = []
     if fixed_costs is None:
@@ -235,13 +206,19 @@ def build_break_even(text: str) -> Optional[CalculatorResult]:
         f"- Costo variable unitario: {format_currency(variable_cost)}\n"
         f"- Unidades de equilibrio: {units:,.1f}\n"
         f"- Ventas de equilibrio: {format_currency(sales_break_even)}\n\n"
-        "- Si los costos variables cambian, el equilibrio tambien cambia.\n\n"
+        + _sensitivity_section(
+            text,
+            "break_even",
+            {"precio_unit": price, "costo_variable_unit": variable_cost, "costos_fijos": fixed_costs},
+            format_currency,
+        )
+        + "- Si los costos variables cambian, el equilibrio tambien cambia.\n\n"
         "Si quieres, revisamos escenarios y sensibilidad con mas datos."
     )
     return CalculatorResult(response=response)
 
 
-def build_cashflow(text: str) -> Optional[CalculatorResult]:
+def build_cashflow(text: TextInput) -> Optional[CalculatorResult]:
     values = extract_amounts(text)
     ingresos = values.get("ventas")
     egresos = values.get("egresos")
@@ -261,7 +238,7 @@ def build_cashflow(text: str) -> Optional[CalculatorResult]:
     return CalculatorResult(response=response)
 
 
-def build_margins(text: str) -> Optional[CalculatorResult]:
+def build_margins(text: TextInput) -> Optional[CalculatorResult]:
     values = extract_amounts(text)
     ventas = values.get("ventas")
     costo_ventas = values.get("costo_ventas")
@@ -286,13 +263,19 @@ def build_margins(text: str) -> Optional[CalculatorResult]:
         f"- Ventas: {format_currency(ventas)}\n"
         + "\n".join(lines)
         + "\n\n"
-        "- Revisa costos indirectos para explicar variaciones del margen.\n\n"
+        + _sensitivity_section(
+            text,
+            "margins",
+            {"ventas": ventas, "costo_ventas": costo_ventas, "utilidad_neta": utilidad_neta},
+            format_percent,
+        )
+        + "- Revisa costos indirectos para explicar variaciones del margen.\n\n"
         "Si quieres, calculo margenes por producto o canal."
     )
     return CalculatorResult(response=response)
 
 
-def build_liquidity(text: str) -> Optional[CalculatorResult]:
+def build_liquidity(text: TextInput) -> Optional[CalculatorResult]:
     values = extract_amounts(text)
     activos = values.get("activo_corriente")
     pasivos = values.get("pasivo_corriente")
@@ -306,13 +289,19 @@ def build_liquidity(text: str) -> Optional[CalculatorResult]:
         f"- Activo corriente: {format_currency(activos)}\n"
         f"- Pasivo corriente: {format_currency(pasivos)}\n"
         f"- Razon corriente: {format_ratio(ratio)}\n\n"
-        "- Un valor bajo puede presionar la caja de corto plazo.\n\n"
+        + _sensitivity_section(
+            text,
+            "liquidity",
+            {"activo_corriente": activos, "pasivo_corriente": pasivos},
+            format_ratio,
+        )
+        + "- Un valor bajo puede presionar la caja de corto plazo.\n\n"
         "Si quieres, revisamos liquidez proyectada y capital de trabajo."
     )
     return CalculatorResult(response=response)
 
 
-def build_debt(text: str) -> Optional[CalculatorResult]:
+def build_debt(text: TextInput) -> Optional[CalculatorResult]:
     values = extract_amounts(text)
     deuda = values.get("deuda_total")
     ebitda = values.get("ebitda") or values.get("utilidad_operativa")
@@ -334,13 +323,20 @@ def build_debt(text: str) -> Optional[CalculatorResult]:
         "Con los datos suministrados, estos son los indicadores de deuda:\n\n"
         + "\n".join(lines)
         + "\n\n"
-        "- Ajusta los calculos con datos mensuales comparables.\n\n"
+        + _sensitivity_section(
+            text,
+            "debt",
+            {"ebitda": ebitda, "deuda_total": deuda, "intereses": intereses},
+            format_ratio,
+        )
+        + "- Ajusta los calculos con datos mensuales comparables.\n\n"
         "Si quieres, analizamos escenarios de pago y sensibilidad." 
     )
     return CalculatorResult(response=response)
 
 
-def maybe_run_calculator(text: str, intent: Intent) -> Optional[CalculatorResult]:
+def maybe_run_calculator(text: TextInput, intent: Intent) -> Optional[CalculatorResult]:
+    text = as_utterance(text)
     if intent == Intent.BREAK_EVEN:
         return build_break_even(text)
     if intent == Intent.CASHFLOW:
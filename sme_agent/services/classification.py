@@ -1,5 +1,6 @@
 import re
-import unicodedata
+
+from sme_agent.services.utterance import TextInput, as_utterance, normalize_text
 
 
 _GREETINGS = re.compile(r"(hola|buenas|hey|que tal)\b.*")
@@ -8,13 +9,8 @@ _THANKS = re.compile(r"(gracias|muchas gracias|mil gracias)\b.*")
 _SMALLTALK = re.compile(r"(como estas|como te va|que tal estas)\b.*")
 
 
-def normalize_text(text: str) -> str:
-    normalized = unicodedata.normalize("NFKD", text)
-    return normalized.encode("ascii", "ignore").decode("ascii")
-
-
-def classify_text(text: str) -> str:
-    txt = normalize_text(text.lower().strip())
+def classify_text(text: TextInput) -> str:
+    txt = as_utterance(text).stripped
     if _GREETINGS.fullmatch(txt):
         return "saludo"
     if _FAREWELLS.fullmatch(txt):
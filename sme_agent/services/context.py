@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from sme_agent.services.tokens import count_tokens, truncate_to_tokens
+
+
+# Context packing between retrieval and the stuff prompt. Chunks of the same
+# source that overlap (the splitter repeats up to CHUNK_OVERLAP characters
+# between neighbours) are merged into one passage, exact duplicates are
+# dropped, passages are ordered by score (Chroma distances: lower is closer)
+# and the list is cut to a token budget; the passage that crosses the budget
+# is truncated if enough of it fits.
+MIN_OVERLAP_CHARS = 20
+MIN_TRUNCATED_TOKENS = 60
+
+
+@dataclass
+class Passage:
+    content: str
+    score: float
+    metadata: dict
+    document: Optional[Document] = None
+
+    def to_document(self) -> Document:
+        # Unchanged chunks keep their id (the answer cache keys on it).
+        if self.document is not None and self.document.page_content == self.content:
+            return self.document
+        return Document(page_content=self.content, metadata=dict(self.metadata))
+
+
+def _overlap(left: str, right: str) -> int:
+    # Length of the longest suffix of left that is a prefix of right.
+    for length in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+def _merge(first: Passage, second: Passage) -> Optional[Passage]:
+    score = min(first.score, second.score)
+    best = first if first.score <= second.score else second
+    if second.content in first.content:
+        return Passage(first.content, score, first.metadata, first.document)
+    if first.content in second.content:
+        return Passage(second.content, score, second.metadata, second.document)
+    overlap = _overlap(first.content, second.content)
+    if overlap:
+        return Passage(first.content + second.content[overlap:], score, best.metadata)
+    overlap = _overlap(second.content, first.content)
+    if overlap:
+        return Passage(second.content + first.content[overlap:], score, best.metadata)
+    return None
+
+
+def _merge_source(passages: List[Passage]) -> List[Passage]:
+    merged = list(passages)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                combined = _merge(merged[i], merged[j])
+                if combined is not None:
+                    merged[i] = combined
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+
+def pack_passages(
+    docs_and_scores: List[Tuple[Document, float]],
+    max_tokens: int = 0,
+    model: str = "gpt-4o-mini",
+) -> List[Document]:
+    by_source: Dict[str, List[Passage]] = defaultdict(list)
+    for doc, score in docs_and_scores:
+        source = str(doc.metadata.get("source", ""))
+        by_source[source].append(Passage(doc.page_content, score, doc.metadata, doc))
+
+    merged = [passage for group in by_source.values() for passage in _merge_source(group)]
+    merged.sort(key=lambda passage: passage.score)
+    passages: List[Passage] = []
+    seen = set()
+    for passage in merged:
+        key = passage.content.strip()
+        if key not in seen:
+            seen.add(key)
+            passages.append(passage)
+
+    if max_tokens <= 0:
+        return [passage.to_document() for passage in passages]
+    packed: List[Document] = []
+    remaining = max_tokens
+    for passage in passages:
+        tokens = count_tokens(passage.content, model)
+        if tokens <= remaining:
+            packed.append(passage.to_document())
+            remaining -= tokens
+            continue
+        if remaining >= MIN_TRUNCATED_TOKENS:
+            passage.content = truncate_to_tokens(passage.content, remaining, model)
+            packed.append(passage.to_document())
+        break
+    return packed
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+_SQLITE_MAX_PARAMS = 500
+
+
+class EmbeddingStore:
+    # Content-addressed vectors in a standalone SQLite file. Kept apart from
+    # DATABASE_URL so index builds and every worker on the host share it.
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        connection = self._connect()
+        for start in range(0, len(keys), _SQLITE_MAX_PARAMS):
+            batch = keys[start : start + _SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            rows = connection.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float64).tolist()
+        return found
+
+    def set_many(self, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float64).tobytes())
+                    for key, vector in items.items()
+                ],
+            )
+
+
+class CachedEmbeddings(Embeddings):
+    # Wraps an embedding model with an in-memory LRU in front of an optional
+    # on-disk store. Keys hash the model namespace with the text, so queries,
+    # condensed follow-ups and index chunks all share one cache.
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        namespace: str,
+        store: Optional[EmbeddingStore] = None,
+        memory_size: int = 2048,
+    ) -> None:
+        self.underlying = underlying
+        self.namespace = namespace
+        self.store = store
+        self.memory_size = memory_size
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _count(self, counter: str, amount: int) -> None:
+        # Requests resolve embeddings from several threads at once.
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\x1f{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        if self.memory_size <= 0:
+            return
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _from_memory(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+        return found
+
+    def _resolve(self, texts: List[str], embed) -> List[List[float]]:
+        keys = [self.key(text) for text in texts]
+        unique = list(dict.fromkeys(keys))
+        vectors = self._from_memory(unique)
+        self._count("memory_hits", len(vectors))
+
+        pending = [key for key in unique if key not in vectors]
+        if pending and self.store is not None:
+            stored = self.store.get_many(pending)
+            self._count("disk_hits", len(stored))
+            for key, vector in stored.items():
+                vectors[key] = vector
+                self._remember(key, vector)
+            pending = [key for key in pending if key not in stored]
+
+        if pending:
+            text_by_key = dict(zip(keys, texts))
+            computed = dict(zip(pending, embed([text_by_key[key] for key in pending])))
+            self._count("misses", len(computed))
+            if self.store is not None:
+                self.store.set_many(computed)
+            for key, vector in computed.items():
+                vectors[key] = vector
+                self._remember(key, vector)
+
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._resolve(list(texts), self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._resolve([text], lambda pending: [self.underlying.embed_query(pending[0])])[0]
@@ -2,8 +2,12 @@ from __future__ import annotations
 
 from typing import Dict, List, Optional
 
-from langchain.memory import ChatMessageHistory, ConversationBufferWindowMemory
-from langchain_core.messages import AIMessage, HumanMessage
+from langchain.memory import (
+    ChatMessageHistory,
+    ConversationBufferMemory,
+    ConversationBufferWindowMemory,
+)
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 
 from sme_agent.prompts import WELCOME_MESSAGES
 
@@ -19,18 +23,22 @@ def get_ui_messages(session: Dict) -> List[Dict[str, str]]:
     return session["ui_messages"]
 
 
-def build_memory(session: Dict, k: int, chat_items: Optional[List[Dict[str, str]]] = None) -> ConversationBufferWindowMemory:
+def _chat_history(items: List[Dict[str, str]]) -> ChatMessageHistory:
     history = ChatMessageHistory()
-    source_items = chat_items if chat_items is not None else session.get("chat_history", [])
-    for item in source_items:
+    for item in items:
         role = item.get("role")
         content = item.get("content", "")
         if role == "user":
             history.add_user_message(content)
         else:
             history.add_ai_message(content)
+    return history
+
+
+def build_memory(session: Dict, k: int, chat_items: Optional[List[Dict[str, str]]] = None) -> ConversationBufferWindowMemory:
+    source_items = chat_items if chat_items is not None else session.get("chat_history", [])
     return ConversationBufferWindowMemory(
-        chat_memory=history,
+        chat_memory=_chat_history(source_items),
         k=k,
         return_messages=True,
         memory_key="chat_history",
@@ -39,6 +47,23 @@ def build_memory(session: Dict, k: int, chat_items: Optional[List[Dict[str, str]
     )
 
 
+def build_summary_memory(summary: str, chat_items: List[Dict[str, str]]) -> ConversationBufferMemory:
+    # The summary of older turns goes first, as a system message, followed
+    # by the recent messages verbatim.
+    history = _chat_history(chat_items)
+    if summary:
+        history.messages.insert(
+            0, SystemMessage(content=f"Resumen de la conversacion anterior: {summary}")
+        )
+    return ConversationBufferMemory(
+        chat_memory=history,
+        return_messages=True,
+        memory_key="chat_history",
+        input_key="question",
+        output_key="answer",
+    )
+
+
 def serialize_messages(messages: List) -> List[Dict[str, str]]:
     serialized = []
     for message in messages:
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 900
+CHUNK_OVERLAP = 150
+_BATCH_SIZE = 500
+
+
+@dataclass
+class IndexReport:
+    added: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    changed_sources: List[str] = field(default_factory=list)
+    removed_sources: List[str] = field(default_factory=list)
+    kept_sources: List[str] = field(default_factory=list)
+    reset: bool = False
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.deleted or self.reset)
+
+
+def _hash(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def build_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def split_documents(documents: List[Document]) -> List[Document]:
+    splits = build_splitter().split_documents(documents)
+    return [doc for doc in splits if doc.page_content.strip()]
+
+
+def chunk_ids(source: str, chunks: List[Document]) -> List[str]:
+    # Ids depend on content, not position, so editing one paragraph only
+    # changes the ids of the chunks that actually changed. Repeated chunks in
+    # the same source are told apart by their occurrence number.
+    seen: Dict[str, int] = defaultdict(int)
+    ids = []
+    for chunk in chunks:
+        content_hash = _hash(chunk.page_content)
+        ids.append(_hash(source, content_hash, str(seen[content_hash])))
+        seen[content_hash] += 1
+    return ids
+
+
+def manifest_path(chroma_dir: str) -> str:
+    return os.path.join(chroma_dir, "manifest.json")
+
+
+def load_manifest(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def save_manifest(path: str, manifest: dict) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _group_by_source(documents: List[Document]) -> Dict[str, List[Document]]:
+    grouped: Dict[str, List[Document]] = defaultdict(list)
+    for doc in documents:
+        grouped[str(doc.metadata.get("source", ""))].append(doc)
+    return grouped
+
+
+def _batched(items: List, size: int = _BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def update_index(
+    vectorstore: Chroma,
+    documents: List[Document],
+    path: str,
+    embedding_model: str,
+    dry_run: bool = False,
+    full: bool = False,
+    keep_sources: Iterable[str] = (),
+) -> IndexReport:
+    # keep_sources are sources that could not be loaded this time (a web
+    # page that failed to download); their indexed chunks are left as they
+    # are instead of being treated as removed.
+    report = IndexReport()
+    signature = {
+        "version": MANIFEST_VERSION,
+        "embedding_model": embedding_model,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+    }
+    manifest = load_manifest(path)
+    if full or manifest is None or manifest.get("signature") != signature:
+        # Without a matching manifest the stored chunk ids are unknown (or
+        # were embedded differently), so start from an empty collection.
+        report.reset = True
+        manifest = {"signature": signature, "sources": {}}
+
+    old_sources: Dict[str, dict] = manifest["sources"]
+    new_sources: Dict[str, dict] = {}
+    to_add: List[Document] = []
+    add_ids: List[str] = []
+    delete_ids: List[str] = []
+
+    for source, docs in _group_by_source(documents).items():
+        source_hash = _hash(*(doc.page_content for doc in docs))
+        previous = old_sources.get(source)
+        if previous and previous["hash"] == source_hash:
+            new_sources[source] = previous
+            report.unchanged += len(previous["chunks"])
+            continue
+
+        chunks = split_documents(docs)
+        ids = chunk_ids(source, chunks)
+        old_ids = set(previous["chunks"]) if previous else set()
+        for chunk, chunk_id in zip(chunks, ids):
+            if chunk_id not in old_ids:
+                to_add.append(chunk)
+                add_ids.append(chunk_id)
+        delete_ids.extend(old_ids.difference(ids))
+        report.unchanged += len(old_ids.intersection(ids))
+        report.changed_sources.append(source)
+        new_sources[source] = {"hash": source_hash, "chunks": ids}
+
+    for source in keep_sources:
+        if source in old_sources and source not in new_sources:
+            new_sources[source] = old_sources[source]
+            report.unchanged += len(old_sources[source]["chunks"])
+            report.kept_sources.append(source)
+
+    for source in old_sources.keys() - new_sources.keys():
+        delete_ids.extend(old_sources[source]["chunks"])
+        report.removed_sources.append(source)
+
+    report.added = len(add_ids)
+    report.deleted = len(delete_ids)
+    if dry_run:
+        return report
+    # Checked on the plan, so an empty split never wipes the current index.
+    if not report.added + report.unchanged:
+        raise RuntimeError("No hay contenido util despues del split.")
+
+    if report.reset:
+        vectorstore.reset_collection()
+    for batch in _batched(delete_ids):
+        vectorstore.delete(ids=batch)
+    for batch in _batched(list(zip(to_add, add_ids))):
+        docs, ids = zip(*batch)
+        vectorstore.add_documents(list(docs), ids=list(ids))
+    manifest["sources"] = new_sources
+    save_manifest(path, manifest)
+    return report
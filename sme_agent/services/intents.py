@@ -1,9 +1,11 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
 from enum import Enum
 import re
+from typing import Iterable, List, Optional, Tuple
 
-from sme_agent.services.classification import normalize_text
+from sme_agent.services.utterance import TextInput, as_utterance
 
 
 class Intent(str, Enum):
@@ -28,26 +30,144 @@ _INTENT_PATTERNS = {
     Intent.DEBT: [r"deuda", r"endeudamiento", r"ebitda", r"cobertura de intereses"],
 }
 
-_CALC_TRIGGER = re.compile(r"(calcula|calcular|cuanto|formula|numero|margen|punto de equilibrio)")
+_CALC_TRIGGERS = [
+    r"calcula",
+    r"calcular",
+    r"cuanto",
+    r"formula",
+    r"numero",
+    r"margen",
+    r"punto de equilibrio",
+]
 
+_ALWAYS_CALCULATE = {Intent.BREAK_EVEN, Intent.MARGINS, Intent.LIQUIDITY, Intent.DEBT}
+_CALCULATE_WITH_NUMBERS = {Intent.CASHFLOW}
 
-def detect_intent(text: str) -> Intent:
-    normalized = normalize_text(text.lower())
+
+@dataclass(frozen=True)
+class IntentMatch:
+    intent: str
+    use_calculator: bool
+
+
+@dataclass(frozen=True)
+class _IntentRule:
+    intent: str
+    patterns: Tuple[str, ...]
+    always_calculate: bool
+    calculate_with_numbers: bool
+
+
+class IntentMatcher:
+    # All intent patterns and calculator triggers are compiled into one
+    # alternation with a named group per intent, so a message is scanned once
+    # no matter how many intents are registered. Registration order is
+    # priority order: the earliest registered intent found anywhere wins.
+
+    def __init__(self, calculator_triggers: Iterable[str] = ()) -> None:
+        self._rules: List[_IntentRule] = []
+        self._triggers = tuple(calculator_triggers)
+        self._trigger_re = re.compile("|".join(self._triggers)) if self._triggers else None
+        self._scanner: Optional[re.Pattern] = None
+
+    def register(
+        self,
+        intent: str,
+        patterns: Iterable[str],
+        *,
+        always_calculate: bool = False,
+        calculate_with_numbers: bool = False,
+    ) -> None:
+        if any(rule.intent == intent for rule in self._rules):
+            raise ValueError(f"Intent ya registrado: {intent}")
+        self._rules.append(
+            _IntentRule(
+                intent=intent,
+                patterns=tuple(patterns),
+                always_calculate=always_calculate,
+                calculate_with_numbers=calculate_with_numbers,
+            )
+        )
+        self._scanner = None
+
+    def _compile(self) -> re.Pattern:
+        branches = [
+            f"(?P<i{index}>{'|'.join(rule.patterns)})"
+            for index, rule in enumerate(self._rules)
+            if rule.patterns
+        ]
+        if self._triggers:
+            branches.append(f"(?P<calc>{'|'.join(self._triggers)})")
+        return re.compile("|".join(branches) or "(?!)")
+
+    def match(self, text: TextInput) -> IntentMatch:
+        utterance = as_utterance(text)
+        if self._scanner is None:
+            self._scanner = self._compile()
+
+        best: Optional[int] = None
+        triggered = False
+        for match in self._scanner.finditer(utterance.normalized):
+            group = match.lastgroup
+            if group == "calc":
+                triggered = True
+            else:
+                index = int(group[1:])
+                if best is None or index < best:
+                    best = index
+                # Intent keywords can double as triggers ("margen").
+                if not triggered and self._trigger_re and self._trigger_re.search(match.group()):
+                    triggered = True
+            if best == 0 and (triggered or self._rules[0].always_calculate):
+                break
+
+        if best is None:
+            return IntentMatch(intent=Intent.GENERAL, use_calculator=False)
+        rule = self._rules[best]
+        return IntentMatch(
+            intent=rule.intent,
+            use_calculator=self._use_calculator(rule, triggered, utterance),
+        )
+
+    def use_calculator(self, text: TextInput, intent: str) -> bool:
+        if intent == Intent.GENERAL:
+            return False
+        utterance = as_utterance(text)
+        triggered = bool(self._trigger_re and self._trigger_re.search(utterance.normalized))
+        for rule in self._rules:
+            if rule.intent == intent:
+                return self._use_calculator(rule, triggered, utterance)
+        return triggered
+
+    @staticmethod
+    def _use_calculator(rule: _IntentRule, triggered: bool, utterance) -> bool:
+        if triggered or rule.always_calculate:
+            return True
+        return rule.calculate_with_numbers and utterance.has_digits
+
+
+def build_default_matcher() -> IntentMatcher:
+    matcher = IntentMatcher(calculator_triggers=_CALC_TRIGGERS)
     for intent, patterns in _INTENT_PATTERNS.items():
-        for pattern in patterns:
-            if re.search(pattern, normalized):
-                return intent
-    return Intent.GENERAL
-
-
-def should_use_calculator(text: str, intent: Intent) -> bool:
-    normalized = normalize_text(text.lower())
-    if intent == Intent.GENERAL:
-        return False
-    if _CALC_TRIGGER.search(normalized):
-        return True
-    if intent in {Intent.BREAK_EVEN, Intent.MARGINS, Intent.LIQUIDITY, Intent.DEBT}:
-        return True
-    if intent == Intent.CASHFLOW and re.search(r"\d", normalized):
-        return True
-    return False
+        matcher.register(
+            intent,
+            patterns,
+            always_calculate=intent in _ALWAYS_CALCULATE,
+            calculate_with_numbers=intent in _CALCULATE_WITH_NUMBERS,
+        )
+    return matcher
+
+
+INTENT_MATCHER = build_default_matcher()
+
+
+def match_intent(text: TextInput) -> IntentMatch:
+    return INTENT_MATCHER.match(text)
+
+
+def detect_intent(text: TextInput) -> Intent:
+    return INTENT_MATCHER.match(text).intent
+
+
+def should_use_calculator(text: TextInput, intent: Intent) -> bool:
+    return INTENT_MATCHER.use_calculator(text, intent)
@@ -1,13 +1,25 @@
 from __future__ import annotations
 
-from typing import Iterable, List
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
 
 import bs4
 import requests
-from langchain_community.document_loaders import DirectoryLoader, TextLoader, WebBaseLoader
+from langchain_community.document_loaders import DirectoryLoader, TextLoader
 from langchain_core.documents import Document
 
 
+logger = logging.getLogger("sme_agent")
+
+
 def load_local_documents(knowledge_dir: str) -> List[Document]:
     loader = DirectoryLoader(
         knowledge_dir,
@@ -18,18 +30,156 @@ def load_local_documents(knowledge_dir: str) -> List[Document]:
     return loader.load()
 
 
-def load_web_documents(web_sources: Iterable[str]) -> List[Document]:
-    session = requests.Session()
-    loader = WebBaseLoader(
-        web_paths=tuple(web_sources),
-        bs_kwargs={"parse_only": bs4.SoupStrainer("body")},
-        session=session,
-    )
-    return loader.load()
+@dataclass
+class FetchResult:
+    url: str
+    html: Optional[str]
+    # "fresh" (served from cache without a request), "not_modified" (304),
+    # "fetched", "stale" (request failed, cached copy used) or "failed".
+    status: str
+
+
+class WebFetcher:
+    # Fetches web sources concurrently with a bounded pool and a per-host
+    # limit. Responses are cached on disk with their validators, so unchanged
+    # pages cost a 304, or nothing while the cached copy is younger than
+    # max_age_seconds.
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_workers: int = 8,
+        per_host: int = 2,
+        timeout: float = 15.0,
+        max_age_seconds: int = 0,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_age_seconds = max_age_seconds
+        self._host_limits: Dict[str, threading.Semaphore] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers["User-Agent"] = "sme-agent-indexer"
+            self._local.session = session
+        return session
+
+    def _host_limit(self, url: str) -> threading.Semaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.Semaphore(self.per_host)
+            return self._host_limits[host]
+
+    def _cache_path(self, url: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def _read_cache(self, url: str) -> Optional[dict]:
+        path = self._cache_path(url)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, url: str, entry: dict) -> None:
+        path = self._cache_path(url)
+        if not path:
+            return
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(entry, handle)
+        os.replace(tmp_path, path)
+
+    def fetch(self, url: str) -> FetchResult:
+        cached = self._read_cache(url)
+        if cached and time.time() - cached["fetched_at"] < self.max_age_seconds:
+            return FetchResult(url, cached["html"], "fresh")
+
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            with self._host_limit(url):
+                response = self._session().get(url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and cached:
+                cached["fetched_at"] = time.time()
+                self._write_cache(url, cached)
+                return FetchResult(url, cached["html"], "not_modified")
+            response.raise_for_status()
+        except requests.RequestException as exc:
+            if cached:
+                logger.warning("Usando copia en cache de %s: %s", url, exc)
+                return FetchResult(url, cached["html"], "stale")
+            logger.warning("No se pudo descargar %s: %s", url, exc)
+            return FetchResult(url, None, "failed")
+
+        # Same encoding handling as WebBaseLoader.
+        response.encoding = response.apparent_encoding
+        entry = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+            "html": response.text,
+        }
+        self._write_cache(url, entry)
+        return FetchResult(url, entry["html"], "fetched")
+
+    def fetch_all(self, urls: Iterable[str]) -> List[FetchResult]:
+        urls = list(urls)
+        if not urls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as pool:
+            return list(pool.map(self.fetch, urls))
+
+
+def html_to_document(url: str, html: str) -> Document:
+    soup = bs4.BeautifulSoup(html, "html.parser", parse_only=bs4.SoupStrainer("body"))
+    return Document(page_content=soup.get_text(), metadata={"source": url})
+
+
+def load_web_documents(
+    web_sources: Iterable[str],
+    fetcher: Optional[WebFetcher] = None,
+    failed: Optional[List[str]] = None,
+) -> List[Document]:
+    # URLs that could not be fetched (and had no cached copy) are appended to
+    # failed, so the indexer can keep their chunks instead of removing them.
+    fetcher = fetcher or WebFetcher()
+    documents = []
+    for result in fetcher.fetch_all(web_sources):
+        if result.html is not None:
+            documents.append(html_to_document(result.url, result.html))
+        elif failed is not None:
+            failed.append(result.url)
+    return documents
 
 
-def load_documents(knowledge_dir: str, web_sources: Iterable[str], enable_web: bool) -> List[Document]:
+def load_documents(
+    knowledge_dir: str,
+    web_sources: Iterable[str],
+    enable_web: bool,
+    fetcher: Optional[WebFetcher] = None,
+    failed: Optional[List[str]] = None,
+) -> List[Document]:
     documents = load_local_documents(knowledge_dir)
     if enable_web:
-        documents.extend(load_web_documents(web_sources))
+        documents.extend(load_web_documents(web_sources, fetcher, failed))
     return documents
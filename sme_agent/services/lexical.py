@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from langchain_core.documents import Document
+
+from sme_agent.services.answer_cache import chunk_id
+from sme_agent.services.utterance import normalize_text
+
+
+# In-process BM25 over the chunks stored in Chroma. Queries such as "RUT",
+# "IVA" or "regimen simple" are answered from it without the embeddings API;
+# in hybrid mode its ranking is fused with the vector search.
+_WORDS = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    """
+    a al algo ante como con cual cuales cuando de del desde donde el ella en entre
+    es esa ese eso esta este esto estos estas fue ha hay la las le les lo los mas me
+    mi mis muy no nos o para pero por que se ser si sin sobre su sus te tiene tu un
+    una uno unos unas y ya yo debo puedo quiero necesito hago hacer
+    """.split()
+)
+RRF_K = 60
+
+
+def _stem(word: str) -> str:
+    # Light plural folding: impuestos -> impuesto, regimenes -> regimen.
+    if len(word) > 5 and word.endswith("es") and word[-3] in "nrsdz":
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        _stem(word)
+        for word in _WORDS.findall(normalize_text(text.lower()))
+        if word not in STOPWORDS
+    ]
+
+
+@dataclass
+class BM25Index:
+    documents: List[Document]
+    k1: float = 1.5
+    b: float = 0.75
+    _postings: Dict[str, List[Tuple[int, int]]] = field(default_factory=dict, init=False, repr=False)
+    _lengths: List[int] = field(default_factory=list, init=False, repr=False)
+    _average_length: float = field(default=0.0, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for position, document in enumerate(self.documents):
+            terms = Counter(tokenize(document.page_content))
+            self._lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                postings[term].append((position, frequency))
+        self._postings = dict(postings)
+        self._average_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "BM25Index":
+        # Same chunks and ids as the vector index, so fused results line up.
+        stored = vectorstore.get(include=["documents", "metadatas"])
+        documents = [
+            Document(page_content=content, metadata=metadata or {}, id=doc_id)
+            for doc_id, content, metadata in zip(
+                stored["ids"], stored["documents"], stored["metadatas"]
+            )
+        ]
+        return cls(documents)
+
+    def idf(self, term: str) -> float:
+        count = len(self._postings.get(term, ()))
+        total = len(self.documents)
+        return math.log(1 + (total - count + 0.5) / (count + 0.5))
+
+    def search(self, query: str, k: int = 4) -> Tuple[List[Tuple[Document, float]], float]:
+        # Returns the top k (document, score) pairs, best first, and a
+        # confidence in [0, 1]: the share of the idf weight of the query
+        # terms present in the index that the best document matches. Words
+        # the index has never seen ("saco el RUT") do not lower it, unless
+        # they are most of the query; then the confidence is 0.
+        terms = set(tokenize(query))
+        if not terms or not self.documents:
+            return [], 0.0
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, float] = defaultdict(float)
+        for term in terms:
+            idf = self.idf(term)
+            for position, frequency in self._postings.get(term, ()):
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[position] / self._average_length)
+                scores[position] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+                matched[position] += idf
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        if not ranked:
+            return [], 0.0
+        hits = [(self.documents[position], score) for position, score in ranked]
+        known = [term for term in terms if term in self._postings]
+        if len(known) * 2 < len(terms):
+            return hits, 0.0
+        return hits, matched[ranked[0][0]] / sum(self.idf(term) for term in known)
+
+
+def reciprocal_rank_fusion(*rankings: List[Document]) -> List[Tuple[Document, float]]:
+    # Fuses ranked lists by sum(1 / (RRF_K + rank)), which needs no
+    # calibration between BM25 scores and vector distances. Returns the
+    # documents with their fused position as score (lower is better, like
+    # Chroma distances).
+    fused: Dict[str, float] = defaultdict(float)
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking):
+            key = chunk_id(document)
+            fused[key] += 1.0 / (RRF_K + rank + 1)
+            documents.setdefault(key, document)
+    order = sorted(fused, key=lambda key: fused[key], reverse=True)
+    return [(documents[key], float(position)) for position, key in enumerate(order)]
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from langchain.memory import ConversationBufferMemory
+from langchain_core.language_models import BaseChatModel
+
+from sme_agent.db import (
+    Database,
+    load_conversation_summary,
+    load_messages_after,
+    save_conversation_summary,
+)
+from sme_agent.prompts import SUMMARY_PROMPT
+from sme_agent.services.history import build_summary_memory
+from sme_agent.services.tokens import count_tokens
+from sme_agent.services.tracing import span
+
+
+logger = logging.getLogger("sme_agent")
+
+# Role prefix and separators the chain adds around each history message.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@dataclass
+class TokenBudgetMemory:
+    # Fits the conversation history into max_tokens: the newest messages
+    # verbatim plus a rolling summary of everything older, stored per user.
+    # When the verbatim part no longer fits, the oldest messages are folded
+    # into the summary until the rest fits in half of the budget, so the
+    # summarization call runs every few turns and only reads the messages it
+    # folds. Only the last scan_limit unsummarized messages are considered;
+    # anything older (a long conversation from before this mode was turned
+    # on) is skipped.
+    db: Database
+    llm: BaseChatModel
+    max_tokens: int = 1500
+    summary_tokens: int = 300
+    model: str = "gpt-4o-mini"
+    scan_limit: int = 50
+
+    def message_tokens(self, item: Dict[str, str]) -> int:
+        return count_tokens(item["content"], self.model) + MESSAGE_OVERHEAD_TOKENS
+
+    def split(self, items: List[Dict], budget: int) -> Tuple[List[Dict], List[Dict]]:
+        # Returns (messages to fold into the summary, messages kept verbatim).
+        sizes = [self.message_tokens(item) for item in items]
+        if sum(sizes) <= budget:
+            return [], items
+        kept_tokens = 0
+        index = len(items)
+        while index > 0 and kept_tokens + sizes[index - 1] <= budget // 2:
+            kept_tokens += sizes[index - 1]
+            index -= 1
+        return items[:index], items[index:]
+
+    def summarize(self, summary: str, items: List[Dict]) -> str:
+        messages = "\n".join(
+            f"{'Empresario' if item['role'] == 'user' else 'Asesor'}: {item['content']}"
+            for item in items
+        )
+        prompt = SUMMARY_PROMPT.format(
+            max_words=self.summary_tokens * 3 // 4,
+            summary=summary or "(sin resumen)",
+            messages=messages,
+        )
+        with span("summarize_llm"):
+            return self.llm.invoke(prompt).content.strip()
+
+    def build(self, user_id: str) -> ConversationBufferMemory:
+        summary, through_id = load_conversation_summary(self.db, user_id)
+        items = load_messages_after(self.db, user_id, through_id, self.scan_limit)
+        budget = self.max_tokens - max(self.summary_tokens, count_tokens(summary, self.model))
+        older, recent = self.split(items, budget)
+        if older:
+            try:
+                summary = self.summarize(summary, older)
+            except Exception:
+                # The folded messages are left out of this turn and retried
+                # on the next one.
+                logger.exception("No se pudo actualizar el resumen de la conversacion")
+            else:
+                save_conversation_summary(self.db, user_id, summary, older[-1]["id"])
+        return build_summary_memory(summary, recent)
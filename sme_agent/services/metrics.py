@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import os
+import time
+from typing import Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+
+# In-process metrics for every branch of the chat handler. Under gunicorn,
+# PROMETHEUS_MULTIPROC_DIR (set in gunicorn.conf.py before the workers
+# import this module) makes each worker write its values to memory-mapped
+# files in that directory, and a scrape merges them. Nothing is read from
+# the database.
+BRANCHES = (
+    "save_preference",
+    "show_preferences",
+    "quick_reply",
+    "info",
+    "calculator",
+    "llm",
+)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CHAT_MESSAGES = Counter(
+    "sme_chat_messages_total",
+    "Mensajes de chat atendidos, por rama del enrutador.",
+    ["branch"],
+)
+CHAT_LATENCY = Histogram(
+    "sme_chat_branch_latency_seconds",
+    "Tiempo desde que llega el mensaje hasta la respuesta final, por rama.",
+    ["branch"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_CALLS = Counter(
+    "sme_llm_calls_total",
+    "Llamadas a la cadena LLM, por resultado (ok, error, cache_hit, cancelled).",
+    ["status"],
+)
+LLM_TTFT = Histogram(
+    "sme_llm_time_to_first_token_seconds",
+    "Tiempo al primer token en respuestas en streaming.",
+    buckets=LATENCY_BUCKETS,
+)
+
+for _branch in BRANCHES:
+    CHAT_MESSAGES.labels(_branch)
+    CHAT_LATENCY.labels(_branch)
+del _branch
+
+
+def observe_branch(branch: str, started_at: float) -> None:
+    CHAT_MESSAGES.labels(branch).inc()
+    CHAT_LATENCY.labels(branch).observe(time.monotonic() - started_at)
+
+
+def observe_llm_call(status: str, ttft_ms: Optional[int] = None) -> None:
+    LLM_CALLS.labels(status).inc()
+    if ttft_ms is not None:
+        LLM_TTFT.observe(ttft_ms / 1000)
+
+
+def render_latest() -> Tuple[bytes, str]:
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
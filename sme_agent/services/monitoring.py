@@ -28,7 +28,11 @@ def _extract_usage(llm_result) -> LLMUsage:
         if generations and generations[0]:
             info = generations[0][0].generation_info or {}
             usage = info.get("token_usage") or info.get("usage") or {}
-            model = model or info.get("model")
+            model = model or info.get("model") or info.get("model_name")
+            # Streamed completions only report usage on the aggregated message.
+            message = getattr(generations[0][0], "message", None)
+            if not usage and getattr(message, "usage_metadata", None):
+                usage = message.usage_metadata
 
     prompt_tokens = usage.get("prompt_tokens") or usage.get("input_tokens")
     completion_tokens = usage.get("completion_tokens") or usage.get("output_tokens")
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
 import re
-from typing import Optional, Tuple
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
 
-from sme_agent.services.classification import normalize_text
+from sme_agent.db import Database, list_preferences, save_preference
+from sme_agent.services.utterance import TextInput, as_utterance, normalize_text
 
 
 _SAVE_PATTERN = re.compile(
@@ -12,13 +16,13 @@ _SAVE_PATTERN = re.compile(
 _SHOW_PATTERN = re.compile(r"^(mis datos|mis preferencias|ver datos|ver preferencias)$")
 
 
-def parse_save_command(text: str) -> Optional[Tuple[str, str]]:
-    normalized = normalize_text(text.lower().strip())
-    if not _SAVE_PATTERN.match(normalized):
+def parse_save_command(text: TextInput) -> Optional[Tuple[str, str]]:
+    utterance = as_utterance(text)
+    lowered = utterance.stripped
+    if not _SAVE_PATTERN.match(lowered):
         return None
 
-    original = text.strip()
-    lowered = normalize_text(original.lower())
+    original = utterance.raw.strip()
     rest = original
     if lowered.startswith("guardar"):
         rest = original[len("guardar") :].strip()
@@ -41,9 +45,8 @@ def parse_save_command(text: str) -> Optional[Tuple[str, str]]:
     return key, value
 
 
-def is_show_preferences(text: str) -> bool:
-    normalized = normalize_text(text.lower().strip())
-    return bool(_SHOW_PATTERN.match(normalized))
+def is_show_preferences(text: TextInput) -> bool:
+    return bool(_SHOW_PATTERN.match(as_utterance(text).stripped))
 
 
 def format_preferences(items) -> str:
@@ -53,8 +56,8 @@ def format_preferences(items) -> str:
             "guardar: sector=alimentos o guardar: ciudad=Bogota."
         )
     lines = ["Estos son los datos guardados:", ""]
-    for item in items:
-        lines.append(f"- {item.key}: {item.value}")
+    for key, value in items:
+        lines.append(f"- {key}: {value}")
     lines.append("")
     lines.append("Si quieres actualizar alguno, escribe: guardar: clave=valor")
     return "\n".join(lines)
@@ -63,5 +66,54 @@ def format_preferences(items) -> str:
 def build_preference_context(items) -> str:
     if not items:
         return ""
-    parts = [f"{item.key}={item.value}" for item in items]
+    parts = [f"{key}={value}" for key, value in items]
     return "Datos del usuario: " + ", ".join(parts)
+
+
+@dataclass
+class PreferenceStore:
+    # Per-process read cache of each user's preferences as (key, value)
+    # tuples. Entries are tagged with a version that the caller keeps in the
+    # user's session cookie and bumps on every save, so a worker never serves
+    # preferences older than the user's last save, even when another worker
+    # handled it.
+    db: Database
+    max_users: int = 10000
+    _entries: "OrderedDict[str, Tuple[int, List[Tuple[str, str]]]]" = field(
+        default_factory=OrderedDict, init=False, repr=False
+    )
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def _cached(self, user_id: str, version: int) -> Optional[List[Tuple[str, str]]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def items(self, user_id: str, version: int = 0) -> List[Tuple[str, str]]:
+        cached = self._cached(user_id, version)
+        if cached is not None:
+            return cached
+        items = list_preferences(self.db, user_id)
+        with self._lock:
+            self._entries[user_id] = (version, items)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return items
+
+    def sidebar(self, user_id: str, version: int = 0, limit: int = 5) -> List[Tuple[str, str]]:
+        cached = self._cached(user_id, version)
+        if cached is not None:
+            return cached[:limit]
+        return list_preferences(self.db, user_id, limit=limit)
+
+    def save(self, user_id: str, key: str, value: str) -> None:
+        save_preference(self.db, user_id, key, value)
+        self.invalidate(user_id)
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
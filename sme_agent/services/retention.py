@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from sme_agent.db import ChatMessage, Database, LLMCall, RequestSpan
+
+
+# Tables the retention job prunes. Aggregates survive it: /metrics reads
+# llm_call_rollups, which keep counting archived calls.
+RETENTION_TABLES = {
+    "chat_messages": ChatMessage,
+    "llm_calls": LLMCall,
+    "request_spans": RequestSpan,
+}
+
+
+@dataclass
+class ArchiveReport:
+    table: str
+    rows: int = 0
+    batches: int = 0
+    archive_bytes: int = 0
+    seconds: float = 0.0
+    partitions: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def _to_json(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _partition(created_at: Optional[datetime]) -> str:
+    return created_at.date().isoformat() if created_at else "sin-fecha"
+
+
+def archive_table(
+    db: Database,
+    model,
+    cutoff: datetime,
+    archive_dir: Path,
+    batch_size: int = 5000,
+    dry_run: bool = False,
+) -> ArchiveReport:
+    # Streams rows created before cutoff, by id, into
+    # <archive_dir>/<table>/<YYYY-MM-DD>.jsonl.gz and deletes each batch in
+    # its own short transaction once it is on disk. Partitions are appended
+    # as extra gzip members, which gzip readers concatenate. A crash between
+    # the write and the delete archives that batch twice, never loses it.
+    table = model.__table__
+    report = ArchiveReport(table=table.name)
+    started_at = time.monotonic()
+    columns = list(table.columns)
+    last_id = 0
+    while True:
+        with db.session() as session:
+            rows = (
+                session.query(*columns)
+                .filter(model.created_at < cutoff, model.id > last_id)
+                .order_by(model.id.asc())
+                .limit(batch_size)
+                .all()
+            )
+        if not rows:
+            break
+        last_id = rows[-1].id
+        report.batches += 1
+        report.rows += len(rows)
+
+        by_partition: Dict[str, List[str]] = {}
+        for row in rows:
+            record = {column.name: _to_json(getattr(row, column.name)) for column in columns}
+            by_partition.setdefault(_partition(row.created_at), []).append(
+                json.dumps(record, ensure_ascii=False)
+            )
+        for partition, lines in by_partition.items():
+            report.partitions[partition] = report.partitions.get(partition, 0) + len(lines)
+            if dry_run:
+                continue
+            path = archive_dir / table.name / f"{partition}.jsonl.gz"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            member = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+            with open(path, "ab") as handle:
+                handle.write(member)
+                handle.flush()
+                os.fsync(handle.fileno())
+            report.archive_bytes += len(member)
+
+        if not dry_run:
+            ids = [row.id for row in rows]
+            with db.session() as session:
+                session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+    report.seconds = time.monotonic() - started_at
+    return report
+
+
+def reclaim_space(db: Database, tables: List[str]) -> None:
+    # SQLite only returns freed pages to the filesystem on VACUUM (which
+    # rewrites the file and blocks writers while it runs); the WAL is
+    # truncated afterwards. PostgreSQL's VACUUM makes the space reusable.
+    dialect = db.engine.dialect.name
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if dialect == "sqlite":
+            connection.execute(text("VACUUM"))
+            connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        elif dialect == "postgresql":
+            for table in tables:
+                connection.execute(text(f"VACUUM ANALYZE {table}"))
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+
+MAX_STEPS = 101
+MAX_SCENARIOS = 1_000_000
+# The full grid is only returned up to this many cells; larger grids are
+# still computed but answered with the summary alone.
+MAX_GRID_CELLS = 10_000
+
+INPUT_LABELS = {
+    "precio_unit": "precio",
+    "costo_variable_unit": "costo variable",
+    "costos_fijos": "costos fijos",
+    "ventas": "ventas",
+    "costo_ventas": "costo de ventas",
+    "utilidad_neta": "utilidad neta",
+    "activo_corriente": "activo corriente",
+    "pasivo_corriente": "pasivo corriente",
+    "ebitda": "EBITDA",
+    "deuda_total": "deuda total",
+    "intereses": "intereses",
+}
+
+
+@dataclass(frozen=True)
+class ScenarioModel:
+    name: str
+    inputs: Tuple[str, ...]
+    default_spreads: Mapping[str, float]
+    compute: Callable[[Dict[str, np.ndarray]], Dict[str, np.ndarray]]
+    primary: str
+    primary_label: str
+
+
+@dataclass
+class ScenarioGrid:
+    model: str
+    axes: Dict[str, np.ndarray]
+    results: Dict[str, np.ndarray]
+
+    @property
+    def size(self) -> int:
+        return int(np.prod([len(values) for values in self.axes.values()]))
+
+    def summary(self) -> Dict[str, Dict[str, Optional[float]]]:
+        summary = {}
+        for name, values in self.results.items():
+            finite = values[np.isfinite(values)]
+            if finite.size:
+                p05, p50, p95 = np.percentile(finite, [5, 50, 95])
+                stats = {
+                    "min": float(finite.min()),
+                    "p05": float(p05),
+                    "p50": float(p50),
+                    "p95": float(p95),
+                    "max": float(finite.max()),
+                }
+            else:
+                stats = {key: None for key in ("min", "p05", "p50", "p95", "max")}
+            stats["feasible_share"] = float(finite.size / values.size) if values.size else 0.0
+            summary[name] = stats
+        return summary
+
+    def to_dict(self, include_grid: bool = True) -> dict:
+        payload = {
+            "model": self.model,
+            "scenarios": self.size,
+            "axes": {name: values.tolist() for name, values in self.axes.items()},
+            "summary": self.summary(),
+        }
+        if include_grid:
+            if self.size > MAX_GRID_CELLS:
+                raise ValueError(
+                    f"La grilla tiene {self.size} escenarios; include_grid admite hasta "
+                    f"{MAX_GRID_CELLS}. Usa menos steps o solo el resumen."
+                )
+            # NaN marks infeasible scenarios and is not valid JSON.
+            payload["results"] = {
+                name: np.where(np.isfinite(values), values, None).tolist()
+                for name, values in self.results.items()
+            }
+        return payload
+
+
+def _safe_divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    numerator, denominator = np.broadcast_arrays(numerator, denominator)
+    out = np.full(numerator.shape, np.nan)
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    return out
+
+
+def _break_even(values: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    fixed_costs = values["costos_fijos"]
+    price = values["precio_unit"]
+    variable_cost = values["costo_variable_unit"]
+    contribution = price - variable_cost
+    positive = np.where(contribution > 0, contribution, 0)
+    units = _safe_divide(fixed_costs, positive)
+    return {
+        "unidades_equilibrio": units,
+        "ventas_equilibrio": units * price,
+        "margen_contribucion": _safe_divide(contribution, price),
+    }
+
+
+def _margins(values: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    ventas = values["ventas"]
+    return {
+        "margen_bruto": _safe_divide(ventas - values["costo_ventas"], ventas),
+        "margen_neto": _safe_divide(values["utilidad_neta"], ventas),
+    }
+
+
+def _liquidity(values: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    return {
+        "razon_corriente": _safe_divide(values["activo_corriente"], values["pasivo_corriente"]),
+        "capital_trabajo": values["activo_corriente"] - values["pasivo_corriente"],
+    }
+
+
+def _debt(values: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    return {
+        "deuda_ebitda": _safe_divide(values["deuda_total"], values["ebitda"]),
+        "cobertura_intereses": _safe_divide(values["ebitda"], values["intereses"]),
+    }
+
+
+SCENARIO_MODELS: Dict[str, ScenarioModel] = {
+    "break_even": ScenarioModel(
+        name="break_even",
+        inputs=("precio_unit", "costo_variable_unit", "costos_fijos"),
+        default_spreads={"precio_unit": 0.3, "costo_variable_unit": 0.2, "costos_fijos": 0.1},
+        compute=_break_even,
+        primary="ventas_equilibrio",
+        primary_label="ventas de equilibrio",
+    ),
+    "margins": ScenarioModel(
+        name="margins",
+        inputs=("ventas", "costo_ventas", "utilidad_neta"),
+        default_spreads={"ventas": 0.2, "costo_ventas": 0.2, "utilidad_neta": 0.2},
+        compute=_margins,
+        primary="margen_bruto",
+        primary_label="margen bruto",
+    ),
+    "liquidity": ScenarioModel(
+        name="liquidity",
+        inputs=("activo_corriente", "pasivo_corriente"),
+        default_spreads={"activo_corriente": 0.2, "pasivo_corriente": 0.2},
+        compute=_liquidity,
+        primary="razon_corriente",
+        primary_label="razon corriente",
+    ),
+    "debt": ScenarioModel(
+        name="debt",
+        inputs=("ebitda", "deuda_total", "intereses"),
+        default_spreads={"ebitda": 0.3, "deuda_total": 0.1, "intereses": 0.2},
+        compute=_debt,
+        primary="deuda_ebitda",
+        primary_label="Deuda/EBITDA",
+    ),
+}
+
+
+def variation_axis(base: float, spread: float, steps: int) -> np.ndarray:
+    if steps <= 1 or spread == 0:
+        return np.array([float(base)])
+    return float(base) * (1 + np.linspace(-spread, spread, steps))
+
+
+def run_scenarios(
+    model_name: str,
+    base: Mapping[str, float],
+    spreads: Optional[Mapping[str, float]] = None,
+    steps: int = 11,
+) -> ScenarioGrid:
+    model = SCENARIO_MODELS.get(model_name)
+    if model is None:
+        raise ValueError(
+            f"Modelo desconocido: {model_name}. Opciones: {', '.join(SCENARIO_MODELS)}."
+        )
+    missing = [name for name in model.inputs if base.get(name) is None]
+    if missing:
+        raise ValueError(f"Faltan datos para el escenario: {', '.join(missing)}.")
+    if not 1 <= steps <= MAX_STEPS:
+        raise ValueError(f"steps debe estar entre 1 y {MAX_STEPS}.")
+
+    spreads = {**model.default_spreads, **(spreads or {})}
+    axes = {
+        name: variation_axis(float(base[name]), float(spreads.get(name, 0)), steps)
+        for name in model.inputs
+    }
+    size = int(np.prod([len(values) for values in axes.values()]))
+    if size > MAX_SCENARIOS:
+        raise ValueError(f"Demasiados escenarios ({size}). El maximo es {MAX_SCENARIOS}.")
+
+    # Sparse open grids broadcast each formula over the full cartesian product
+    # without materializing one array per input.
+    grids = np.meshgrid(*axes.values(), indexing="ij", sparse=True)
+    inputs = dict(zip(model.inputs, grids))
+    shape = tuple(len(values) for values in axes.values())
+    results = {
+        name: np.broadcast_to(values, shape).astype(float)
+        for name, values in model.compute(inputs).items()
+    }
+    return ScenarioGrid(model=model.name, axes=axes, results=results)
+
+
+def sensitivity_rows(
+    model_name: str,
+    base: Mapping[str, float],
+    formatter: Callable[[float], str],
+    steps: int = 5,
+) -> List[str]:
+    model = SCENARIO_MODELS[model_name]
+    row_input, column_input = model.inputs[:2]
+    # Inputs beyond the two table axes stay fixed; missing ones only blank
+    # the secondary metrics that depend on them.
+    fixed = {name: base.get(name, np.nan) for name in model.inputs[2:]}
+    grid = run_scenarios(
+        model_name,
+        {**base, **fixed},
+        spreads={name: 0 for name in fixed},
+        steps=steps,
+    )
+    row_changes = np.linspace(-1, 1, steps) * model.default_spreads[row_input]
+    column_changes = np.linspace(-1, 1, steps) * model.default_spreads[column_input]
+    values = grid.results[model.primary].reshape(steps, steps)
+
+    column_labels = ", ".join(f"{change:+.0%}" for change in column_changes)
+    lines = [
+        f"Sensibilidad de {model.primary_label} "
+        f"(columnas: {INPUT_LABELS[column_input]} {column_labels}):"
+    ]
+    for change, row in zip(row_changes, values):
+        cells = " / ".join(formatter(value) if np.isfinite(value) else "n/a" for value in row)
+        row_label = INPUT_LABELS[row_input]
+        lines.append(f"- {row_label[0].upper()}{row_label[1:]} {change:+.0%}: {cells}")
+    return lines
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+
+_DONE = object()
+
+
+class StreamCancelled(Exception):
+    pass
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class TokenStream(BaseCallbackHandler):
+    # Collects tokens from LLMs that stream (only the answer LLM does; the
+    # condense-question LLM is built without streaming) and records the time
+    # to the first one. Once cancelled, the next token raises
+    # StreamCancelled inside the LLM call, which stops it.
+
+    raise_error = True
+
+    def __init__(self) -> None:
+        self.tokens: "queue.Queue[Any]" = queue.Queue()
+        self.started_at = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.cancelled = threading.Event()
+
+    @property
+    def ttft_ms(self) -> Optional[int]:
+        if self.first_token_at is None:
+            return None
+        return int((self.first_token_at - self.started_at) * 1000)
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if self.cancelled.is_set():
+            raise StreamCancelled("El cliente cerro la conexion.")
+        if not token:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self.tokens.put(token)
+
+    def run(self, func: Callable[[], Any]) -> Iterator[Tuple[str, Any]]:
+        # Runs func in a background thread and yields ("token", text) pairs
+        # as they arrive, then ("result", value) or ("error", exception).
+        # Closing the generator early cancels the stream and waits for func
+        # to return, since it writes to the caller's session.
+        outcome: Dict[str, Any] = {}
+        # The caller's context carries its unit of work and commit counter.
+        context = contextvars.copy_context()
+
+        def target() -> None:
+            try:
+                outcome["result"] = context.run(func)
+            except Exception as exc:
+                outcome["error"] = exc
+            finally:
+                self.tokens.put(_DONE)
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        try:
+            while True:
+                token = self.tokens.get()
+                if token is _DONE:
+                    break
+                yield "token", token
+        except GeneratorExit:
+            self.cancelled.set()
+            thread.join()
+            raise
+        thread.join()
+        if "error" in outcome:
+            yield "error", outcome["error"]
+        else:
+            yield "result", outcome["result"]
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import logging
+import math
+import re
+from functools import lru_cache
+from typing import Optional
+
+import tiktoken
+
+
+logger = logging.getLogger("sme_agent")
+
+# Token counts for prompt budgets, computed locally. tiktoken downloads an
+# encoding the first time it is used and keeps it in TIKTOKEN_CACHE_DIR;
+# when that fails (no network, no cached file) counts fall back to an
+# estimate that errs high, so a budget is never exceeded because of it.
+_PIECES = re.compile(r"\w+|[^\w\s]")
+_CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str) -> Optional["tiktoken.Encoding"]:
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        logger.warning("Sin codificacion de tiktoken para %s; se estiman los tokens", model)
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    return sum(
+        max(1, math.ceil(len(piece) / _CHARS_PER_TOKEN)) for piece in _PIECES.findall(text)
+    )
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4o-mini") -> str:
+    # The longest prefix of text within max_tokens, cut at a word boundary.
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    encoding = _encoding(model)
+    if encoding is not None:
+        prefix = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    else:
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if estimate_tokens(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        prefix = text[:low]
+    if len(prefix) < len(text) and not text[len(prefix)].isspace():
+        head, space, _ = prefix.rpartition(" ")
+        prefix = head if space else prefix
+    return prefix.rstrip()
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain.callbacks.base import BaseCallbackHandler
+from sqlalchemy import event
+
+
+# Per-request stage timings. A RequestTrace lives in a context variable for
+# the whole request, so code deep in the pipeline (retriever, database) can
+# add spans without threading the trace through every call; LLM stages come
+# from SpanCallback.
+_current: ContextVar[Optional["RequestTrace"]] = ContextVar("sme_request_trace", default=None)
+
+
+@dataclass
+class Span:
+    stage: str
+    start_ms: int
+    duration_ms: int
+
+
+@dataclass
+class RequestTrace:
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    branch: Optional[str] = None
+    started_at: float = field(default_factory=time.monotonic)
+    spans: List[Span] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def add(self, stage: str, started_at: float, ended_at: float) -> None:
+        span = Span(
+            stage=stage,
+            start_ms=int((started_at - self.started_at) * 1000),
+            duration_ms=int((ended_at - started_at) * 1000),
+        )
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self) -> List[Span]:
+        self.add("total", self.started_at, time.monotonic())
+        return list(self.spans)
+
+
+def start_trace() -> RequestTrace:
+    trace = RequestTrace()
+    _current.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+def set_branch(branch: str) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.branch = branch
+
+
+def instrument_sessions(session_factory) -> None:
+    # Times each commit (including its final flush) as a db_commit span.
+    @event.listens_for(session_factory, "before_commit")
+    def _before_commit(session) -> None:
+        session.info["commit_started_at"] = time.monotonic()
+
+    @event.listens_for(session_factory, "after_commit")
+    def _after_commit(session) -> None:
+        started_at = session.info.pop("commit_started_at", None)
+        trace = _current.get()
+        if trace is not None and started_at is not None:
+            trace.add("db_commit", started_at, time.monotonic())
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started_at = time.monotonic()
+    try:
+        yield
+    finally:
+        trace.add(stage, started_at, time.monotonic())
+
+
+class SpanCallback(BaseCallbackHandler):
+    # Times the LLM calls of a ConversationalRetrievalChain run. The answer
+    # call runs under the StuffDocumentsChain; any other LLM call in the run
+    # condenses the follow-up question.
+
+    def __init__(self, trace: RequestTrace) -> None:
+        self.trace = trace
+        self._chains: Dict[UUID, Tuple[Optional[UUID], str]] = {}
+        self._llm_starts: Dict[UUID, Tuple[str, float]] = {}
+
+    def on_chain_start(
+        self,
+        serialized,
+        inputs,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        name = kwargs.get("name") or ((serialized or {}).get("id") or [""])[-1]
+        self._chains[run_id] = (parent_run_id, name)
+
+    def _stage(self, parent_run_id: Optional[UUID]) -> str:
+        while parent_run_id is not None and parent_run_id in self._chains:
+            parent_run_id, name = self._chains[parent_run_id]
+            if name == "StuffDocumentsChain":
+                return "answer_llm"
+        return "condense_llm"
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID]) -> None:
+        self._llm_starts[run_id] = (self._stage(parent_run_id), time.monotonic())
+
+    def on_chat_model_start(
+        self,
+        serialized,
+        messages,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._start(run_id, parent_run_id)
+
+    def on_llm_start(
+        self,
+        serialized,
+        prompts,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._start(run_id, parent_run_id)
+
+    def _end(self, run_id: UUID) -> None:
+        started = self._llm_starts.pop(run_id, None)
+        if started is not None:
+            self.trace.add(started[0], started[1], time.monotonic())
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
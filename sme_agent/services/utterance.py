@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Optional, Tuple, Union
+
+
+NUMBER_PATTERN = r"\d{1,3}(?:[.,]\d{3})+(?:[.,]\d+)?|\d+(?:[.,]\d+)?"
+NUMBER_RE = re.compile(NUMBER_PATTERN)
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    normalized = unicodedata.normalize("NFKD", text)
+    return normalized.encode("ascii", "ignore").decode("ascii")
+
+
+def parse_number(raw: str) -> Optional[float]:
+    if not raw:
+        return None
+    raw = raw.replace(" ", "")
+    if "," in raw and "." in raw:
+        if raw.rfind(",") > raw.rfind("."):
+            decimal_sep = ","
+            thousand_sep = "."
+        else:
+            decimal_sep = "."
+            thousand_sep = ","
+        raw = raw.replace(thousand_sep, "")
+        raw = raw.replace(decimal_sep, ".")
+    else:
+        if "," in raw:
+            parts = raw.split(",")
+            if len(parts[-1]) == 3 and len(parts[0]) <= 3:
+                raw = "".join(parts)
+            else:
+                raw = raw.replace(",", ".")
+        elif "." in raw:
+            parts = raw.split(".")
+            if len(parts[-1]) == 3 and len(parts[0]) <= 3:
+                raw = "".join(parts)
+        
+    try:
+        return float(raw)
+    except ValueError:
+        return None
+
+
+@dataclass(frozen=True)
+class DetectedNumber:
+    start: int
+    end: int
+    raw: str
+    value: Optional[float]
+
+
+@dataclass(frozen=True)
+class Utterance:
+    raw: str
+    lowered: str
+    normalized: str
+
+    @classmethod
+    def from_text(cls, text: str) -> "Utterance":
+        lowered = text.lower()
+        return cls(raw=text, lowered=lowered, normalized=normalize_text(lowered))
+
+    @cached_property
+    def stripped(self) -> str:
+        return self.normalized.strip()
+
+    @cached_property
+    def token_spans(self) -> Tuple[Tuple[int, int], ...]:
+        return tuple(match.span() for match in _TOKEN_RE.finditer(self.normalized))
+
+    @cached_property
+    def numbers(self) -> Tuple[DetectedNumber, ...]:
+        return tuple(
+            DetectedNumber(
+                start=match.start(),
+                end=match.end(),
+                raw=match.group(),
+                value=parse_number(match.group()),
+            )
+            for match in NUMBER_RE.finditer(self.normalized)
+        )
+
+    @property
+    def has_digits(self) -> bool:
+        return bool(self.numbers)
+
+
+TextInput = Union[str, Utterance]
+
+
+def as_utterance(text: TextInput) -> Utterance:
+    if isinstance(text, Utterance):
+        return text
+    return Utterance.from_text(text)
@@ -16,12 +16,139 @@ function showTyping() {
   scrollToBottom();
 }
 
+function appendMessage(sender, text) {
+  const row = document.createElement('div');
+  row.className = `message-row ${sender}`;
+  const bubble = document.createElement('div');
+  bubble.className = `message bubble ${sender}`;
+  bubble.textContent = text;
+  row.appendChild(bubble);
+  if (sender === 'user') {
+    const avatar = document.createElement('div');
+    avatar.className = 'avatar';
+    avatar.setAttribute('aria-hidden', 'true');
+    avatar.textContent = 'U';
+    row.appendChild(avatar);
+  }
+  typingIndicator.before(row);
+  scrollToBottom();
+  return bubble;
+}
+
+function renderPreferences(preferences) {
+  const card = document.getElementById('preferences');
+  if (!card) {
+    return;
+  }
+  card.querySelectorAll('.pref-list, p').forEach((node) => node.remove());
+  const list = document.createElement('ul');
+  list.className = 'pref-list';
+  preferences.forEach(([key, value]) => {
+    const item = document.createElement('li');
+    const name = document.createElement('span');
+    name.textContent = key;
+    const saved = document.createElement('strong');
+    saved.textContent = value;
+    item.append(name, saved);
+    list.appendChild(item);
+  });
+  card.appendChild(list);
+}
+
+function parseEvent(block) {
+  let event = 'message';
+  let data = '';
+  block.split('\n').forEach((line) => {
+    if (line.startsWith('event: ')) {
+      event = line.slice(7);
+    } else if (line.startsWith('data: ')) {
+      data += line.slice(6);
+    }
+  });
+  return { event, data: data ? JSON.parse(data) : {} };
+}
+
+async function streamMessage(text) {
+  const body = new FormData();
+  body.append('user_input', text);
+  const response = await fetch('/api/chat/stream', { method: 'POST', body });
+  if (!response.ok || !response.body) {
+    throw new Error(`HTTP ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let bubble = null;
+  let answer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) {
+      break;
+    }
+    buffer += decoder.decode(value, { stream: true });
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const { event, data } = parseEvent(buffer.slice(0, boundary));
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+      if (!bubble) {
+        typingIndicator.style.display = 'none';
+        bubble = appendMessage('bot', '');
+      }
+      if (event === 'token') {
+        answer += data.text;
+        bubble.textContent = answer;
+      } else if (event === 'done') {
+        // The final HTML is rendered and sanitized by the server.
+        bubble.innerHTML = data.html;
+        if (data.preferences) {
+          renderPreferences(data.preferences);
+        }
+      }
+      scrollToBottom();
+    }
+  }
+}
+
+async function sendMessage() {
+  const text = textarea.value.trim();
+  if (!text) {
+    return;
+  }
+  if (!window.fetch || !window.ReadableStream) {
+    showTyping();
+    form.submit();
+    return;
+  }
+  textarea.value = '';
+  appendMessage('user', text);
+  const quickReplies = document.querySelector('.quick-replies');
+  if (quickReplies) {
+    quickReplies.remove();
+  }
+  showTyping();
+  try {
+    await streamMessage(text);
+  } catch (error) {
+    appendMessage('bot', 'No pude conectar con el asesor. Intenta de nuevo.');
+  } finally {
+    typingIndicator.style.display = 'none';
+  }
+}
+
+if (form) {
+  form.addEventListener('submit', (event) => {
+    event.preventDefault();
+    sendMessage();
+  });
+}
+
 if (textarea) {
   textarea.addEventListener('keydown', (event) => {
     if (!event.shiftKey && event.key === 'Enter') {
       event.preventDefault();
-      showTyping();
-      form.submit();
+      sendMessage();
     }
   });
 }
@@ -29,8 +156,7 @@ if (textarea) {
 document.querySelectorAll('.qr-btn').forEach((btn) => {
   btn.addEventListener('click', () => {
     textarea.value = btn.textContent;
-    showTyping();
-    form.submit();
+    sendMessage();
   });
 });
 
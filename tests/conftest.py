@@ -0,0 +1,57 @@
+from typing import List
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.retrievers import BaseRetriever
+
+from sme_agent import factory
+from sme_agent.chains import ChainPool
+from sme_agent.config import Settings
+
+
+class StaticRetriever(BaseRetriever):
+    documents: List[Document] = []
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return list(self.documents)
+
+
+class StreamingFakeChatModel(FakeListChatModel):
+    # Streams character by character through callbacks, like ChatOpenAI
+    # with streaming=True.
+    def _should_stream(self, **kwargs) -> bool:
+        return True
+
+
+@pytest.fixture
+def settings(tmp_path):
+    return Settings(
+        openai_api_key="test-key",
+        database_url=f"sqlite:///{tmp_path / 'app.db'}",
+    )
+
+
+@pytest.fixture
+def app(settings, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", settings.openai_api_key)
+    monkeypatch.setattr(factory, "Settings", lambda: settings)
+    monkeypatch.setattr(factory, "build_retriever", lambda settings: StaticRetriever())
+    return factory.create_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def fake_chains(app, settings):
+    pool = ChainPool(
+        settings,
+        StaticRetriever(documents=[Document(page_content="El regimen simple agrupa impuestos.")]),
+        llm=FakeListChatModel(responses=["Te conviene el **regimen simple**."]),
+        streaming_llm=StreamingFakeChatModel(responses=["Te conviene el **regimen simple**."]),
+    )
+    app.config["CHAINS"] = pool
+    return pool
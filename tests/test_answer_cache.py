@@ -0,0 +1,94 @@
+import threading
+import uuid
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from sme_agent.chains import CachedConversationalRetrievalChain, CustomThresholdRetriever, build_prompt
+from sme_agent.db import AnswerCacheEntry, Database, save_cached_answer
+from sme_agent.services.answer_cache import AnswerCache
+
+
+def make_cache(**kwargs):
+    db = Database("sqlite://")
+    db.init_db()
+    return AnswerCache(db=db, settings_key="gpt|0.6|prompt", **kwargs)
+
+
+def test_exact_lookup_normalizes_question():
+    cache = make_cache()
+    cache.store("Que impuestos debo pagar?", ["a", "b"], "Respuesta", "sector=retail")
+    assert cache.lookup("  que IMPUESTOS debo  pagar", ["b", "a"], "sector=retail").kind == "exact"
+    assert cache.lookup("que impuestos debo pagar", ["a"], "sector=retail") is None
+    assert cache.lookup("que impuestos debo pagar", ["a", "b"], "sector=salud") is None
+
+
+def test_similarity_lookup_within_context():
+    cache = make_cache(similarity_threshold=0.9)
+    cache.store("que impuestos debo pagar", ["a"], "Respuesta", embedding=[1.0, 0.0, 0.2])
+    hit = cache.lookup("cuales impuestos pago", ["a"], embedding=[0.98, 0.05, 0.2])
+    assert hit.kind == "similar" and hit.answer == "Respuesta"
+    assert cache.lookup("cuales impuestos pago", ["a"], embedding=[0.0, 1.0, 0.0]) is None
+
+
+def test_eviction_by_ttl_and_size():
+    cache = make_cache(max_entries=2)
+    for index in range(4):
+        cache.store(f"pregunta {index}", ["a"], "Respuesta")
+    cache.lookup("pregunta 0", ["a"])
+    assert cache.evict() == 2
+    with cache.db.session() as session:
+        remaining = {row.question for row in session.query(AnswerCacheEntry)}
+    assert remaining == {"pregunta 0", "pregunta 3"}
+
+    expired = make_cache(ttl_seconds=-1)
+    expired.store("pregunta", ["a"], "Respuesta")
+    assert expired.lookup("pregunta", ["a"]) is None
+
+
+def test_chain_serves_repeated_question_from_cache():
+    vectorstore = Chroma(
+        collection_name=f"test-{uuid.uuid4().hex}",
+        embedding_function=DeterministicFakeEmbedding(size=16),
+    )
+    vectorstore.add_documents([Document(page_content="El IVA general es del 19%.")], ids=["iva"])
+    llm = FakeListChatModel(responses=["Primera respuesta", "Segunda respuesta"])
+    chain = CachedConversationalRetrievalChain.from_llm(
+        llm=llm,
+        retriever=CustomThresholdRetriever(vectorstore=vectorstore, threshold=1e9),
+        combine_docs_chain_kwargs={"prompt": build_prompt()},
+        answer_cache=make_cache(),
+    )
+
+    first = chain.invoke({"question": "Que IVA cobro?", "chat_history": []})
+    second = chain.invoke({"question": "que iva cobro", "chat_history": []})
+
+    assert first["answer"] == second["answer"] == "Primera respuesta"
+    assert "cache_hit" not in first
+    assert second["cache_hit"] == "exact"
+
+
+def test_concurrent_saves_of_the_same_key_do_not_conflict(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'app.db'}")
+    db.init_db()
+    barrier = threading.Barrier(2)
+    errors = []
+
+    def save(answer):
+        try:
+            with db.unit_of_work():
+                save_cached_answer(db, "k", "ctx", "pregunta", None, answer)
+                barrier.wait()
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=save, args=(answer,)) for answer in ("uno", "dos")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with db.session() as session:
+        assert [entry.answer for entry in session.query(AnswerCacheEntry)] in (["uno"], ["dos"])
@@ -1,4 +1,11 @@
-from sme_agent.services.calculators import parse_number, build_break_even, build_cashflow
+from sme_agent.services.calculators import (
+    build_break_even,
+    build_cashflow,
+    extract_all,
+    extract_amounts,
+    extract_percent,
+    parse_number,
+)
 
 
 def test_parse_number_with_thousands():
@@ -23,3 +30,33 @@ def test_cashflow_response():
     result = build_cashflow(text)
     assert result is not None
     assert "flujo de caja" in result.response.lower()
+
+
+def test_extract_amounts_keeps_unseparated_numbers():
+    text = "calcular punto de equilibrio: costos fijos 1000000, precio 12000, costo variable 5000"
+    assert extract_amounts(text) == {
+        "costos_fijos": 1000000.0,
+        "costo_variable_unit": 5000.0,
+        "precio_unit": 12000.0,
+    }
+
+
+def test_extract_amounts_slot_priority_and_overlaps():
+    text = (
+        "Ingresos 900.000\nVentas: 5.000.000\nCosto de ventas 3.000.000\n"
+        "Gastos fijos 1.200.000\nGastos financieros 200.000"
+    )
+    assert extract_amounts(text) == {
+        "ventas": 5000000.0,
+        "costos_fijos": 1200000.0,
+        "egresos": 1200000.0,
+        "costo_ventas": 3000000.0,
+        "intereses": 200000.0,
+    }
+
+
+def test_extract_all_reads_percent_slots():
+    extraction = extract_all("costos fijos 2.000.000 y margen de contribucion del 40 %")
+    assert extraction.amounts == {"costos_fijos": 2000000.0}
+    assert extraction.percents == {"margen de contribucion": 0.4}
+    assert extract_percent("margen de contribucion 12,5%", "margen de contribucion") == 0.125
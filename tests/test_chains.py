@@ -0,0 +1,20 @@
+from sme_agent.chains import ChainPool
+from sme_agent.services.history import build_memory
+
+from conftest import StaticRetriever
+
+
+def test_chain_pool_shares_skeleton_and_swaps_memory(settings, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", settings.openai_api_key)
+    pool = ChainPool(settings, StaticRetriever())
+    first_memory = build_memory({}, 4, chat_items=[{"role": "user", "content": "hola"}])
+    second_memory = build_memory({}, 4, chat_items=[])
+
+    first = pool.get(first_memory)
+    second = pool.get(second_memory)
+
+    assert first.memory is first_memory
+    assert second.memory is second_memory
+    assert pool.skeleton.memory is None
+    assert first.combine_docs_chain is second.combine_docs_chain is pool.skeleton.combine_docs_chain
+    assert first.question_generator.llm is pool.llm
@@ -0,0 +1,35 @@
+from langchain_core.documents import Document
+
+from sme_agent.services.context import pack_passages
+from sme_agent.services.indexing import build_splitter
+from sme_agent.services.tokens import count_tokens
+
+
+SENTENCES = [f"Paso {number}: revisa el flujo de caja de la semana {number} y ajusta los pagos." for number in range(40)]
+
+
+def test_overlapping_chunks_of_a_source_are_merged():
+    page = Document(page_content=" ".join(SENTENCES), metadata={"source": "https://example.com"})
+    chunks = build_splitter().split_documents([page])
+    assert len(chunks) > 2
+    scored = [(chunk, 0.1 * (len(chunks) - index)) for index, chunk in enumerate(chunks)]
+
+    packed = pack_passages(scored)
+
+    assert len(packed) == 1
+    assert packed[0].page_content == page.page_content
+    assert sum(len(chunk.page_content) for chunk in chunks) > len(page.page_content)
+
+
+def test_passages_are_deduplicated_ordered_and_cut_to_the_budget():
+    far = Document(page_content="Leasing financiero. " * 60, metadata={"source": "b.md"})
+    close = Document(page_content="El regimen simple agrupa impuestos.", metadata={"source": "a.md"})
+    copy = Document(page_content="El regimen simple agrupa impuestos.", metadata={"source": "c.md"})
+    unrelated = Document(page_content="Credito de fomento. " * 60, metadata={"source": "d.md"})
+
+    packed = pack_passages([(far, 0.2), (copy, 0.15), (close, 0.1), (unrelated, 0.25)], max_tokens=120)
+
+    assert packed[0] is close
+    assert [doc.metadata["source"] for doc in packed] == ["a.md", "b.md"]
+    assert sum(count_tokens(doc.page_content) for doc in packed) <= 120
+    assert packed[1].page_content.startswith("Leasing financiero.")
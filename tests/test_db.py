@@ -0,0 +1,238 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import event, inspect, text
+
+from sme_agent.db import (
+    Database,
+    LLMCall,
+    StorageProfile,
+    User,
+    ensure_user,
+    get_llm_stats,
+    histogram_quantile,
+    list_message_page,
+    list_preferences,
+    load_recent_messages,
+    rebuild_llm_rollups,
+    save_chat_message,
+    save_llm_call,
+    save_preference,
+    utcnow,
+)
+
+
+def test_init_db_adds_new_nullable_columns(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'old.db'}")
+    with db.engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE llm_calls (id INTEGER PRIMARY KEY, user_id VARCHAR(36) NOT NULL, "
+                "model VARCHAR(120), latency_ms INTEGER NOT NULL, prompt_tokens INTEGER, "
+                "completion_tokens INTEGER, total_tokens INTEGER, status VARCHAR(20) NOT NULL, "
+                "error_message TEXT, created_at DATETIME NOT NULL)"
+            )
+        )
+    db.init_db()
+    columns = {column["name"] for column in inspect(db.engine).get_columns("llm_calls")}
+    assert "ttft_ms" in columns
+
+
+def test_helpers_return_loaded_rows():
+    db = Database("sqlite://")
+    db.init_db()
+    ensure_user(db, "u1")
+    save_preference(db, "u1", "sector", "retail")
+    save_chat_message(db, "u1", "user", "hola")
+
+    assert list_preferences(db, "u1") == [("sector", "retail")]
+    assert load_recent_messages(db, "u1", 4) == [{"role": "user", "content": "hola"}]
+
+
+def test_unit_of_work_shares_one_transaction():
+    db = Database("sqlite://")
+    db.init_db()
+    ensure_user(db, "u1")
+    db.start_request()
+    with db.unit_of_work():
+        ensure_user(db, "u1")
+        save_chat_message(db, "u1", "user", "hola")
+        save_chat_message(db, "u1", "assistant", "hola!")
+    assert db.finish_request() == 1
+    assert len(load_recent_messages(db, "u1", 4)) == 2
+
+
+def test_write_behind_telemetry_is_flushed_in_batches():
+    db = Database("sqlite://")
+    db.init_db()
+    ensure_user(db, "u1")
+    db.enable_write_behind(flush_interval=60)
+    for _ in range(3):
+        save_llm_call(db, "u1", "gpt", 100, 10, 5, 15, "ok", None)
+    assert get_llm_stats(db)["total_calls"] == 0
+
+    assert db.telemetry.flush() == 3
+    assert get_llm_stats(db)["total_calls"] == 3
+
+
+def test_known_user_skips_the_users_table(tmp_path):
+    url = f"sqlite:///{tmp_path / 'app.db'}"
+    db = Database(url)
+    db.init_db()
+    statements = []
+    event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    ensure_user(db, "u1")
+    assert any("users" in statement for statement in statements)
+    statements.clear()
+    ensure_user(db, "u1")
+    assert statements == []
+
+    # Another worker sees the user for the first time: the insert is a no-op.
+    other = Database(url)
+    ensure_user(other, "u1")
+    with other.session() as session:
+        assert session.query(User).count() == 1
+
+
+def test_new_user_does_not_hold_the_write_lock(tmp_path):
+    url = f"sqlite:///{tmp_path / 'app.db'}"
+    db = Database(url)
+    db.init_db()
+    other = Database(url, profile=StorageProfile(sqlite_busy_timeout_ms=0))
+    with db.unit_of_work():
+        ensure_user(db, "u1")
+        # Another worker can still write while this request is in progress.
+        ensure_user(other, "u2")
+        save_chat_message(db, "u1", "user", "hola")
+    assert db.is_known_user("u1")
+    assert load_recent_messages(other, "u1", 1) == [{"role": "user", "content": "hola"}]
+
+
+def test_sqlite_file_uses_the_storage_profile(tmp_path):
+    db = Database(
+        f"sqlite:///{tmp_path / 'app.db'}",
+        profile=StorageProfile(sqlite_busy_timeout_ms=1234, pool_size=3),
+    )
+    with db.engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() == 1234
+    assert db.engine.pool.size() == 3
+    with pytest.raises(ValueError):
+        StorageProfile(sqlite_journal_mode="wal; DROP TABLE users")
+
+
+def test_init_db_adds_history_index_to_existing_table(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'old.db'}")
+    with db.engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE chat_messages (id INTEGER PRIMARY KEY, user_id VARCHAR(36) NOT NULL, "
+                "role VARCHAR(20) NOT NULL, content TEXT NOT NULL, created_at DATETIME NOT NULL)"
+            )
+        )
+    db.init_db()
+    indexes = {index["name"] for index in inspect(db.engine).get_indexes("chat_messages")}
+    assert "ix_chat_messages_user_id_id" in indexes
+
+    with db.engine.connect() as connection:
+        plan = connection.execute(
+            text(
+                "EXPLAIN QUERY PLAN SELECT id, role, content FROM chat_messages "
+                "WHERE user_id = 'u1' AND id < 100 ORDER BY id DESC LIMIT 20"
+            )
+        ).fetchall()
+    details = " ".join(str(row[-1]) for row in plan)
+    # SQLite may pick either user_id index (both end in the rowid); neither
+    # needs a sort.
+    assert "USING INDEX ix_chat_messages_user_id" in details
+    assert "TEMP B-TREE" not in details
+
+
+def test_message_pages_walk_back_without_gaps():
+    db = Database("sqlite://")
+    db.init_db()
+    ensure_user(db, "u1")
+    ensure_user(db, "u2")
+    with db.unit_of_work():
+        for index in range(7):
+            save_chat_message(db, "u1", "user", f"m{index}")
+            save_chat_message(db, "u2", "user", "otro")
+
+    seen = []
+    before = None
+    while True:
+        messages, before = list_message_page(db, "u1", 3, before_id=before)
+        seen = [message["content"] for message in messages] + seen
+        if before is None:
+            break
+    assert seen == [f"m{index}" for index in range(7)]
+    assert load_recent_messages(db, "u1", 2) == [
+        {"role": "user", "content": "m5"},
+        {"role": "user", "content": "m6"},
+    ]
+
+
+def test_llm_stats_come_from_rollups():
+    db = Database("sqlite://")
+    db.init_db()
+    ensure_user(db, "u1")
+    for latency in (100, 200, 300, 400, 5000):
+        save_llm_call(db, "u1", "gpt", latency, 100, 50, 150, "ok", None, ttft_ms=80)
+    save_llm_call(db, "u1", "gpt", 900, None, None, None, "error", "boom")
+    save_llm_call(db, "u1", "otro", 10, None, None, None, "cache_hit", None)
+
+    stats = get_llm_stats(db)
+    assert stats["total_calls"] == 7
+    assert stats["error_calls"] == 1
+    assert stats["cache_hits"] == 1
+    assert stats["avg_latency_ms"] == 1150.0
+    assert stats["avg_total_tokens"] == 150.0
+    assert stats["avg_ttft_ms"] == 80.0
+    assert 250 <= stats["latency_ms"]["p50"] <= 500
+    assert stats["latency_ms"]["p99"] > 4000
+    assert set(stats["models"]) == {"gpt", "otro"}
+    assert stats["models"]["otro"]["latency_ms"]["p50"] is None
+
+    # Deleting raw rows does not change the rollups.
+    with db.session() as session:
+        session.query(LLMCall).delete()
+    assert get_llm_stats(db)["total_calls"] == 7
+    assert get_llm_stats(db, window="5m", now=utcnow() + timedelta(days=1))["total_calls"] == 0
+
+
+def test_rollups_are_written_when_the_unit_of_work_commits():
+    db = Database("sqlite://")
+    db.init_db()
+    ensure_user(db, "u1")
+    writes = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.startswith(("INSERT", "UPDATE")):
+            writes.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    with db.unit_of_work():
+        save_llm_call(db, "u1", "gpt", 100, 10, 5, 15, "ok", None)
+        assert writes == []
+    assert any("llm_call_rollups" in statement for statement in writes)
+    assert get_llm_stats(db)["total_calls"] == 1
+
+
+def test_rebuild_llm_rollups_matches_incremental_updates():
+    db = Database("sqlite://")
+    db.init_db()
+    ensure_user(db, "u1")
+    for latency in (120, 700, 2500):
+        save_llm_call(db, "u1", "gpt", latency, 10, 5, 15, "ok", None)
+    before = get_llm_stats(db, window="all")
+    assert rebuild_llm_rollups(db, batch_size=2, force=True) == 3
+    assert get_llm_stats(db, window="all") == before
+
+
+def test_histogram_quantile_interpolates_within_bin():
+    bins = (100, 200, 400)
+    assert histogram_quantile(0.5, bins, {}) is None
+    assert histogram_quantile(0.5, bins, {1: 10}) == 150.0
+    assert histogram_quantile(0.99, bins, {0: 1, 3: 1}) == 400.0
@@ -0,0 +1,61 @@
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from sme_agent.chains import embedding_namespace
+from sme_agent.config import Settings
+from sme_agent.services.embeddings import CachedEmbeddings, EmbeddingStore
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.embedded: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [[float(len(text)), 0.5, -1.25] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def test_memory_cache_embeds_each_text_once():
+    underlying = CountingEmbeddings()
+    embeddings = CachedEmbeddings(underlying, namespace="model")
+
+    vectors = embeddings.embed_documents(["a", "bb", "a"])
+    assert vectors == [[1.0, 0.5, -1.25], [2.0, 0.5, -1.25], [1.0, 0.5, -1.25]]
+    assert embeddings.embed_query("bb") == [2.0, 0.5, -1.25]
+    assert underlying.embedded == ["a", "bb"]
+    assert embeddings.memory_hits == 1
+
+
+def test_disk_store_survives_new_instances(tmp_path):
+    path = str(tmp_path / "cache" / "embeddings.sqlite3")
+    first = CountingEmbeddings()
+    CachedEmbeddings(first, "model", EmbeddingStore(path)).embed_documents(["chunk 1", "chunk 2"])
+
+    second = CountingEmbeddings()
+    embeddings = CachedEmbeddings(second, "model", EmbeddingStore(path))
+    vectors = embeddings.embed_documents(["chunk 1", "chunk 2", "chunk 3"])
+
+    assert second.embedded == ["chunk 3"]
+    assert vectors[0] == [7.0, 0.5, -1.25]
+    assert embeddings.disk_hits == 2
+
+    other_model = CountingEmbeddings()
+    CachedEmbeddings(other_model, "other", EmbeddingStore(path)).embed_query("chunk 1")
+    assert other_model.embedded == ["chunk 1"]
+
+
+def test_memory_lru_is_bounded():
+    embeddings = CachedEmbeddings(CountingEmbeddings(), "model", memory_size=2)
+    embeddings.embed_documents(["a", "b", "c"])
+    assert len(embeddings._memory) == 2
+
+
+def test_namespace_separates_compatible_endpoints():
+    real = Settings(embedding_model="text-embedding-3-small", openai_base_url="")
+    fake = Settings(embedding_model="text-embedding-3-small", openai_base_url="http://127.0.0.1:8000/v1")
+    assert embedding_namespace(real) == "text-embedding-3-small"
+    assert embedding_namespace(fake) != embedding_namespace(real)
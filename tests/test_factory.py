@@ -0,0 +1,96 @@
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from sqlalchemy import event
+
+
+def test_scenarios_endpoint_from_text(client):
+    response = client.post(
+        "/api/scenarios",
+        json={
+            "model": "break_even",
+            "text": "costos fijos 1000000 precio 12000 costo variable 5000",
+            "steps": 21,
+        },
+    )
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload["scenarios"] == 21 * 21 * 21
+    assert "results" not in payload
+    assert payload["summary"]["ventas_equilibrio"]["feasible_share"] == 1.0
+
+
+def test_scenarios_endpoint_caps_returned_grid(client):
+    request = {"model": "break_even", "text": "costos fijos 1000000 precio 12000 costo variable 5000"}
+    response = client.post("/api/scenarios", json={**request, "steps": 5, "include_grid": True})
+    assert len(response.get_json()["results"]["ventas_equilibrio"]) == 5
+
+    response = client.post("/api/scenarios", json={**request, "steps": 100, "include_grid": True})
+    assert response.status_code == 400
+    assert "include_grid" in response.get_json()["error"]
+
+
+def test_scenarios_endpoint_rejects_missing_inputs(client):
+    response = client.post("/api/scenarios", json={"model": "liquidity", "base": {"activo_corriente": 10}})
+    assert response.status_code == 400
+    assert "pasivo_corriente" in response.get_json()["error"]
+
+
+def test_llm_turn_commits_once(app, client, fake_chains):
+    db = app.config["DB"]
+    client.get("/")
+    client.post("/", data={"user_input": "guardar: sector=alimentos"})
+    before = db.commit_stats()
+
+    response = client.post("/", data={"user_input": "Que regimen tributario me conviene?"})
+    assert "regimen simple" in response.get_data(as_text=True)
+    assert "alimentos" in response.get_data(as_text=True)
+
+    after = db.commit_stats()
+    assert after["requests"] == before["requests"] + 1
+    assert after["commits"] == before["commits"] + 1
+
+
+def test_llm_call_holds_no_database_connection(app, client, fake_chains, monkeypatch):
+    pool = app.config["DB"].engine.pool
+    checked_out = []
+    call = FakeListChatModel._call
+
+    def record(self, *args, **kwargs):
+        checked_out.append(pool.checkedout())
+        return call(self, *args, **kwargs)
+
+    monkeypatch.setattr(FakeListChatModel, "_call", record)
+    client.get("/")
+    client.post("/", data={"user_input": "hola"})
+    client.post("/", data={"user_input": "Que regimen tributario me conviene?"})
+    assert checked_out and set(checked_out) == {0}
+
+
+def test_repeat_llm_turn_reads_no_preferences(app, client, fake_chains):
+    client.get("/")
+    client.post("/", data={"user_input": "guardar: sector=alimentos"})
+    client.post("/", data={"user_input": "Que regimen tributario me conviene?"})
+
+    reads = []
+
+    def count(conn, cursor, statement, *args):
+        if statement.startswith("SELECT") and "user_preferences" in statement:
+            reads.append(statement)
+
+    event.listen(app.config["DB"].engine, "before_cursor_execute", count)
+    response = client.post("/", data={"user_input": "Y como formalizo mi negocio?"})
+    assert "alimentos" in response.get_data(as_text=True)
+    assert reads == []
+
+
+def test_history_endpoint_pages_with_cursor(client):
+    client.get("/")
+    for text in ("hola", "gracias", "hola"):
+        client.post("/", data={"user_input": text})
+
+    first = client.get("/api/history?limit=4").get_json()
+    assert len(first["messages"]) == 4
+    assert first["messages"][-1]["role"] == "assistant"
+    second = client.get(f"/api/history?limit=4&before={first['next_before']}").get_json()
+    assert len(second["messages"]) == 2
+    assert second["next_before"] is None
+    assert client.get("/api/history?before=abc").status_code == 400
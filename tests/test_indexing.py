@@ -0,0 +1,85 @@
+import uuid
+from typing import List
+
+import pytest
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from sme_agent.services.indexing import load_manifest, update_index
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    embedded: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def paragraphs(prefix: str, count: int) -> str:
+    return "\n\n".join(f"{prefix} parrafo {index}. " + "texto " * 120 for index in range(count))
+
+
+def make_store(embeddings):
+    return Chroma(collection_name=f"test-{uuid.uuid4().hex}", embedding_function=embeddings)
+
+
+def test_update_embeds_only_changed_chunks(tmp_path):
+    embeddings = CountingEmbeddings(size=8, embedded=[])
+    store = make_store(embeddings)
+    path = str(tmp_path / "manifest.json")
+    docs = [
+        Document(page_content=paragraphs("finanzas", 4), metadata={"source": "finanzas.md"}),
+        Document(page_content=paragraphs("basicos", 3), metadata={"source": "basicos.md"}),
+    ]
+
+    first = update_index(store, docs, path, "model")
+    assert first.reset and first.deleted == 0
+    total = first.added
+    assert len(store.get()["ids"]) == total == len(embeddings.embedded)
+
+    embeddings.embedded.clear()
+    assert not update_index(store, docs, path, "model").changed
+    assert embeddings.embedded == []
+
+    docs[0] = Document(
+        page_content=docs[0].page_content.replace("finanzas parrafo 2", "finanzas parrafo dos"),
+        metadata={"source": "finanzas.md"},
+    )
+    report = update_index(store, docs, path, "model")
+    assert report.changed_sources == ["finanzas.md"]
+    assert report.added == report.deleted == len(embeddings.embedded) == 1
+    assert len(store.get()["ids"]) == total
+
+
+def test_update_removes_missing_sources_and_resets_on_new_model(tmp_path):
+    store = make_store(CountingEmbeddings(size=8, embedded=[]))
+    path = str(tmp_path / "manifest.json")
+    docs = [
+        Document(page_content="Contenido A", metadata={"source": "a.md"}),
+        Document(page_content="Contenido B", metadata={"source": "b.md"}),
+    ]
+    update_index(store, docs, path, "model")
+
+    report = update_index(store, docs[:1], path, "model")
+    assert report.removed_sources == ["b.md"] and report.deleted == 1
+    assert store.get()["documents"] == ["Contenido A"]
+    assert set(load_manifest(path)["sources"]) == {"a.md"}
+
+    dry_run = update_index(store, docs, path, "other-model", dry_run=True)
+    assert dry_run.reset and dry_run.added == 2
+    assert load_manifest(path)["signature"]["embedding_model"] == "model"
+
+
+def test_empty_split_leaves_the_index_untouched(tmp_path):
+    store = make_store(CountingEmbeddings(size=8, embedded=[]))
+    path = str(tmp_path / "manifest.json")
+    update_index(store, [Document(page_content="Contenido A", metadata={"source": "a.md"})], path, "model")
+
+    blank = [Document(page_content="  \n\n ", metadata={"source": "a.md"})]
+    for full in (False, True):
+        with pytest.raises(RuntimeError):
+            update_index(store, blank, path, "model", full=full)
+        assert store.get()["documents"] == ["Contenido A"]
+        assert set(load_manifest(path)["sources"]) == {"a.md"}
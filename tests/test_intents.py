@@ -0,0 +1,28 @@
+from sme_agent.services.intents import Intent, IntentMatcher, match_intent
+
+
+def test_match_intent_uses_priority_not_position():
+    match = match_intent("que rentabilidad tiene mi punto de equilibrio")
+    assert match.intent == Intent.BREAK_EVEN
+    assert match.use_calculator is True
+
+
+def test_match_intent_calculator_trigger():
+    assert match_intent("explicame el flujo de caja") == match_intent("flujo de caja")
+    assert match_intent("flujo de caja").use_calculator is False
+    assert match_intent("calcula el flujo de caja").use_calculator is True
+    assert match_intent("flujo de caja con ingresos 100").use_calculator is True
+    assert match_intent("que impuestos debo pagar").intent == Intent.GENERAL
+
+
+def test_intent_matcher_registration():
+    matcher = IntentMatcher(calculator_triggers=[r"calcula"])
+    matcher.register("payroll", [r"nomina", r"prestaciones sociales"])
+    matcher.register("taxes", [r"impuestos?", r"\biva\b"], always_calculate=True)
+
+    assert matcher.match("cuanto iva pago").intent == "taxes"
+    assert matcher.match("cuanto iva pago").use_calculator is True
+    assert matcher.match("impuestos de la nomina").intent == "payroll"
+    assert matcher.match("impuestos de la nomina").use_calculator is False
+    assert matcher.match("calcula la nomina").use_calculator is True
+    assert matcher.match("hola").intent == Intent.GENERAL
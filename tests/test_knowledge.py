@@ -0,0 +1,121 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import uuid
+
+import pytest
+from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from sme_agent.services.indexing import load_manifest, update_index
+from sme_agent.services.knowledge import WebFetcher, load_web_documents
+
+
+class _PageHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        return
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get("If-None-Match")))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        time.sleep(server.delay)
+        # Released before the response is sent: once the client has the body
+        # it may start its next request to the host.
+        with server.lock:
+            server.active -= 1
+        if self.path == "/missing" or self.path in server.failing:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = f'"{server.version}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = f"<html><head><title>x</title></head><body><p>Pagina {self.path} v{server.version}</p></body></html>"
+        raw = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+@pytest.fixture
+def web_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _PageHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = []
+    server.active = 0
+    server.max_active = 0
+    server.delay = 0.0
+    server.version = 1
+    server.failing = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    server.url = f"http://{host}:{port}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_uses_conditional_requests(web_server, tmp_path):
+    urls = [f"{web_server.url}/a", f"{web_server.url}/b"]
+    fetcher = WebFetcher(cache_dir=str(tmp_path))
+
+    documents = load_web_documents(urls, fetcher)
+    assert [doc.page_content for doc in documents] == ["Pagina /a v1", "Pagina /b v1"]
+    assert [doc.metadata["source"] for doc in documents] == urls
+
+    results = fetcher.fetch_all(urls)
+    assert {result.status for result in results} == {"not_modified"}
+    assert all(etag == '"1"' for _, etag in web_server.requests[2:])
+
+    web_server.version = 2
+    assert fetcher.fetch(urls[0]).status == "fetched"
+    assert "v2" in load_web_documents(urls[:1], fetcher)[0].page_content
+
+
+def test_fresh_cache_skips_requests_and_failures_fall_back(web_server, tmp_path):
+    url = f"{web_server.url}/a"
+    WebFetcher(cache_dir=str(tmp_path)).fetch(url)
+
+    assert WebFetcher(cache_dir=str(tmp_path), max_age_seconds=60).fetch(url).status == "fresh"
+    assert len(web_server.requests) == 1
+
+    results = WebFetcher(cache_dir=str(tmp_path)).fetch_all([f"{web_server.url}/missing", url])
+    assert [result.status for result in results] == ["failed", "not_modified"]
+
+
+def test_failed_fetch_keeps_indexed_chunks(web_server, tmp_path):
+    urls = [f"{web_server.url}/a", f"{web_server.url}/b"]
+    store = Chroma(
+        collection_name=f"test-{uuid.uuid4().hex}", embedding_function=DeterministicFakeEmbedding(size=8)
+    )
+    path = str(tmp_path / "manifest.json")
+    update_index(store, load_web_documents(urls, WebFetcher()), path, "model")
+
+    web_server.failing = {"/b"}
+    web_server.version = 2
+    failed = []
+    documents = load_web_documents(urls, WebFetcher(), failed)
+    assert failed == [urls[1]]
+    report = update_index(store, documents, path, "model", keep_sources=failed)
+    assert report.removed_sources == [] and report.kept_sources == [urls[1]]
+    assert sorted(store.get()["documents"]) == ["Pagina /a v2", "Pagina /b v1"]
+    assert set(load_manifest(path)["sources"]) == set(urls)
+
+
+def test_per_host_limit(web_server):
+    web_server.delay = 0.05
+    fetcher = WebFetcher(max_workers=8, per_host=2)
+    results = fetcher.fetch_all([f"{web_server.url}/{index}" for index in range(6)])
+    assert all(result.status == "fetched" for result in results)
+    assert web_server.max_active <= 2
@@ -0,0 +1,74 @@
+import uuid
+from typing import List
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from sme_agent.chains import CustomThresholdRetriever
+from sme_agent.services.indexing import update_index
+from sme_agent.services.knowledge import load_local_documents
+from sme_agent.services.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    queries: List[str] = []
+
+    def embed_query(self, text: str) -> List[float]:
+        self.queries.append(text)
+        return super().embed_query(text)
+
+
+def make_retriever(tmp_path, mode, threshold=1e9):
+    embeddings = CountingEmbeddings(size=8, queries=[])
+    store = Chroma(collection_name=f"test-{uuid.uuid4().hex}", embedding_function=embeddings)
+    update_index(store, load_local_documents("sme_agent/knowledge"), str(tmp_path / "m.json"), "model")
+    retriever = CustomThresholdRetriever(
+        vectorstore=store,
+        threshold=threshold,
+        mode=mode,
+        lexical_index=BM25Index.from_vectorstore(store),
+    )
+    return retriever, embeddings
+
+
+def test_tokenize_folds_accents_plurals_and_stopwords():
+    assert tokenize("Que regimenes e Impuestos aplican en la Camara de Comercio?") == [
+        "regimen", "e", "impuesto", "aplican", "camara", "comercio",
+    ]
+
+
+def test_keyword_query_skips_the_embeddings_call(tmp_path):
+    retriever, embeddings = make_retriever(tmp_path, "hybrid")
+
+    docs, embedding = retriever.search("Como saco el RUT?")
+    assert embedding is None and embeddings.queries == []
+    assert "RUT" in docs[0].page_content
+
+    docs, embedding = retriever.search("Que me recomiendas para crecer mas rapido?")
+    assert embedding is not None and len(embeddings.queries) == 1
+    assert docs
+
+
+def test_off_topic_query_gets_no_lexical_context(tmp_path):
+    # Nothing passes the vector threshold; "negocio" alone must not bring in
+    # BM25 chunks.
+    retriever, _ = make_retriever(tmp_path, "hybrid", threshold=0.0)
+    docs, embedding = retriever.search("Cual es la receta del pan de chocolate para mi negocio?")
+    assert embedding is not None and docs == []
+
+    docs, _ = retriever.search("Que creditos existen para pequenas empresas?")
+    assert docs
+
+
+def test_lexical_mode_never_embeds(tmp_path):
+    retriever, embeddings = make_retriever(tmp_path, "lexical")
+    assert retriever.invoke("Que me recomiendas para crecer mas rapido?") is not None
+    assert embeddings.queries == []
+
+
+def test_rank_fusion_prefers_documents_ranked_by_both():
+    a, b, c = (Document(page_content=text, id=text) for text in "abc")
+    fused = reciprocal_rank_fusion([a, b], [c, b])
+    assert [doc.id for doc, _ in fused] == ["b", "a", "c"]
+    assert [score for _, score in fused] == [0.0, 1.0, 2.0]
@@ -0,0 +1,69 @@
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import SystemMessage
+
+from sme_agent.config import Settings
+from sme_agent.db import Database, ensure_user, load_conversation_summary, save_chat_message
+from sme_agent.services import tokens
+from sme_agent.services.memory import TokenBudgetMemory
+
+
+LONG_ANSWER = "El regimen simple agrupa renta, ICA y consumo en una sola declaracion. " * 5
+
+
+def _chat(db, user_id, turns):
+    for turn in range(turns):
+        save_chat_message(db, user_id, "user", f"Pregunta numero {turn}")
+        save_chat_message(db, user_id, "assistant", LONG_ANSWER)
+
+
+def test_token_count_falls_back_to_an_estimate(monkeypatch):
+    monkeypatch.setattr(tokens, "_encoding", lambda model: None)
+    assert tokens.count_tokens("") == 0
+    assert tokens.count_tokens("hola, mundo") == tokens.estimate_tokens("hola, mundo") == 4
+
+
+def test_history_fits_the_budget_with_a_rolling_summary(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'app.db'}")
+    db.init_db()
+    ensure_user(db, "u1")
+    llm = FakeListChatModel(responses=["resumen uno", "resumen dos"])
+    memory = TokenBudgetMemory(db=db, llm=llm, max_tokens=300, summary_tokens=40)
+
+    _chat(db, "u1", 1)
+    messages = memory.build("u1").load_memory_variables({})["chat_history"]
+    assert len(messages) == 2
+    assert llm.i == 0
+
+    _chat(db, "u1", 3)
+    messages = memory.build("u1").load_memory_variables({})["chat_history"]
+    assert messages[0] == SystemMessage(content="Resumen de la conversacion anterior: resumen uno")
+    assert sum(memory.message_tokens({"content": m.content}) for m in messages[1:]) <= 260
+    summary, through_id = load_conversation_summary(db, "u1")
+    assert summary == "resumen uno" and through_id > 0
+
+    # The summary is reused until the verbatim part overflows again.
+    assert memory.build("u1").load_memory_variables({})["chat_history"] == messages
+    assert llm.i == 1
+
+
+@pytest.fixture
+def settings(tmp_path):
+    return Settings(
+        openai_api_key="test-key",
+        database_url=f"sqlite:///{tmp_path / 'app.db'}",
+        enable_token_memory=True,
+        memory_max_tokens=60,
+        memory_summary_tokens=40,
+    )
+
+
+def test_chat_uses_the_token_budget_memory(app, client, fake_chains):
+    app.config["MEMORY"].llm = FakeListChatModel(responses=["el usuario pregunta por impuestos"])
+    for text in ("Que regimen tributario me conviene?", "Y el IVA?", "Y la retencion?"):
+        client.post("/", data={"user_input": text})
+
+    with client.session_transaction() as session:
+        user_id = session["user_id"]
+    summary, _ = load_conversation_summary(app.config["DB"], user_id)
+    assert summary == "el usuario pregunta por impuestos"
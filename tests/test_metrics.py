@@ -0,0 +1,68 @@
+import dataclasses
+import subprocess
+import sys
+from pathlib import Path
+
+from prometheus_client import REGISTRY, CollectorRegistry
+from prometheus_client import multiprocess
+
+from sme_agent import factory
+
+from conftest import StaticRetriever
+
+
+def _messages(branch):
+    return REGISTRY.get_sample_value("sme_chat_messages_total", {"branch": branch}) or 0
+
+
+def test_every_branch_is_counted(client, fake_chains):
+    branches = ("quick_reply", "calculator", "save_preference", "llm")
+    before = {branch: _messages(branch) for branch in branches}
+    client.get("/")
+    client.post("/", data={"user_input": "hola"})
+    client.post(
+        "/",
+        data={"user_input": "punto de equilibrio costos fijos 1000000 precio 12000 costo variable 5000"},
+    )
+    client.post("/", data={"user_input": "guardar: sector=alimentos"})
+    response = client.post("/api/chat/stream", data={"user_input": "Que regimen tributario me conviene?"})
+    assert "event: done" in response.get_data(as_text=True)
+
+    for branch in before:
+        assert _messages(branch) == before[branch] + 1
+    assert REGISTRY.get_sample_value(
+        "sme_chat_branch_latency_seconds_count", {"branch": "llm"}
+    ) >= 1
+
+
+def test_prometheus_endpoint_serves_text_format(settings, monkeypatch):
+    settings = dataclasses.replace(settings, enable_metrics=True)
+    monkeypatch.setenv("OPENAI_API_KEY", settings.openai_api_key)
+    monkeypatch.setattr(factory, "Settings", lambda: settings)
+    monkeypatch.setattr(factory, "build_retriever", lambda settings: StaticRetriever())
+    client = factory.create_app().test_client()
+    client.post("/", data={"user_input": "gracias"})
+
+    response = client.get("/metrics/prometheus")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    assert 'sme_chat_messages_total{branch="quick_reply"}' in response.get_data(as_text=True)
+
+
+def test_workers_are_merged_from_the_shared_directory(tmp_path):
+    script = (
+        "import time; from sme_agent.services.metrics import observe_branch; "
+        "observe_branch('calculator', time.monotonic())"
+    )
+    root = Path(__file__).resolve().parent.parent
+    for _ in range(2):
+        subprocess.run(
+            [sys.executable, "-c", script],
+            env={"PROMETHEUS_MULTIPROC_DIR": str(tmp_path)},
+            cwd=root,
+            check=True,
+        )
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=str(tmp_path))
+    assert registry.get_sample_value("sme_chat_messages_total", {"branch": "calculator"}) == 2
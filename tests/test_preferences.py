@@ -1,4 +1,12 @@
-from sme_agent.services.preferences import is_show_preferences, parse_save_command
+from sqlalchemy import event
+
+from sme_agent.db import Database, ensure_user
+from sme_agent.services.preferences import (
+    PreferenceStore,
+    build_preference_context,
+    is_show_preferences,
+    parse_save_command,
+)
 
 
 def test_parse_save_command():
@@ -12,3 +20,50 @@ def test_parse_save_command_with_recordar():
 def test_show_preferences():
     assert is_show_preferences("mis datos") is True
     assert is_show_preferences("ver preferencias") is True
+
+
+def _store_with_reads():
+    db = Database("sqlite://")
+    db.init_db()
+    ensure_user(db, "u1")
+    reads = []
+
+    def count(conn, cursor, statement, *args):
+        if statement.startswith("SELECT") and "user_preferences" in statement:
+            reads.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    return PreferenceStore(db), reads
+
+
+def test_preference_store_caches_until_saved():
+    store, reads = _store_with_reads()
+    store.save("u1", "sector", "retail")
+    assert store.items("u1", version=1) == [("sector", "retail")]
+    assert store.items("u1", version=1) == [("sector", "retail")]
+    assert store.sidebar("u1", version=1, limit=5) == [("sector", "retail")]
+    assert len(reads) == 2  # the save's lookup and one cached load
+
+    store.save("u1", "ciudad", "Bogota")
+    assert store.items("u1", version=2) == [("ciudad", "Bogota"), ("sector", "retail")]
+    assert build_preference_context(store.items("u1", version=2)) == (
+        "Datos del usuario: ciudad=Bogota, sector=retail"
+    )
+
+
+def test_preference_store_reloads_newer_versions():
+    # A save handled by another worker bumps the version in the cookie.
+    store, reads = _store_with_reads()
+    assert store.items("u1", version=0) == []
+    PreferenceStore(store.db).save("u1", "sector", "retail")
+    assert store.items("u1", version=0) == []
+    assert store.items("u1", version=1) == [("sector", "retail")]
+
+
+def test_preference_sidebar_is_limited_without_cache():
+    store, reads = _store_with_reads()
+    for index in range(8):
+        store.save("u1", f"clave{index}", "valor")
+    reads.clear()
+    assert len(store.sidebar("u1", version=8, limit=5)) == 5
+    assert "LIMIT" in reads[0]
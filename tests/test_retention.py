@@ -0,0 +1,76 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from sme_agent.db import (
+    ChatMessage,
+    Database,
+    LLMCall,
+    ensure_user,
+    get_llm_stats,
+    rebuild_llm_rollups,
+    save_llm_call,
+)
+from sme_agent.services.retention import archive_table, reclaim_space
+
+
+def _db_with_history(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'app.db'}")
+    db.init_db()
+    ensure_user(db, "u1")
+    with db.session() as session:
+        old = (datetime(2026, 1, 1, 9), datetime(2026, 1, 1, 18), datetime(2026, 1, 2))
+        for created_at in (*old, datetime(2026, 2, 9)):
+            session.add(
+                ChatMessage(
+                    user_id="u1",
+                    role="user",
+                    content=f"mensaje del {created_at:%d/%m}",
+                    created_at=created_at,
+                )
+            )
+        session.add(ChatMessage(user_id="u1", role="user", content="reciente"))
+    return db
+
+
+def test_archive_streams_old_rows_into_daily_files(tmp_path):
+    db = _db_with_history(tmp_path)
+    archive_dir = tmp_path / "archive"
+    cutoff = datetime(2026, 2, 1)
+
+    dry = archive_table(db, ChatMessage, cutoff, archive_dir, batch_size=2, dry_run=True)
+    assert dry.rows == 3
+    assert not archive_dir.exists()
+
+    report = archive_table(db, ChatMessage, cutoff, archive_dir, batch_size=2)
+    assert report.rows == 3
+    assert report.batches == 2
+    assert report.partitions == {"2026-01-01": 2, "2026-01-02": 1}
+
+    with gzip.open(archive_dir / "chat_messages" / "2026-01-01.jsonl.gz", "rt") as handle:
+        records = [json.loads(line) for line in handle]
+    assert [record["content"] for record in records] == ["mensaje del 01/01"] * 2
+    assert records[0]["created_at"].startswith("2026-01-01")
+
+    with db.session() as session:
+        remaining = [row.content for row in session.query(ChatMessage).order_by(ChatMessage.id)]
+    assert remaining == ["mensaje del 09/02", "reciente"]
+    reclaim_space(db, ["chat_messages"])
+
+
+def test_archived_llm_calls_stay_in_metrics(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'app.db'}")
+    db.init_db()
+    ensure_user(db, "u1")
+    save_llm_call(db, "u1", "gpt", 300, 10, 5, 15, "ok", None)
+
+    report = archive_table(db, LLMCall, datetime.now() + timedelta(days=1), tmp_path / "archive")
+    assert report.rows == 1
+    assert get_llm_stats(db)["total_calls"] == 1
+
+    # Rebuilding from the pruned table would drop the archived call.
+    with pytest.raises(RuntimeError):
+        rebuild_llm_rollups(db)
+    assert get_llm_stats(db)["total_calls"] == 1
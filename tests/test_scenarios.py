@@ -0,0 +1,43 @@
+import math
+
+import pytest
+
+from sme_agent.services.calculators import build_break_even, format_currency
+from sme_agent.services.scenarios import run_scenarios, sensitivity_rows
+
+
+BASE = {"costos_fijos": 1000000.0, "precio_unit": 12000.0, "costo_variable_unit": 5000.0}
+
+
+def test_break_even_grid_matches_scalar_formula():
+    grid = run_scenarios("break_even", BASE, steps=5)
+    assert grid.results["ventas_equilibrio"].shape == (5, 5, 5)
+    center = grid.results["ventas_equilibrio"][2, 2, 2]
+    assert math.isclose(center, 1000000 / (12000 - 5000) * 12000)
+    assert math.isclose(grid.axes["precio_unit"][0], 12000 * 0.7)
+
+
+def test_break_even_grid_marks_infeasible_scenarios():
+    grid = run_scenarios(
+        "break_even",
+        {"costos_fijos": 100.0, "precio_unit": 10.0, "costo_variable_unit": 9.0},
+        steps=11,
+    )
+    summary = grid.summary()["unidades_equilibrio"]
+    assert 0 < summary["feasible_share"] < 1
+    assert None in grid.to_dict()["results"]["unidades_equilibrio"][0][-1]
+
+
+def test_run_scenarios_validates_input():
+    with pytest.raises(ValueError):
+        run_scenarios("unknown", BASE)
+    with pytest.raises(ValueError):
+        run_scenarios("liquidity", {"activo_corriente": 1.0})
+
+
+def test_sensitivity_in_calculator_response():
+    rows = sensitivity_rows("break_even", BASE, format_currency)
+    assert len(rows) == 6
+    text = "punto de equilibrio con escenarios: costos fijos 1000000, precio 12000, costo variable 5000"
+    assert rows[0] in build_break_even(text).response
+    assert "Sensibilidad" not in build_break_even(text.replace("con escenarios", "")).response
@@ -0,0 +1,96 @@
+import json
+
+from prometheus_client import REGISTRY
+
+from sme_agent.db import ChatMessage, LLMCall
+
+
+def parse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_sends_tokens_then_rendered_answer(app, client, fake_chains):
+    response = client.post("/api/chat/stream", data={"user_input": "Que regimen tributario me conviene?"})
+    assert response.mimetype == "text/event-stream"
+
+    events = parse_events(response.get_data(as_text=True))
+    tokens = [data["text"] for kind, data in events if kind == "token"]
+    assert "".join(tokens) == "Te conviene el **regimen simple**."
+    assert events[-1] == ("done", {"html": "<p>Te conviene el <strong>regimen simple</strong>.</p>"})
+
+    with app.config["DB"].session() as session:
+        call = session.query(LLMCall).one()
+        assert call.status == "ok" and call.ttft_ms is not None
+        roles = [row.role for row in session.query(ChatMessage).order_by(ChatMessage.id)]
+    assert roles == ["user", "assistant"]
+
+
+def test_stream_commits_before_the_done_event(app, client, fake_chains):
+    response = client.post(
+        "/api/chat/stream", data={"user_input": "Que regimen tributario me conviene?"}, buffered=False
+    )
+    chunks = iter(response.response)
+    while not next(chunks).startswith(b"event: done"):
+        pass
+    with app.config["DB"].SessionLocal() as session:
+        roles = [row.role for row in session.query(ChatMessage).order_by(ChatMessage.id)]
+        assert session.query(LLMCall).count() == 1
+    assert roles == ["user", "assistant"]
+    response.close()
+
+
+def test_stream_answers_quick_replies_in_one_event(client, fake_chains):
+    response = client.post("/api/chat/stream", json={"user_input": "hola"})
+    events = parse_events(response.get_data(as_text=True))
+    assert [kind for kind, _ in events] == ["done"]
+
+
+def test_stream_rejects_empty_message(client):
+    assert client.post("/api/chat/stream", data={"user_input": "  "}).status_code == 400
+
+
+def test_stream_disconnect_cancels_and_commits_the_llm_call(app, client, fake_chains):
+    fake_chains.streaming_llm.responses = ["Respuesta larga " * 50]
+    fake_chains.streaming_llm.sleep = 0.01
+    llm_messages = REGISTRY.get_sample_value("sme_chat_messages_total", {"branch": "llm"})
+    response = client.post(
+        "/api/chat/stream", data={"user_input": "Que regimen tributario me conviene?"}, buffered=False
+    )
+    assert next(iter(response.response)).startswith(b"event: token")
+    response.close()
+
+    with app.config["DB"].session() as session:
+        call = session.query(LLMCall).one()
+        assert call.status == "cancelled"
+        roles = [row.role for row in session.query(ChatMessage).order_by(ChatMessage.id)]
+    assert roles == ["user"]
+    assert REGISTRY.get_sample_value("sme_chat_messages_total", {"branch": "llm"}) == llm_messages + 1
+
+
+def test_stream_save_command_returns_the_sidebar(client, fake_chains):
+    client.get("/")
+    response = client.post("/api/chat/stream", data={"user_input": "guardar: sector=alimentos"})
+    (kind, data), = parse_events(response.get_data(as_text=True))
+    assert kind == "done"
+    assert data["preferences"] == [["sector", "alimentos"]]
+
+    response = client.post("/api/chat/stream", json={"user_input": "hola"})
+    assert "preferences" not in parse_events(response.get_data(as_text=True))[0][1]
+
+
+def test_stream_commits_are_counted_when_the_stream_ends(app, client, fake_chains):
+    db = app.config["DB"]
+    client.get("/")
+    before = db.commit_stats()
+
+    response = client.post("/api/chat/stream", data={"user_input": "Que regimen tributario me conviene?"})
+    response.get_data()
+
+    after = db.commit_stats()
+    assert after["requests"] == before["requests"] + 1
+    # The user's message, then the LLM call and the answer.
+    assert after["commits"] == before["commits"] + 2
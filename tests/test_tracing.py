@@ -0,0 +1,62 @@
+import dataclasses
+
+from sme_agent import factory
+from sme_agent.db import LLMCall, RequestSpan, get_stage_breakdown
+
+from conftest import StaticRetriever
+
+
+def _traced_app(settings, monkeypatch):
+    settings = dataclasses.replace(settings, enable_tracing=True)
+    monkeypatch.setenv("OPENAI_API_KEY", settings.openai_api_key)
+    monkeypatch.setattr(factory, "Settings", lambda: settings)
+    monkeypatch.setattr(factory, "build_retriever", lambda settings: StaticRetriever())
+    return factory.create_app()
+
+
+def _stages(db, request_id):
+    with db.session() as session:
+        rows = session.query(RequestSpan).filter(RequestSpan.request_id == request_id).all()
+    return {row.stage for row in rows}, {row.branch for row in rows}
+
+
+def test_llm_turn_records_each_stage(settings, monkeypatch, fake_chains):
+    app = _traced_app(settings, monkeypatch)
+    app.config["CHAINS"] = fake_chains
+    db = app.config["DB"]
+    client = app.test_client()
+    client.get("/")
+    client.post("/", data={"user_input": "Que regimen tributario me conviene?"})
+    client.post("/", data={"user_input": "Y si vendo mas?"})
+
+    with db.session() as session:
+        request_id = session.query(LLMCall.request_id).order_by(LLMCall.id.desc()).first()[0]
+    stages, branches = _stages(db, request_id)
+    assert {
+        "routing",
+        "history_load",
+        "condense_llm",
+        "answer_llm",
+        "render",
+        "db_commit",
+        "total",
+    } <= stages
+    assert branches == {"llm"}
+
+    breakdown = get_stage_breakdown(db, window="1h", branch="llm")
+    assert breakdown["requests"] == 2
+    assert breakdown["stages"]["answer_llm"]["count"] == 2
+    assert breakdown["stages"]["condense_llm"]["count"] == 1
+
+
+def test_streamed_turn_keeps_spans_until_the_stream_ends(settings, monkeypatch, fake_chains):
+    app = _traced_app(settings, monkeypatch)
+    app.config["CHAINS"] = fake_chains
+    client = app.test_client()
+    response = client.post("/api/chat/stream", data={"user_input": "Que regimen me conviene?"})
+    assert "event: done" in response.get_data(as_text=True)
+
+    with app.config["DB"].session() as session:
+        request_id = session.query(LLMCall.request_id).one()[0]
+    stages, _ = _stages(app.config["DB"], request_id)
+    assert {"answer_llm", "render", "total"} <= stages
@@ -0,0 +1,31 @@
+from sme_agent.services.classification import classify_text
+from sme_agent.services.intents import Intent, detect_intent, should_use_calculator
+from sme_agent.services.preferences import is_show_preferences, parse_save_command
+from sme_agent.services.utterance import Utterance, as_utterance
+
+
+def test_utterance_preprocessing():
+    utterance = Utterance.from_text("  Guardar: Ciudad=Bogotá  ")
+    assert utterance.lowered == "  guardar: ciudad=bogotá  "
+    assert utterance.normalized == "  guardar: ciudad=bogota  "
+    assert utterance.stripped == "guardar: ciudad=bogota"
+    assert utterance.token_spans[0] == (2, 9)
+    assert as_utterance(utterance) is utterance
+
+
+def test_utterance_detected_numbers():
+    utterance = Utterance.from_text("ingresos 2.000.000 y gastos 1500000,5")
+    assert [number.value for number in utterance.numbers] == [2000000.0, 1500000.5]
+    assert utterance.has_digits is True
+    assert Utterance.from_text("flujo de caja").has_digits is False
+
+
+def test_services_accept_utterance():
+    assert classify_text(Utterance.from_text("Hola")) == "saludo"
+    assert is_show_preferences(Utterance.from_text("Mis datos")) is True
+    assert parse_save_command(Utterance.from_text("guardar: sector=retail")) == ("sector", "retail")
+
+    utterance = Utterance.from_text("flujo de caja con ingresos 2000000 y gastos 1500000")
+    intent = detect_intent(utterance)
+    assert intent == Intent.CASHFLOW
+    assert should_use_calculator(utterance, intent) is True